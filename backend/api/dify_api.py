@@ -9,8 +9,7 @@ import logging
 import time
 from datetime import datetime
 
-from backend.database import get_db
-from backend.services.api_key_service import ApiKeyService
+from backend.services.api_key_service import api_key_service
 from backend.services.website_detector import WebsiteDetector
 
 logger = logging.getLogger(__name__)
@@ -18,9 +17,6 @@ logger = logging.getLogger(__name__)
 # 创建蓝图
 bp = Blueprint('dify_api', __name__, url_prefix='/api/dify')
 
-# 初始化服务
-api_key_service = ApiKeyService()
-
 def require_api_key(f):
     """API密钥验证装饰器"""
     @wraps(f)
@@ -42,19 +38,18 @@ def require_api_key(f):
                     'message': '请在请求头Authorization中提供API密钥，格式: Bearer your_api_key'
                 }), 401
             
-            # 验证API密钥
-            with get_db() as db:
-                auth_result = api_key_service.authenticate_request(db, api_key)
-                
-                if not auth_result:
-                    return jsonify({
-                        'success': False,
-                        'error': 'API密钥无效',
-                        'message': '提供的API密钥无效或已过期'
-                    }), 401
-                
-                # 将验证信息传递给视图函数
-                request.api_auth = auth_result
+            # 验证API密钥（内存索引查找，不访问数据库）
+            auth_result = api_key_service.authenticate_request(None, api_key)
+            
+            if not auth_result:
+                return jsonify({
+                    'success': False,
+                    'error': 'API密钥无效',
+                    'message': '提供的API密钥无效或已过期'
+                }), 401
+            
+            # 将验证信息传递给视图函数
+            request.api_auth = auth_result
                 
         except Exception as e:
             logger.error(f"API密钥验证失败: {e}")
@@ -4,59 +4,109 @@
 """
 
 import logging
+from typing import Dict, Iterable, List, Optional
 from flask import Blueprint, request, jsonify
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import joinedload
 
 from ..database import get_db
 from ..models import WebsiteGroup, Website
+from ..utils.cache import TAG_WEBSITES, make_key, shared_cache
+from ..utils.http_cache import conditional_get
 from ..utils.helpers import get_beijing_time
 
 logger = logging.getLogger(__name__)
 
 bp = Blueprint('groups', __name__, url_prefix='/api/groups')
 
+# 批量分配时每条 UPDATE ... WHERE id IN (...) 的ID数量
+ASSIGN_CHUNK_SIZE = 500
+
+# 分组列表共享缓存时间（秒）
+GROUPS_CACHE_TTL = 300
+
+
+def _website_counts(db, group_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, int]]:
+    """一次分组查询统计各分组的网站总数和激活数 {分组ID: {'total', 'active'}}"""
+    query = db.query(
+        Website.group_id,
+        func.count(Website.id),
+        func.sum(case((Website.is_active == True, 1), else_=0))
+    ).filter(Website.group_id.isnot(None)).group_by(Website.group_id)
+    if group_ids is not None:
+        query = query.filter(Website.group_id.in_(list(group_ids)))
+    return {
+        group_id: {'total': int(total or 0), 'active': int(active or 0)}
+        for group_id, total, active in query
+    }
+
+
+def _assign_websites(db, group_id: int, website_ids: List[int]) -> int:
+    """按块执行集合式 UPDATE 把网站分配到分组，返回匹配的网站数"""
+    updated_count = 0
+    now = get_beijing_time()
+    for start in range(0, len(website_ids), ASSIGN_CHUNK_SIZE):
+        chunk = website_ids[start:start + ASSIGN_CHUNK_SIZE]
+        result = db.execute(
+            update(Website)
+            .where(Website.id.in_(chunk))
+            .values(group_id=group_id, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        updated_count += max(result.rowcount or 0, 0)
+    return updated_count
+
+
+def _list_groups(include_stats: bool) -> Dict:
+    """查询分组列表及各分组网站数量"""
+    with get_db() as db:
+        groups = db.query(WebsiteGroup).order_by(
+            WebsiteGroup.is_default.desc(),
+            WebsiteGroup.created_at.asc()
+        ).all()
+        
+        # 各分组网站数量一次统计
+        counts = _website_counts(db)
+        
+        groups_data = []
+        for group in groups:
+            group_counts = counts.get(group.id, {'total': 0, 'active': 0})
+            group_dict = group.to_dict(website_count=group_counts['total'])
+            
+            if include_stats:
+                group_dict['active_count'] = group_counts['active']
+            
+            groups_data.append(group_dict)
+        
+        return {
+            'groups': groups_data,
+            'total': len(groups_data)
+        }
+
 
 @bp.route('/', methods=['GET'])
+@conditional_get([TAG_WEBSITES])
 def get_groups():
     """
     获取分组列表
+    结果写入共享缓存，分组或网站变更时失效
     """
     try:
-        with get_db() as db:
-            # 获取查询参数
-            include_stats = request.args.get('include_stats', 'false').lower() == 'true'
-            
-            groups = db.query(WebsiteGroup).order_by(
-                WebsiteGroup.is_default.desc(),
-                WebsiteGroup.created_at.asc()
-            ).all()
-            
-            groups_data = []
-            for group in groups:
-                group_dict = group.to_dict()
-                
-                if include_stats:
-                    # 获取分组统计信息
-                    website_count = db.query(Website).filter(Website.group_id == group.id).count()
-                    active_count = db.query(Website).filter(
-                        Website.group_id == group.id,
-                        Website.is_active == True
-                    ).count()
-                    
-                    group_dict.update({
-                        'website_count': website_count,
-                        'active_count': active_count
-                    })
-                
-                groups_data.append(group_dict)
-            
-            return jsonify({
-                'code': 200,
-                'message': 'success',
-                'data': {
-                    'groups': groups_data,
-                    'total': len(groups_data)
-                }
-            })
+        # 获取查询参数
+        include_stats = request.args.get('include_stats', 'false').lower() == 'true'
+        
+        data = shared_cache.get_or_set(
+            make_key('groups_list', include_stats),
+            lambda: _list_groups(include_stats),
+            ttl=GROUPS_CACHE_TTL,
+            tags=(TAG_WEBSITES,)
+        )
+        
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': data
+        })
         
     except Exception as e:
         logger.error(f"获取分组列表失败: {e}")
@@ -122,6 +172,7 @@ def create_group():
 
 
 @bp.route('/<int:group_id>', methods=['GET'])
+@conditional_get([TAG_WEBSITES])
 def get_group(group_id: int):
     """
     获取分组详情
@@ -138,10 +189,12 @@ def get_group(group_id: int):
                 }), 404
             
             # 获取分组下的网站列表
-            websites = db.query(Website).filter(Website.group_id == group_id).all()
+            websites = db.query(Website).options(
+                joinedload(Website.group)
+            ).filter(Website.group_id == group_id).all()
             websites_data = [website.to_dict() for website in websites]
             
-            group_data = group.to_dict()
+            group_data = group.to_dict(website_count=len(websites))
             group_data['websites'] = websites_data
             
             return jsonify({
@@ -268,12 +321,14 @@ def delete_group(group_id: int):
                     'data': None
                 }), 500
             
-            # 将该分组下的网站移动到默认分组
-            websites = db.query(Website).filter(Website.group_id == group_id).all()
-            moved_count = 0
-            for website in websites:
-                website.group_id = default_group.id
-                moved_count += 1
+            # 将该分组下的网站一次性移动到默认分组
+            result = db.execute(
+                update(Website)
+                .where(Website.group_id == group_id)
+                .values(group_id=default_group.id, updated_at=get_beijing_time())
+                .execution_options(synchronize_session=False)
+            )
+            moved_count = max(result.rowcount or 0, 0)
             
             # 删除分组
             db.delete(group)
@@ -315,7 +370,12 @@ def assign_websites_to_group(group_id: int):
             }), 400
         
         website_ids = data['website_ids']
-        if not isinstance(website_ids, list):
+        try:
+            if not isinstance(website_ids, list):
+                raise TypeError
+            # 去重并保持顺序
+            website_ids = list(dict.fromkeys(int(website_id) for website_id in website_ids))
+        except (TypeError, ValueError):
             return jsonify({
                 'code': 400,
                 'message': '网站ID格式错误',
@@ -332,14 +392,8 @@ def assign_websites_to_group(group_id: int):
                     'data': None
                 }), 404
             
-            # 更新网站分组
-            websites = db.query(Website).filter(Website.id.in_(website_ids)).all()
-            updated_count = 0
-            
-            for website in websites:
-                website.group_id = group_id
-                website.updated_at = get_beijing_time()
-                updated_count += 1
+            # 按块集合式更新网站分组
+            updated_count = _assign_websites(db, group_id, website_ids)
             
             db.commit()
             
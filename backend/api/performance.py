@@ -10,14 +10,21 @@ from datetime import datetime, timedelta
 from typing import Dict, Any
 
 from ..services.memory_monitor import get_memory_manager
-from ..database import get_db_session
-from ..models import DetectionRecord
+from ..database import get_db
+from ..services.analytics_engine import DetectionFrame, analytics_engine
+from ..utils.cache import detection_tags, make_key, shared_cache
 from ..utils.helpers import get_beijing_time
 
 logger = logging.getLogger(__name__)
 
 performance_bp = Blueprint('performance', __name__, url_prefix='/api/performance')
 
+# 响应时间性能分布的分桶边界（秒）
+PERFORMANCE_BUCKETS = (2, 5, 10)
+
+# 检测统计共享缓存时间（秒），检测结果写入时失效，过期只用于滚动时间窗口
+DETECTION_STATS_CACHE_TTL = 300
+
 
 @performance_bp.route('/memory', methods=['GET'])
 def get_memory_status():
@@ -86,10 +93,77 @@ def optimize_memory():
         }), 500
 
 
+def _compute_detection_stats(hours: int, detailed: bool) -> Dict[str, Any]:
+    """
+    计算检测统计信息
+    
+    Args:
+        hours: 统计时间范围(小时)
+        detailed: 是否包含详细统计
+    """
+    # 计算时间范围
+    cutoff_time = get_beijing_time() - timedelta(hours=hours)
+    
+    with get_db() as session:
+        # 一次投影查询加载统计范围内的检测记录列（变化存储模式下按检测次数加权）
+        frame = analytics_engine.load_frame(session, cutoff_time, with_failure_reason=detailed)
+        total_checks = frame.total_checks
+        
+        if total_checks == 0:
+            return {
+                'period_hours': hours,
+                'total_checks': 0,
+                'summary': {},
+                'detailed': {}
+            }
+        
+        # 按状态统计
+        status_stats = {}
+        for status, count in analytics_engine.status_counts(frame).items():
+            status_stats[status] = {
+                'count': count,
+                'percentage': round(count / total_checks * 100, 1)
+            }
+        
+        # 响应时间统计
+        response_summary = analytics_engine.response_time_summary(frame, include_zero=False)
+        
+        response_time_stats = {}
+        if response_summary['count']:
+            response_time_stats = {
+                'avg': round(response_summary['avg'], 3),
+                'min': round(response_summary['min'], 3),
+                'max': round(response_summary['max'], 3),
+                'p50': round(response_summary['p50'], 3),
+                'p90': round(response_summary['p90'], 3),
+                'p99': round(response_summary['p99'], 3),
+                'count': response_summary['count']
+            }
+        
+        # 构建基础响应
+        stats_data = {
+            'period_hours': hours,
+            'total_checks': total_checks,
+            'summary': {
+                'status_distribution': status_stats,
+                'response_time': response_time_stats,
+                'success_rate': round((status_stats['standard']['count'] + 
+                                     status_stats['redirect']['count']) / total_checks * 100, 1)
+            }
+        }
+        
+        # 详细统计
+        if detailed:
+            stats_data['detailed'] = _get_detailed_detection_stats(session, cutoff_time, frame)
+        
+        return stats_data
+
+
 @performance_bp.route('/detection/stats', methods=['GET'])
 def get_detection_stats():
     """
     获取检测统计信息
+    结果按参数写入共享缓存，任意检测结果写入时失效
     
     Query Parameters:
         hours: 统计时间范围(小时，默认24)
@@ -102,75 +176,18 @@ def get_detection_stats():
         hours = int(request.args.get('hours', 24))
         detailed = request.args.get('detailed', 'false').lower() == 'true'
         
-        # 计算时间范围
-        cutoff_time = get_beijing_time() - timedelta(hours=hours)
-        
-        with get_db_session() as session:
-            # 基础统计查询
-            query = session.query(DetectionRecord).filter(
-                DetectionRecord.detected_at >= cutoff_time
-            )
-            
-            total_checks = query.count()
-            
-            if total_checks == 0:
-                return jsonify({
-                    'code': 200,
-                    'message': '获取检测统计成功',
-                    'data': {
-                        'period_hours': hours,
-                        'total_checks': 0,
-                        'summary': {},
-                        'detailed': {}
-                    }
-                })
-            
-            # 按状态统计
-            status_stats = {}
-            for status in ['standard', 'redirect', 'failed']:
-                count = query.filter(DetectionRecord.status == status).count()
-                status_stats[status] = {
-                    'count': count,
-                    'percentage': round(count / total_checks * 100, 1)
-                }
-            
-            # 响应时间统计
-            response_times = [
-                r.response_time for r in query.all() 
-                if r.response_time is not None and r.response_time > 0
-            ]
-            
-            response_time_stats = {}
-            if response_times:
-                response_time_stats = {
-                    'avg': round(sum(response_times) / len(response_times), 3),
-                    'min': round(min(response_times), 3),
-                    'max': round(max(response_times), 3),
-                    'count': len(response_times)
-                }
-            
-            # 构建基础响应
-            stats_data = {
-                'period_hours': hours,
-                'total_checks': total_checks,
-                'summary': {
-                    'status_distribution': status_stats,
-                    'response_time': response_time_stats,
-                    'success_rate': round((status_stats['standard']['count'] + 
-                                         status_stats['redirect']['count']) / total_checks * 100, 1)
-                }
-            }
-            
-            # 详细统计
-            if detailed:
-                detailed_stats = _get_detailed_detection_stats(session, cutoff_time)
-                stats_data['detailed'] = detailed_stats
-            
-            return jsonify({
-                'code': 200,
-                'message': '获取检测统计成功',
-                'data': stats_data
-            })
+        stats_data = shared_cache.get_or_set(
+            make_key('performance_detection_stats', hours, detailed),
+            lambda: _compute_detection_stats(hours, detailed),
+            ttl=DETECTION_STATS_CACHE_TTL,
+            tags=detection_tags()
+        )
+        
+        return jsonify({
+            'code': 200,
+            'message': '获取检测统计成功',
+            'data': stats_data
+        })
         
     except Exception as e:
         logger.error(f"获取检测统计失败: {e}")
@@ -180,79 +197,39 @@ def get_detection_stats():
         }), 500
 
 
-def _get_detailed_detection_stats(session, cutoff_time) -> Dict[str, Any]:
+def _get_detailed_detection_stats(session, cutoff_time, frame: DetectionFrame) -> Dict[str, Any]:
     """
     获取详细检测统计信息
     
     Args:
         session: 数据库会话
         cutoff_time: 统计起始时间
+        frame: 统计范围内的检测记录列（含失败原因）
         
     Returns:
         详细统计信息
     """
     try:
-        # 按小时分布统计
-        hourly_stats = []
+        # 按小时分布统计（最近24小时，统计范围不足24小时时单独加载）
         current_time = get_beijing_time()
-        
-        for i in range(24):  # 最近24小时
-            hour_start = current_time - timedelta(hours=i+1)
-            hour_end = current_time - timedelta(hours=i)
-            
-            hour_query = session.query(DetectionRecord).filter(
-                DetectionRecord.detected_at >= hour_start,
-                DetectionRecord.detected_at < hour_end
-            )
-            
-            hour_count = hour_query.count()
-            hour_stats = {
-                'hour': hour_start.strftime('%H:00'),
-                'total': hour_count,
-                'standard': hour_query.filter(DetectionRecord.status == 'standard').count(),
-                'redirect': hour_query.filter(DetectionRecord.status == 'redirect').count(),
-                'failed': hour_query.filter(DetectionRecord.status == 'failed').count()
-            }
-            
-            hourly_stats.append(hour_stats)
+        day_start = current_time - timedelta(hours=24)
+        hourly_frame = frame
+        if cutoff_time > day_start:
+            hourly_frame = analytics_engine.load_frame(session, day_start)
+        hourly_stats = analytics_engine.hourly_series(hourly_frame, current_time, 24)
         
         # 失败原因统计
-        failure_reasons = {}
-        failed_results = session.query(DetectionRecord).filter(
-            DetectionRecord.detected_at >= cutoff_time,
-            DetectionRecord.status == 'failed',
-            DetectionRecord.failure_reason.isnot(None)
-        ).all()
-        
-        for result in failed_results:
-            reason = result.failure_reason or 'unknown'
-            failure_reasons[reason] = failure_reasons.get(reason, 0) + 1
-        
-        # 性能分布统计
+        failure_reasons = analytics_engine.failure_reason_counts(frame)
+        
+        # 性能分布统计（< 2s、2-5s、5-10s、>= 10s）
+        fast, normal, slow, very_slow = analytics_engine.histogram(frame, PERFORMANCE_BUCKETS)
         performance_distribution = {
-            'fast': 0,      # < 2s
-            'normal': 0,    # 2-5s
-            'slow': 0,      # 5-10s
-            'very_slow': 0  # > 10s
+            'fast': fast,
+            'normal': normal,
+            'slow': slow,
+            'very_slow': very_slow
         }
         
-        all_results = session.query(DetectionRecord).filter(
-            DetectionRecord.detected_at >= cutoff_time,
-            DetectionRecord.response_time.isnot(None),
-            DetectionRecord.response_time > 0
-        ).all()
-        
-        for result in all_results:
-            response_time = result.response_time
-            if response_time < 2:
-                performance_distribution['fast'] += 1
-            elif response_time < 5:
-                performance_distribution['normal'] += 1
-            elif response_time < 10:
-                performance_distribution['slow'] += 1
-            else:
-                performance_distribution['very_slow'] += 1
-        
         return {
             'hourly_distribution': hourly_stats,
             'failure_reasons': failure_reasons,
@@ -264,6 +241,31 @@ def _get_detailed_detection_stats(session, cutoff_time) -> Dict[str, Any]:
         return {}
 
 
+@performance_bp.route('/writer', methods=['GET'])
+def get_writer_stats():
+    """
+    获取检测结果写入缓冲指标
+    
+    Returns:
+        队列深度、刷写延迟等指标
+    """
+    try:
+        from ..services.result_writer import result_writer
+        
+        return jsonify({
+            'code': 200,
+            'message': '获取写入缓冲指标成功',
+            'data': result_writer.get_stats()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取写入缓冲指标失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取写入缓冲指标失败: {str(e)}'
+        }), 500
+
+
 @performance_bp.route('/system', methods=['GET'])
 def get_system_info():
     """
@@ -408,7 +410,7 @@ def health_check():
         # 检查数据库连接
         db_healthy = True
         try:
-            with get_db_session() as session:
+            with get_db() as session:
                 session.execute("SELECT 1").fetchone()
         except Exception as e:
             logger.error(f"数据库健康检查失败: {e}")
@@ -8,11 +8,22 @@ from typing import Dict, List
 from datetime import datetime, timedelta
 import os
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager, joinedload
 from sqlalchemy import func
 from ..database import get_db
-from ..models import Website, DetectionRecord, DetectionTask
+from ..models import Website, WebsiteGroup, DetectionTask, DetectionHourlySummary
+from ..services.analytics_engine import analytics_engine
+from ..services.archive_service import archive_service
+from ..services.compaction_service import compaction_service
+from ..services.detection_storage import detection_storage
+from ..services.export_job_service import export_job_service
 from ..services.export_service import ExportService
+from ..services.latency_sketch_service import latency_sketch_service
+from ..services.website_search_service import website_search_service
+from ..utils.cache import TAG_TASKS, TAG_WEBSITES, detection_tags, make_key, shared_cache
+from ..utils.helpers import to_beijing_naive
+from ..utils.http_cache import conditional_get
+from ..utils.json_provider import stream_json_response
 
 import logging
 
@@ -20,8 +31,97 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint('results', __name__, url_prefix='/api/results')
 
+# 统计信息共享缓存时间（秒），检测结果写入时按网站失效，过期只用于滚动时间窗口
+STATISTICS_CACHE_TTL = 300
+
+
+# 流式输出时每批从数据库游标读取的记录数
+STREAM_BATCH_SIZE = 1000
+
+
+class _FilterError(ValueError):
+    """查询参数格式错误"""
+
+
+def _parse_result_filters() -> Dict:
+    """解析检测结果列表的筛选参数"""
+    filters = {
+        'task_id': request.args.get('task_id', type=int),
+        'website_id': request.args.get('website_id', type=int),
+        'status': request.args.get('status', type=str),
+        'search': request.args.get('search', '', type=str),
+        'start_dt': None,
+        'end_dt': None,
+    }
+    
+    start_date = request.args.get('start_date', type=str)
+    end_date = request.args.get('end_date', type=str)
+    if start_date:
+        try:
+            filters['start_dt'] = datetime.fromisoformat(start_date)
+        except ValueError:
+            raise _FilterError('开始日期格式错误')
+    if end_date:
+        try:
+            filters['end_dt'] = datetime.fromisoformat(end_date)
+        except ValueError:
+            raise _FilterError('结束日期格式错误')
+    
+    return filters
+
+
+def _build_results_query(db: Session, filters: Dict):
+    """构建检测结果查询（分区存储时只读取覆盖时间范围的分区）"""
+    R = detection_storage.record_source(filters['start_dt'], filters['end_dt'])
+    query = db.query(R).join(R.website)
+    
+    if filters['task_id']:
+        query = query.filter(R.task_id == filters['task_id'])
+    
+    if filters['website_id']:
+        query = query.filter(R.website_id == filters['website_id'])
+    
+    if filters['status']:
+        query = query.filter(R.status == filters['status'])
+    
+    # 时间范围（变化存储模式下按合并记录覆盖的区间判断）
+    query = query.filter(*detection_storage.window_conditions(R, filters['start_dt'], filters['end_dt']))
+    
+    if filters['search']:
+        # 先通过搜索索引解析候选网站ID，再按网站ID过滤检测记录
+        query = query.filter(
+            R.website_id.in_(website_search_service.website_id_subquery(filters['search']))
+        )
+    
+    # 网站随已有的关联一次加载，任务外连接加载
+    return R, query.options(contains_eager(R.website), joinedload(R.task))
+
+
+def _serialize_result(record) -> Dict:
+    """序列化检测记录（日期时间由 JSON 提供者直接输出为 ISO 8601）"""
+    return {
+        'id': record.id,
+        'task_id': record.task_id,
+        'task_name': record.task.name if record.task else None,
+        'website_id': record.website_id,
+        'website_name': record.website.name,
+        'website_url': record.website.url,
+        'website_domain': record.website.url,  # 添加website_domain字段
+        'status': record.status,
+        'response_time': record.response_time,
+        'http_status_code': record.http_status_code,
+        'final_url': record.final_url,
+        'error_message': record.error_message,
+        'detected_at': record.detected_at,
+        'last_seen_at': record.last_seen_at or record.detected_at,
+        'check_count': record.check_count or 1,
+        'min_response_time': record.min_response_time,
+        'max_response_time': record.max_response_time
+    }
+
 
 @bp.route('/', methods=['GET'])
+@conditional_get([TAG_WEBSITES, TAG_TASKS, *detection_tags()])
 def get_detection_results():
     """
     获取检测结果列表
@@ -32,83 +132,27 @@ def get_detection_results():
             # 获取查询参数
             page = request.args.get('page', 1, type=int)
             per_page = min(request.args.get('per_page', 20, type=int), 100)
-        
-            # 筛选条件
-            task_id = request.args.get('task_id', type=int)
-            website_id = request.args.get('website_id', type=int)
-            status = request.args.get('status', type=str)
-            start_date = request.args.get('start_date', type=str)
-            end_date = request.args.get('end_date', type=str)
-            search = request.args.get('search', '', type=str)
-        
-            # 构建查询
-            query = db.query(DetectionRecord).join(Website)
-        
-            if task_id:
-                query = query.filter(DetectionRecord.task_id == task_id)
             
-            if website_id:
-                query = query.filter(DetectionRecord.website_id == website_id)
-            
-            if status:
-                query = query.filter(DetectionRecord.status == status)
-        
-            if start_date:
-                try:
-                    start_dt = datetime.fromisoformat(start_date)
-                    query = query.filter(DetectionRecord.detected_at >= start_dt)
-                except ValueError:
-                    return jsonify({
-                        'code': 400,
-                        'message': '开始日期格式错误',
-                        'data': None
-                    }), 400
+            try:
+                filters = _parse_result_filters()
+            except _FilterError as e:
+                return jsonify({
+                    'code': 400,
+                    'message': str(e),
+                    'data': None
+                }), 400
             
-            if end_date:
-                try:
-                    end_dt = datetime.fromisoformat(end_date)
-                    query = query.filter(DetectionRecord.detected_at <= end_dt)
-                except ValueError:
-                    return jsonify({
-                        'code': 400,
-                        'message': '结束日期格式错误',
-                        'data': None
-                    }), 400
-        
-            if search:
-                query = query.filter(
-                    Website.name.contains(search) | 
-                    Website.url.contains(search)
-                )
+            R, query = _build_results_query(db, filters)
             
             # 分页
             total = query.count()
-            records = query.order_by(DetectionRecord.detected_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+            records = query.order_by(R.detected_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
             
-            # 序列化数据
-            results_data = []
-            for record in records:
-                results_data.append({
-                    'id': record.id,
-                    'task_id': record.task_id,
-                    'task_name': record.task.name if record.task else None,
-                    'website_id': record.website_id,
-                    'website_name': record.website.name,
-                    'website_url': record.website.url,
-                    'website_domain': record.website.url,  # 添加website_domain字段
-                    'status': record.status,
-                    'response_time': record.response_time,
-                    'http_status_code': record.http_status_code,
-                    'final_url': record.final_url,
-                    'error_message': record.error_message,
-                    'detected_at': record.detected_at.isoformat()
-                })
-        
             return jsonify({
                 'code': 200,
                 'message': 'success',
                 'data': {
-                    'results': results_data,
+                    'results': [_serialize_result(record) for record in records],
                     'pagination': {
                         'page': page,
                         'per_page': per_page,
@@ -127,159 +171,257 @@ def get_detection_results():
         }), 500
 
 
-@bp.route('/statistics', methods=['GET'])
-def get_statistics():
+@bp.route('/stream', methods=['GET'])
+@conditional_get([TAG_WEBSITES, TAG_TASKS, *detection_tags()])
+def stream_detection_results():
     """
-    获取检测结果统计信息
-    根据最后一次检测结果统计网站状态
+    流式获取全部匹配的检测结果（不分页）
+    筛选参数与结果列表相同，按数据库游标分批读取并增量输出
     """
     try:
+        filters = _parse_result_filters()
+    except _FilterError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        }), 400
+    
+    def generate():
+        # 会话在生成器内打开，覆盖整个输出过程
         with get_db() as db:
-            # 获取查询参数
-            days = request.args.get('days', 7, type=int)
-            website_ids = request.args.getlist('website_ids', type=int)
+            R, query = _build_results_query(db, filters)
+            yield from query.order_by(R.detected_at.desc()).yield_per(STREAM_BATCH_SIZE)
+    
+    return stream_json_response(
+        generate(),
+        {'code': 200, 'message': 'success', 'data': {}},
+        key='results',
+        serialize=_serialize_result
+    )
+
+
+def _compute_statistics(days: int, website_ids: List[int]) -> Dict:
+    """
+    计算检测结果统计信息
+    根据最后一次检测结果统计网站状态
+    """
+    with get_db() as db:
+        # 计算时间范围
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+    
+        # 一次投影查询加载检测记录列，总数、响应时间、每日和网站统计均向量化计算
+        frame = analytics_engine.load_frame(db, start_date, end_date, website_ids)
         
-            # 计算时间范围
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
+        # 总检测次数统计（历史数据，变化存储模式下按检测次数加权）
+        total_count = frame.total_checks
         
-            # 构建基础查询（用于总检测次数统计）
-            query = db.query(DetectionRecord).filter(
-                DetectionRecord.detected_at >= start_date,
-                DetectionRecord.detected_at <= end_date
-            )
-            
-            if website_ids:
-                query = query.filter(DetectionRecord.website_id.in_(website_ids))
+        # 平均响应时间（历史数据，按检测次数加权）
+        response_summary = analytics_engine.response_time_summary(frame)
+        response_time_sum = response_summary['sum']
+        response_time_count = response_summary['count']
         
-            # 总检测次数统计（历史数据）
-            total_count = query.count()
-            
-            # 平均响应时间（历史数据）
-            avg_response_time = query.filter(
-                DetectionRecord.response_time.isnot(None)
-            ).with_entities(
-                func.avg(DetectionRecord.response_time)
-            ).scalar() or 0
-            
-            # 获取每个网站的最后一次检测结果（用于网站状态统计）
-            subquery = db.query(
-                DetectionRecord.website_id,
-                func.max(DetectionRecord.detected_at).label('last_detected_at')
-            ).group_by(DetectionRecord.website_id).subquery()
-            
-            latest_records_query = db.query(DetectionRecord).join(
-                subquery,
-                (DetectionRecord.website_id == subquery.c.website_id) &
-                (DetectionRecord.detected_at == subquery.c.last_detected_at)
+        # 已压缩的较早数据从小时汇总读取（与检测记录不重叠）
+        S = DetectionHourlySummary
+        use_summaries = compaction_service.covers(start_date)
+        summary_query = db.query(S).filter(
+            *compaction_service.summary_filters(start_date, end_date, website_ids)
+        )
+        if use_summaries:
+            summary_totals = summary_query.with_entities(
+                func.sum(S.total_count),
+                func.sum(S.response_time_sum),
+                func.sum(S.response_time_count)
+            ).one()
+            total_count += int(summary_totals[0] or 0)
+            response_time_sum += summary_totals[1] or 0
+            response_time_count += int(summary_totals[2] or 0)
+        
+        # 超过保留期已写入冷归档的数据
+        archived = archive_service.aggregate(start_date, end_date, website_ids)
+        total_count += archived['total']
+        response_time_sum += archived['response_time_sum']
+        response_time_count += archived['response_time_count']
+        
+        avg_response_time = response_time_sum / response_time_count if response_time_count else 0
+        
+        # 获取每个网站的最后一次检测结果（用于网站状态统计，覆盖全部分区）
+        L = detection_storage.record_source()
+        subquery = db.query(
+            L.website_id,
+            func.max(L.detected_at).label('last_detected_at')
+        ).group_by(L.website_id).subquery()
+        
+        latest_records_query = db.query(L).join(
+            subquery,
+            (L.website_id == subquery.c.website_id) &
+            (L.detected_at == subquery.c.last_detected_at)
+        )
+        
+        if website_ids:
+            latest_records_query = latest_records_query.filter(
+                L.website_id.in_(website_ids)
             )
-            
-            if website_ids:
-                latest_records_query = latest_records_query.filter(
-                    DetectionRecord.website_id.in_(website_ids)
-                )
-            
-            latest_records = latest_records_query.all()
-            
-            # 根据最新检测结果统计网站状态
-            status_counts = {'standard': 0, 'redirect': 0, 'failed': 0}
-            for record in latest_records:
-                if record.status in status_counts:
-                    status_counts[record.status] += 1
-        
-            # 按日期统计
-            daily_stats = query.with_entities(
-                func.strftime('%Y-%m-%d', DetectionRecord.detected_at).label('date'),
-                DetectionRecord.status,
-                func.count(DetectionRecord.id).label('count')
+        
+        latest_records = latest_records_query.all()
+        
+        # 根据最新检测结果统计网站状态
+        status_counts = {'standard': 0, 'redirect': 0, 'failed': 0}
+        for record in latest_records:
+            if record.status in status_counts:
+                status_counts[record.status] += 1
+    
+        # 按日期统计
+        daily_data = analytics_engine.daily_series(frame)
+        
+        if use_summaries:
+            summary_daily = summary_query.with_entities(
+                func.strftime('%Y-%m-%d', S.hour_start).label('date'),
+                func.sum(S.standard_count),
+                func.sum(S.redirect_count),
+                func.sum(S.failed_count)
             ).group_by(
-                func.strftime('%Y-%m-%d', DetectionRecord.detected_at),
-                DetectionRecord.status
+                func.strftime('%Y-%m-%d', S.hour_start)
             ).all()
-            
-            # 组织每日数据
-            daily_data = {}
-            for date_str, status, count in daily_stats:
-                if date_str not in daily_data:
-                    daily_data[date_str] = {'standard': 0, 'redirect': 0, 'failed': 0}
-                daily_data[date_str][status] = count
-        
-            # 网站排行
-            website_stats = query.join(Website).with_entities(
+            for date_str, standard, redirect, failed in summary_daily:
+                day = daily_data.setdefault(date_str, {'standard': 0, 'redirect': 0, 'failed': 0})
+                day['standard'] += int(standard or 0)
+                day['redirect'] += int(redirect or 0)
+                day['failed'] += int(failed or 0)
+        
+        for date_str, counts in archived['daily'].items():
+            day = daily_data.setdefault(date_str, {'standard': 0, 'redirect': 0, 'failed': 0})
+            for status, count in counts.items():
+                day[status] = day.get(status, 0) + count
+    
+        # 网站排行
+        website_data = {}
+        frame_stats = analytics_engine.website_statistics(frame)
+        if frame_stats:
+            for website in db.query(Website).filter(Website.id.in_(list(frame_stats))):
+                stats = frame_stats[website.id]
+                website_data[f"{website.name}||{website.url}"] = {
+                    'name': website.name,
+                    'url': website.url,
+                    'standard': stats['standard'],
+                    'redirect': stats['redirect'],
+                    'failed': stats['failed'],
+                    'total': stats['total']
+                }
+        
+        if use_summaries:
+            summary_websites = summary_query.join(S.website).with_entities(
                 Website.name,
                 Website.url,
-                DetectionRecord.status,
-                func.count(DetectionRecord.id).label('count')
+                func.sum(S.standard_count),
+                func.sum(S.redirect_count),
+                func.sum(S.failed_count),
+                func.sum(S.total_count)
             ).group_by(
                 Website.id,
                 Website.name,
-                Website.url,
-                DetectionRecord.status
+                Website.url
             ).all()
-            
-            # 组织网站数据
-            website_data = {}
-            for name, url, status, count in website_stats:
-                key = f"{name}||{url}"
-                if key not in website_data:
-                    website_data[key] = {
-                        'name': name,
-                        'url': url,
-                        'standard': 0,
-                        'redirect': 0,
-                        'failed': 0,
-                        'total': 0
-                    }
-                website_data[key][status] = count
-                website_data[key]['total'] += count
-        
-            # 计算可用率排行
-            website_ranking = []
-            for data in website_data.values():
-                success_count = data['standard'] + data['redirect']
-                availability = (success_count / data['total']) * 100 if data['total'] > 0 else 0
-                website_ranking.append({
-                    'name': data['name'],
-                    'url': data['url'],
-                    'total_checks': data['total'],
-                    'availability': round(availability, 2),
-                    'standard_count': data['standard'],
-                    'redirect_count': data['redirect'],
-                    'failed_count': data['failed']
+            for name, url, standard, redirect, failed, total in summary_websites:
+                data = website_data.setdefault(f"{name}||{url}", {
+                    'name': name,
+                    'url': url,
+                    'standard': 0,
+                    'redirect': 0,
+                    'failed': 0,
+                    'total': 0
                 })
-            
-            # 按可用率排序
-            website_ranking.sort(key=lambda x: x['availability'], reverse=True)
+                data['standard'] += int(standard or 0)
+                data['redirect'] += int(redirect or 0)
+                data['failed'] += int(failed or 0)
+                data['total'] += int(total or 0)
         
-            # 计算网站数量统计
-            total_websites = len(latest_records)
-            success_websites = status_counts.get('standard', 0) + status_counts.get('redirect', 0)
-            
-            return jsonify({
-                'code': 200,
-                'message': 'success',
-                'data': {
-                    'overview': {
-                        'total_checks': total_count,  # 总检测次数（历史数据）
-                        'total_websites': total_websites,  # 监控网站总数
-                        'standard_count': status_counts.get('standard', 0),  # 正常访问网站数
-                        'redirect_count': status_counts.get('redirect', 0),  # 跳转访问网站数  
-                        'failed_count': status_counts.get('failed', 0),  # 无法访问网站数
-                        'success_rate': round(
-                            (success_websites / total_websites) * 100, 2
-                        ) if total_websites > 0 else 0,  # 网站成功率（基于网站数量）
-                        'avg_response_time': round(avg_response_time, 3)
-                    },
-                    'daily_stats': daily_data,
-                    'website_ranking': website_ranking[:20],  # 只返回前20名
-                    'time_range': {
-                        'start_date': start_date.isoformat(),
-                        'end_date': end_date.isoformat(),
-                        'days': days
-                    }
-                }
+        if archived['websites']:
+            archived_websites = db.query(Website).filter(Website.id.in_(list(archived['websites'])))
+            for website in archived_websites:
+                counts = archived['websites'][website.id]
+                data = website_data.setdefault(f"{website.name}||{website.url}", {
+                    'name': website.name,
+                    'url': website.url,
+                    'standard': 0,
+                    'redirect': 0,
+                    'failed': 0,
+                    'total': 0
+                })
+                for status, count in counts['statuses'].items():
+                    data[status] = data.get(status, 0) + count
+                data['total'] += counts['total']
+    
+        # 计算可用率排行
+        website_ranking = []
+        for data in website_data.values():
+            success_count = data['standard'] + data['redirect']
+            availability = (success_count / data['total']) * 100 if data['total'] > 0 else 0
+            website_ranking.append({
+                'name': data['name'],
+                'url': data['url'],
+                'total_checks': data['total'],
+                'availability': round(availability, 2),
+                'standard_count': data['standard'],
+                'redirect_count': data['redirect'],
+                'failed_count': data['failed']
             })
         
+        # 按可用率排序
+        website_ranking.sort(key=lambda x: x['availability'], reverse=True)
+    
+        # 计算网站数量统计
+        total_websites = len(latest_records)
+        success_websites = status_counts.get('standard', 0) + status_counts.get('redirect', 0)
+        
+        return {
+            'overview': {
+                'total_checks': total_count,  # 总检测次数（历史数据）
+                'total_websites': total_websites,  # 监控网站总数
+                'standard_count': status_counts.get('standard', 0),  # 正常访问网站数
+                'redirect_count': status_counts.get('redirect', 0),  # 跳转访问网站数  
+                'failed_count': status_counts.get('failed', 0),  # 无法访问网站数
+                'success_rate': round(
+                    (success_websites / total_websites) * 100, 2
+                ) if total_websites > 0 else 0,  # 网站成功率（基于网站数量）
+                'avg_response_time': round(avg_response_time, 3)
+            },
+            'daily_stats': daily_data,
+            'website_ranking': website_ranking[:20],  # 只返回前20名
+            'time_range': {
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'days': days
+            }
+        }
+
+
+@bp.route('/statistics', methods=['GET'])
+@conditional_get(lambda: [TAG_WEBSITES, *detection_tags(website_ids=request.args.getlist('website_ids', type=int))])
+def get_statistics():
+    """
+    获取检测结果统计信息
+    结果按参数写入共享缓存，涉及网站写入新检测结果或网站变更时失效
+    """
+    try:
+        # 获取查询参数
+        days = request.args.get('days', 7, type=int)
+        website_ids = request.args.getlist('website_ids', type=int)
+        
+        data = shared_cache.get_or_set(
+            make_key('results_statistics', days, tuple(sorted(website_ids))),
+            lambda: _compute_statistics(days, website_ids),
+            ttl=STATISTICS_CACHE_TTL,
+            tags=[TAG_WEBSITES, *detection_tags(website_ids=website_ids)]
+        )
+        
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': data
+        })
+        
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
         return jsonify({
@@ -289,84 +431,312 @@ def get_statistics():
         }), 500
 
 
-@bp.route('/export', methods=['POST'])
-def export_results():
+def _parse_latency_window():
+    """
+    解析响应时间分位数的时间范围：start_date/end_date（ISO格式）或 hours（默认24小时）
+    带时区的时间先转换为北京时间，再与不带时区的时间比较
+    
+    Raises:
+        ValueError: 参数格式错误
+    """
+    start_date = request.args.get('start_date', type=str)
+    end_date = request.args.get('end_date', type=str)
+    
+    try:
+        end_dt = to_beijing_naive(datetime.fromisoformat(end_date)) if end_date else datetime.now()
+    except ValueError:
+        raise ValueError('结束日期格式错误')
+    
+    if start_date:
+        try:
+            start_dt = to_beijing_naive(datetime.fromisoformat(start_date))
+        except ValueError:
+            raise ValueError('开始日期格式错误')
+    else:
+        hours = request.args.get('hours', 24, type=int)
+        if hours <= 0:
+            raise ValueError('hours 必须大于0')
+        start_dt = end_dt - timedelta(hours=hours)
+    
+    if start_dt >= end_dt:
+        raise ValueError('开始时间必须早于结束时间')
+    return start_dt, end_dt
+
+
+def _latency_response(db, scope: Dict, website_ids, per_website: bool):
+    """合并响应时间草图并构建分位数响应"""
+    try:
+        start_dt, end_dt = _parse_latency_window()
+    except ValueError as e:
+        return jsonify({
+            'code': 400,
+            'message': str(e),
+            'data': None
+        }), 400
+    
+    latency = latency_sketch_service.quantiles(db, website_ids, start_dt, end_dt, per_website=per_website)
+    return jsonify({
+        'code': 200,
+        'message': 'success',
+        'data': {
+            **scope,
+            'latency': latency,
+            'time_range': {
+                'start_date': start_dt.isoformat(),
+                'end_date': end_dt.isoformat()
+            }
+        }
+    })
+
+
+@bp.route('/latency/websites/<int:website_id>', methods=['GET'])
+@conditional_get(lambda website_id: detection_tags(website_ids=[website_id]))
+def get_website_latency(website_id):
     """
-    导出检测结果
+    获取网站在时间范围内的响应时间分位数（P50/P90/P99，合并小时草图）
     """
     try:
         with get_db() as db:
-            data = request.get_json() or {}
-        
-            # 获取导出参数
-            export_format = data.get('format', 'excel')
-            task_id = data.get('task_id')
-            website_ids = data.get('website_ids')
-            start_date_str = data.get('start_date')
-            end_date_str = data.get('end_date')
-            include_task_info = data.get('include_task_info', True)
-            
-            # 解析日期
-            start_date = None
-            end_date = None
-            
-            if start_date_str:
-                try:
-                    start_date = datetime.fromisoformat(start_date_str)
-                except ValueError:
-                    return jsonify({
-                        'code': 400,
-                        'message': '开始日期格式错误',
-                        'data': None
-                    }), 400
+            website = db.query(Website).filter(Website.id == website_id).first()
+            if not website:
+                return jsonify({
+                    'code': 404,
+                    'message': '网站不存在',
+                    'data': None
+                }), 404
             
-            if end_date_str:
-                try:
-                    end_date = datetime.fromisoformat(end_date_str)
-                except ValueError:
-                    return jsonify({
-                        'code': 400,
-                        'message': '结束日期格式错误',
-                        'data': None
-                    }), 400
+            scope = {'website_id': website.id, 'website_name': website.name}
+            return _latency_response(db, scope, [website.id], per_website=False)
         
-            # 执行导出
-            export_service = ExportService()
-            result = export_service.export_detection_results(
-                db=db,
-                task_id=task_id,
-                website_ids=website_ids,
-                start_date=start_date,
-                end_date=end_date,
-                export_format=export_format,
-                include_task_info=include_task_info
-            )
-            
-            if result.success:
-                logger.info(f"导出检测结果成功: {result.file_path}, 记录数: {result.record_count}")
-                
+    except Exception as e:
+        logger.error(f"获取网站响应时间分位数失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取网站响应时间分位数失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/latency/groups/<int:group_id>', methods=['GET'])
+@conditional_get([TAG_WEBSITES, *detection_tags()])
+def get_group_latency(group_id):
+    """
+    获取分组内全部网站在时间范围内的响应时间分位数，per_website=true 时附带每个网站的分位数
+    """
+    try:
+        with get_db() as db:
+            group = db.query(WebsiteGroup).filter(WebsiteGroup.id == group_id).first()
+            if not group:
                 return jsonify({
-                    'code': 200,
-                    'message': f'导出成功，共 {result.record_count} 条记录',
-                    'data': {
-                        'file_path': result.file_path,
-                        'record_count': result.record_count,
-                        'export_time': result.export_time.isoformat(),
-                        'download_url': f'/api/results/download/{os.path.basename(result.file_path)}'
-                    }
-                })
-            else:
+                    'code': 404,
+                    'message': '分组不存在',
+                    'data': None
+                }), 404
+            
+            website_ids = [row[0] for row in db.query(Website.id).filter(Website.group_id == group.id)]
+            scope = {'group_id': group.id, 'group_name': group.name, 'website_count': len(website_ids)}
+            per_website = request.args.get('per_website', 'false').lower() == 'true'
+            return _latency_response(db, scope, website_ids, per_website)
+        
+    except Exception as e:
+        logger.error(f"获取分组响应时间分位数失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取分组响应时间分位数失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/latency/tasks/<int:task_id>', methods=['GET'])
+@conditional_get([TAG_TASKS, *detection_tags()])
+def get_task_latency(task_id):
+    """
+    获取任务所含网站在时间范围内的响应时间分位数，per_website=true 时附带每个网站的分位数
+    """
+    try:
+        with get_db() as db:
+            task = db.query(DetectionTask).filter(DetectionTask.id == task_id).first()
+            if not task:
                 return jsonify({
-                    'code': 400,
-                    'message': result.error_message,
+                    'code': 404,
+                    'message': '任务不存在',
                     'data': None
-                }), 400
+                }), 404
+            
+            website_ids = [website.id for website in task.websites]
+            scope = {'task_id': task.id, 'task_name': task.name, 'website_count': len(website_ids)}
+            per_website = request.args.get('per_website', 'false').lower() == 'true'
+            return _latency_response(db, scope, website_ids, per_website)
+        
+    except Exception as e:
+        logger.error(f"获取任务响应时间分位数失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取任务响应时间分位数失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/export', methods=['POST'])
+def export_results():
+    """
+    创建检测结果导出任务
+    导出在后台执行，通过任务接口查询进度并下载结果
+    """
+    try:
+        data = request.get_json() or {}
+        
+        # 导出参数
+        params = {
+            'task_id': data.get('task_id'),
+            'website_ids': data.get('website_ids'),
+            'start_date': data.get('start_date'),
+            'end_date': data.get('end_date'),
+            'include_task_info': data.get('include_task_info', True),
+        }
+        
+        try:
+            job = export_job_service.create_job(data.get('format', 'excel'), params)
+        except ValueError as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        
+        return jsonify({
+            'code': 202,
+            'message': '导出任务已创建',
+            'data': job
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"创建导出任务失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'创建导出任务失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/export/jobs', methods=['GET'])
+def get_export_jobs():
+    """
+    获取最近的导出任务
+    """
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': export_job_service.list_jobs(limit)
+        })
         
     except Exception as e:
-        logger.error(f"导出检测结果失败: {e}")
+        logger.error(f"获取导出任务失败: {e}")
         return jsonify({
             'code': 500,
-            'message': f'导出检测结果失败: {str(e)}',
+            'message': f'获取导出任务失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id: str):
+    """
+    获取导出任务进度
+    """
+    try:
+        job = export_job_service.get_job(job_id)
+        if job is None:
+            return jsonify({
+                'code': 404,
+                'message': '导出任务不存在',
+                'data': None
+            }), 404
+        
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': job
+        })
+        
+    except Exception as e:
+        logger.error(f"获取导出任务失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取导出任务失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/export/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_export_job(job_id: str):
+    """
+    取消导出任务
+    """
+    try:
+        job = export_job_service.cancel_job(job_id)
+        if job is None:
+            return jsonify({
+                'code': 404,
+                'message': '导出任务不存在',
+                'data': None
+            }), 404
+        
+        return jsonify({
+            'code': 200,
+            'message': '导出任务已取消' if job['status'] in ('cancelling', 'cancelled') else '导出任务已结束，无法取消',
+            'data': job
+        })
+        
+    except Exception as e:
+        logger.error(f"取消导出任务失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'取消导出任务失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/export/jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id: str):
+    """
+    下载导出结果
+    支持 Range 分段请求（中断后续传），文件由 WSGI 服务器的 file_wrapper 直接发送
+    """
+    try:
+        job, file_path = export_job_service.get_download(job_id)
+        if job is None:
+            return jsonify({
+                'code': 404,
+                'message': '导出任务不存在',
+                'data': None
+            }), 404
+        
+        if file_path is None:
+            return jsonify({
+                'code': 409,
+                'message': f"导出结果不可下载，任务状态: {job['status']}",
+                'data': job
+            }), 409
+        
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=job['file_name'],
+            conditional=True,
+            max_age=0
+        )
+        # 完整响应也声明支持分段请求，浏览器据此在中断后续传
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        return response
+        
+    except Exception as e:
+        logger.error(f"下载导出结果失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'下载导出结果失败: {str(e)}',
             'data': None
         }), 500
 
@@ -443,56 +813,58 @@ def download_file(filename: str):
                 'data': None
             }), 404
         
-        # 检查是否已保存到用户文件
-        with get_db() as db:
-            existing_user_file = db.query(UserFile).filter(
-                UserFile.original_filename == filename,
-                UserFile.source_type == 'download'
-            ).first()
+        # 检查是否已保存到用户文件（断点续传的分段请求不重复计数）
+        if request.range is None:
+            with get_db() as db:
+                existing_user_file = db.query(UserFile).filter(
+                    UserFile.original_filename == filename,
+                    UserFile.source_type == 'download'
+                ).first()
             
-            if not existing_user_file:
-                # 首次下载，复制到用户文件目录
-                user_files_dir = os.path.join(
-                    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
-                    'user_files'
-                )
-                os.makedirs(user_files_dir, exist_ok=True)
+                if not existing_user_file:
+                    # 首次下载，复制到用户文件目录
+                    user_files_dir = os.path.join(
+                        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                        'user_files'
+                    )
+                    os.makedirs(user_files_dir, exist_ok=True)
                 
-                user_file_path = os.path.join(user_files_dir, filename)
-                shutil.copy2(file_path, user_file_path)
+                    user_file_path = os.path.join(user_files_dir, filename)
+                    shutil.copy2(file_path, user_file_path)
                 
-                # 创建用户文件记录
-                file_size = os.path.getsize(user_file_path)
-                user_file = UserFile(
-                    filename=filename,
-                    original_filename=filename,
-                    file_path=user_file_path,
-                    file_size=file_size,
-                    file_type=os.path.splitext(filename)[1].lower(),
-                    source_type='download',
-                    original_export_path=file_path,
-                    download_count=1,
-                    last_download_at=get_beijing_time(),
-                    created_at=get_beijing_time()
-                )
-                db.add(user_file)
-                db.commit()
+                    # 创建用户文件记录
+                    file_size = os.path.getsize(user_file_path)
+                    user_file = UserFile(
+                        filename=filename,
+                        original_filename=filename,
+                        file_path=user_file_path,
+                        file_size=file_size,
+                        file_type=os.path.splitext(filename)[1].lower(),
+                        source_type='download',
+                        original_export_path=file_path,
+                        download_count=1,
+                        last_download_at=get_beijing_time(),
+                        created_at=get_beijing_time()
+                    )
+                    db.add(user_file)
+                    db.commit()
                 
-                logger.info(f"首次下载，保存到用户文件: {filename}")
-            else:
-                # 更新下载统计
-                existing_user_file.download_count += 1
-                existing_user_file.last_download_at = get_beijing_time()
-                db.commit()
+                    logger.info(f"首次下载，保存到用户文件: {filename}")
+                else:
+                    # 更新下载统计
+                    existing_user_file.download_count += 1
+                    existing_user_file.last_download_at = get_beijing_time()
+                    db.commit()
                 
-                logger.info(f"更新下载统计: {filename}, 下载次数: {existing_user_file.download_count}")
+                    logger.info(f"更新下载统计: {filename}, 下载次数: {existing_user_file.download_count}")
         
         logger.info(f"下载文件: {filename}")
         
         return send_file(
             file_path,
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            conditional=True
         )
         
     except Exception as e:
@@ -610,106 +982,82 @@ def cleanup_old_files():
 @bp.route('/clear-old-data', methods=['DELETE'])
 def clear_old_detection_data():
     """
-    清除检测数据
+    清除检测数据（按主键区间分块删除）
     - 当传递retain_days参数且大于0时，只保留指定天数内的检测记录
     - 当不传递参数或retain_days为0时，清除所有检测记录
+    - background=true 时在后台限速执行，进度通过 /api/system/retention 查询
     """
     try:
-        with get_db() as db:
-            # 获取保留天数参数，默认为0（清除所有数据）
-            retain_days = request.args.get('retain_days', 0, type=int)
-            
-            if retain_days < 0:
-                return jsonify({
-                    'code': 400,
-                    'message': '保留天数不能为负数',
-                    'data': None
-                }), 400
-            
-            # 查询要删除的记录数量
-            if retain_days == 0:
-                # 清除所有数据
-                records_to_delete = db.query(DetectionRecord).count()
-                
-                if records_to_delete == 0:
-                    return jsonify({
-                        'code': 200,
-                        'message': '没有检测数据需要清理',
-                        'data': {
-                            'deleted_count': 0,
-                            'retain_days': retain_days,
-                            'is_clear_all': True
-                        }
-                    })
-                
-                # 删除所有检测记录
-                deleted_count = db.query(DetectionRecord).delete()
-                
-                # 同时删除所有状态变化记录
-                from ..models import WebsiteStatusChange
-                status_changes_deleted = db.query(WebsiteStatusChange).delete()
-                
-                db.commit()
-                
-                logger.info(f"清除所有检测数据完成: 删除了 {deleted_count} 条检测记录和 {status_changes_deleted} 条状态变化记录")
-                
-                return jsonify({
-                    'code': 200,
-                    'message': f'清除完成，删除了 {deleted_count} 条检测记录',
-                    'data': {
-                        'deleted_count': deleted_count,
-                        'status_changes_deleted': status_changes_deleted,
-                        'retain_days': retain_days,
-                        'is_clear_all': True
-                    }
-                })
-            else:
-                # 只删除过期数据
-                cutoff_date = datetime.now() - timedelta(days=retain_days)
-                
-                records_to_delete = db.query(DetectionRecord).filter(
-                    DetectionRecord.detected_at < cutoff_date
-                ).count()
-                
-                if records_to_delete == 0:
-                    return jsonify({
-                        'code': 200,
-                        'message': f'没有超过{retain_days}天的过期数据需要清理',
-                        'data': {
-                            'deleted_count': 0,
-                            'retain_days': retain_days,
-                            'cutoff_date': cutoff_date.isoformat(),
-                            'is_clear_all': False
-                        }
-                    })
-                
-                # 删除过期的检测记录
-                deleted_count = db.query(DetectionRecord).filter(
-                    DetectionRecord.detected_at < cutoff_date
-                ).delete()
-                
-                # 同时删除相关的状态变化记录
-                from ..models import WebsiteStatusChange
-                status_changes_deleted = db.query(WebsiteStatusChange).filter(
-                    WebsiteStatusChange.detected_at < cutoff_date
-                ).delete()
-                
-                db.commit()
-                
-                logger.info(f"清除过期检测数据完成: 删除了 {deleted_count} 条检测记录和 {status_changes_deleted} 条状态变化记录")
-                
+        # 获取保留天数参数，默认为0（清除所有数据）
+        retain_days = request.args.get('retain_days', 0, type=int)
+        background = request.args.get('background', 'false').lower() == 'true'
+
+        if retain_days < 0:
+            return jsonify({
+                'code': 400,
+                'message': '保留天数不能为负数',
+                'data': None
+            }), 400
+
+        from ..services.retention_service import retention_service, RetentionPurgeBusy
+
+        if background:
+            if not retention_service.start_purge(retain_days):
                 return jsonify({
-                    'code': 200,
-                    'message': f'清除完成，删除了 {deleted_count} 条检测记录',
-                    'data': {
-                        'deleted_count': deleted_count,
-                        'status_changes_deleted': status_changes_deleted,
-                        'retain_days': retain_days,
-                        'cutoff_date': cutoff_date.isoformat(),
-                        'is_clear_all': False
-                    }
-                })
-            
+                    'code': 409,
+                    'message': '数据清理任务正在运行',
+                    'data': retention_service.get_progress()
+                }), 409
+
+            return jsonify({
+                'code': 200,
+                'message': '数据清理任务已启动',
+                'data': retention_service.get_progress()
+            })
+
+        try:
+            result = retention_service.run_purge(retain_days)
+        except RetentionPurgeBusy as e:
+            return jsonify({
+                'code': 409,
+                'message': str(e),
+                'data': retention_service.get_progress()
+            }), 409
+
+        # 写入冷归档后删除的记录也计入删除数
+        archived_count = result.get('archived_count', 0)
+        deleted_count = result['deleted_count'] + archived_count
+        status_changes_deleted = result['status_changes_deleted']
+        data = {
+            'deleted_count': deleted_count,
+            'archived_count': archived_count,
+            'status_changes_deleted': status_changes_deleted,
+            'retain_days': retain_days,
+            'is_clear_all': result['is_clear_all'],
+            'partitions_dropped': result.get('partitions_dropped', [])
+        }
+        if result['cutoff_date']:
+            data['cutoff_date'] = result['cutoff_date']
+
+        if result['status'] == 'cancelled':
+            message = f'清除已取消，已删除 {deleted_count} 条检测记录'
+        elif deleted_count == 0 and status_changes_deleted == 0 and not data['partitions_dropped']:
+            message = '没有检测数据需要清理' if retain_days == 0 else f'没有超过{retain_days}天的过期数据需要清理'
+        elif data['partitions_dropped']:
+            message = f"清除完成，删除了 {deleted_count} 条检测记录和 {len(data['partitions_dropped'])} 个过期分区"
+        else:
+            message = f'清除完成，删除了 {deleted_count} 条检测记录'
+        if archived_count:
+            message += f'（其中 {archived_count} 条已写入归档）'
+
+        logger.info(f"清除检测数据完成: 删除了 {deleted_count} 条检测记录和 {status_changes_deleted} 条状态变化记录")
+
+        return jsonify({
+            'code': 200,
+            'message': message,
+            'data': data
+        })
+
     except Exception as e:
         logger.error(f"清除检测数据失败: {e}")
         return jsonify({
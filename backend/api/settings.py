@@ -12,7 +12,7 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import SystemSetting
 from ..services.email_notification_service import EmailService
-from ..services.api_key_service import ApiKeyService
+from ..services.api_key_service import api_key_service
 
 import logging
 
@@ -359,7 +359,6 @@ def get_dify_api_keys():
     """
     try:
         with get_db() as db:
-            api_key_service = ApiKeyService()
             keys = api_key_service.get_api_keys(db)
 
             return jsonify({
@@ -394,8 +393,6 @@ def create_dify_api_key():
             }), 400
 
         with get_db() as db:
-            api_key_service = ApiKeyService()
-
             # 生成新密钥
             key_result = api_key_service.generate_api_key(name.strip())
 
@@ -429,7 +426,6 @@ def delete_dify_api_key(key_id):
     """
     try:
         with get_db() as db:
-            api_key_service = ApiKeyService()
             success = api_key_service.delete_api_key(db, key_id)
 
             if success:
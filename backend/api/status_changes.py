@@ -5,12 +5,17 @@
 
 from flask import Blueprint, request, jsonify
 from typing import Dict, List
+from datetime import datetime, timedelta
 import logging
 
 from ..database import get_db
-from ..models import DetectionTask
+from ..models import DetectionTask, Website
 from ..services.status_change_service import StatusChangeService
 from ..services.failed_site_monitor_service import FailedSiteMonitorService
+from ..services.uptime_service import uptime_service
+from ..utils.cache import TAG_TASKS, TAG_WEBSITES, detection_tags, make_key, shared_cache
+from ..utils.helpers import to_beijing_naive
+from ..utils.http_cache import conditional_get
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +25,48 @@ bp = Blueprint('status_changes', __name__, url_prefix='/api/status-changes')
 status_change_service = StatusChangeService()
 failed_monitor_service = FailedSiteMonitorService()
 
+# 状态变化和可访问性摘要的共享缓存时间（秒），检测结果写入时按任务失效
+STATUS_CACHE_TTL = 300
+
+
+def _recent_changes(task_id: int, hours: int, limit: int) -> Dict:
+    """查询任务的最近状态变化并按变化类型分类"""
+    changes = status_change_service.get_recent_status_changes(
+        task_id=task_id,
+        hours=hours,
+        limit=limit
+    )
+    
+    # 分类变化记录
+    became_accessible = []
+    became_failed = []
+    status_changed = []
+    
+    for change in changes:
+        if change['change_type'] == 'became_accessible':
+            became_accessible.append(change)
+        elif change['change_type'] == 'became_failed':
+            became_failed.append(change)
+        else:
+            status_changed.append(change)
+    
+    return {
+        'task_id': task_id,
+        'time_range_hours': hours,
+        'total_changes': len(changes),
+        'became_accessible': became_accessible,
+        'became_failed': became_failed,
+        'status_changed': status_changed,
+        'statistics': {
+            'became_accessible_count': len(became_accessible),
+            'became_failed_count': len(became_failed),
+            'status_changed_count': len(status_changed)
+        }
+    }
+
 
 @bp.route('/task/<int:task_id>/recent', methods=['GET'])
+@conditional_get(lambda task_id: [TAG_WEBSITES, *detection_tags([task_id])])
 def get_recent_changes(task_id: int):
     """
     获取任务的最近状态变化
@@ -44,42 +89,18 @@ def get_recent_changes(task_id: int):
                     'data': None
                 }), 404
         
-        # 获取状态变化记录
-        changes = status_change_service.get_recent_status_changes(
-            task_id=task_id,
-            hours=hours,
-            limit=limit
+        # 状态变化按参数缓存，该任务写入新的检测结果或状态变化时失效
+        data = shared_cache.get_or_set(
+            make_key('status_changes_recent', task_id, hours, limit),
+            lambda: _recent_changes(task_id, hours, limit),
+            ttl=STATUS_CACHE_TTL,
+            tags=[TAG_WEBSITES, *detection_tags([task_id])]
         )
         
-        # 分类变化记录
-        became_accessible = []
-        became_failed = []
-        status_changed = []
-        
-        for change in changes:
-            if change['change_type'] == 'became_accessible':
-                became_accessible.append(change)
-            elif change['change_type'] == 'became_failed':
-                became_failed.append(change)
-            else:
-                status_changed.append(change)
-        
         return jsonify({
             'code': 200,
             'message': 'success',
-            'data': {
-                'task_id': task_id,
-                'time_range_hours': hours,
-                'total_changes': len(changes),
-                'became_accessible': became_accessible,
-                'became_failed': became_failed,
-                'status_changed': status_changed,
-                'statistics': {
-                    'became_accessible_count': len(became_accessible),
-                    'became_failed_count': len(became_failed),
-                    'status_changed_count': len(status_changed)
-                }
-            }
+            'data': data
         })
         
     except Exception as e:
@@ -92,6 +113,7 @@ def get_recent_changes(task_id: int):
 
 
 @bp.route('/task/<int:task_id>/summary', methods=['GET'])
+@conditional_get(lambda task_id: detection_tags([task_id]))
 def get_accessibility_summary(task_id: int):
     """
     获取任务的可访问性摘要
@@ -110,8 +132,13 @@ def get_accessibility_summary(task_id: int):
                     'data': None
                 }), 404
         
-        # 获取可访问性摘要
-        summary = status_change_service.get_accessibility_summary(task_id=task_id)
+        # 获取可访问性摘要（按任务缓存，该任务写入新的检测结果时失效）
+        summary = shared_cache.get_or_set(
+            make_key('status_changes_summary', task_id),
+            lambda: status_change_service.get_accessibility_summary(task_id=task_id),
+            ttl=STATUS_CACHE_TTL,
+            tags=detection_tags([task_id])
+        )
         
         return jsonify({
             'code': 200,
@@ -128,7 +155,157 @@ def get_accessibility_summary(task_id: int):
         }), 500
 
 
+def _parse_uptime_window():
+    """
+    解析可用时长报表的时间范围：start_date/end_date（ISO格式）或 days（默认30天）
+    带时区的时间先转换为北京时间，再与不带时区的时间比较
+    
+    Raises:
+        ValueError: 参数格式错误
+    """
+    start_date = request.args.get('start_date', type=str)
+    end_date = request.args.get('end_date', type=str)
+    
+    try:
+        end_dt = to_beijing_naive(datetime.fromisoformat(end_date)) if end_date else datetime.now()
+    except ValueError:
+        raise ValueError('结束日期格式错误')
+    
+    if start_date:
+        try:
+            start_dt = to_beijing_naive(datetime.fromisoformat(start_date))
+        except ValueError:
+            raise ValueError('开始日期格式错误')
+    else:
+        days = request.args.get('days', uptime_service.default_days, type=int)
+        if days <= 0:
+            raise ValueError('days 必须大于0')
+        start_dt = end_dt - timedelta(days=days)
+    
+    if start_dt >= end_dt:
+        raise ValueError('开始时间必须早于结束时间')
+    return start_dt, end_dt
+
+
+@bp.route('/uptime', methods=['GET'])
+@conditional_get([TAG_WEBSITES, *detection_tags()])
+def get_uptime_report():
+    """
+    获取可用时长（SLA）报表
+    按状态变化区间计算时间加权可用率、MTTR、MTBF
+    
+    Query Parameters:
+        website_ids: 网站ID（可多个）
+        group_id: 分组ID
+        task_id: 任务ID（任务所含网站）
+        start_date/end_date: 时间范围（ISO格式），未指定时使用 days
+        days: 最近天数（默认30）
+        outages: 是否返回故障列表（默认false）
+    """
+    try:
+        try:
+            start_dt, end_dt = _parse_uptime_window()
+        except ValueError as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        
+        website_ids = request.args.getlist('website_ids', type=int) or None
+        group_id = request.args.get('group_id', type=int)
+        task_id = request.args.get('task_id', type=int)
+        include_outages = request.args.get('outages', 'false').lower() == 'true'
+        
+        with get_db() as db:
+            if group_id:
+                group_website_ids = [row[0] for row in db.query(Website.id).filter(Website.group_id == group_id)]
+                website_ids = [wid for wid in website_ids if wid in group_website_ids] if website_ids else group_website_ids
+            
+            if task_id:
+                task = db.query(DetectionTask).filter(DetectionTask.id == task_id).first()
+                if not task:
+                    return jsonify({
+                        'code': 404,
+                        'message': '任务不存在',
+                        'data': None
+                    }), 404
+                task_website_ids = [website.id for website in task.websites]
+                website_ids = [wid for wid in website_ids if wid in task_website_ids] if website_ids else task_website_ids
+            
+            report = uptime_service.report(db, website_ids, start_dt, end_dt, include_outages)
+        
+        report['time_range'] = {
+            'start_date': start_dt.isoformat(),
+            'end_date': end_dt.isoformat()
+        }
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': report
+        })
+        
+    except Exception as e:
+        logger.error(f"获取可用时长报表失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取可用时长报表失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/uptime/website/<int:website_id>', methods=['GET'])
+@conditional_get(lambda website_id: [TAG_WEBSITES, *detection_tags(website_ids=[website_id])])
+def get_website_uptime(website_id: int):
+    """
+    获取单个网站的可用时长和故障列表
+    
+    Args:
+        website_id: 网站ID
+    """
+    try:
+        try:
+            start_dt, end_dt = _parse_uptime_window()
+        except ValueError as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        
+        with get_db() as db:
+            website = db.query(Website).filter(Website.id == website_id).first()
+            if not website:
+                return jsonify({
+                    'code': 404,
+                    'message': '网站不存在',
+                    'data': None
+                }), 404
+            
+            report = uptime_service.report(db, [website.id], start_dt, end_dt, include_outages=True)
+        
+        data = report['websites'][0]
+        data['time_range'] = {
+            'start_date': start_dt.isoformat(),
+            'end_date': end_dt.isoformat()
+        }
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': data
+        })
+        
+    except Exception as e:
+        logger.error(f"获取网站可用时长失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取网站可用时长失败: {str(e)}',
+            'data': None
+        }), 500
+
+
 @bp.route('/task/<int:task_id>/failed-monitor', methods=['GET'])
+@conditional_get(lambda task_id: [TAG_TASKS, TAG_WEBSITES, *detection_tags([task_id])])
 def get_failed_monitor_status(task_id: int):
     """
     获取失败网站监控任务状态
@@ -438,6 +615,7 @@ def run_failed_monitor_task(task_id: int):
 
 
 @bp.route('/task/<int:task_id>/recovered', methods=['GET'])
+@conditional_get(lambda task_id: [TAG_WEBSITES, *detection_tags([task_id])])
 def get_recovered_websites(task_id: int):
     """
     获取最近恢复的网站列表
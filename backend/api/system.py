@@ -1,9 +1,9 @@
 """
 系统监控API
-提供内存使用、缓存状态等系统信息
+提供内存使用、缓存状态、历史数据清理进度等系统信息
 """
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 import psutil
 import gc
 import logging
@@ -22,22 +22,29 @@ def get_system_status():
         memory_stats = memory_manager.get_memory_stats()
         
         # 缓存状态
-        from ..utils.cache import app_cache
+        from ..utils.cache import app_cache, shared_cache
         cache_stats = app_cache.get_stats()
+        shared_cache_stats = shared_cache.get_stats()
         
         # 进程信息
         process = psutil.Process()
         cpu_percent = process.cpu_percent()
         
         # 数据库连接信息
-        from ..database import engine
-        pool_status = {
-            'pool_size': engine.pool.size(),
-            'checked_in': engine.pool.checkedin(),
-            'checked_out': engine.pool.checkedout(),
-            'overflow': engine.pool.overflow(),
-            'invalid': engine.pool.invalid()
-        }
+        from ..database import get_connection_stats
+        pool_status = get_connection_stats()
+        
+        # 历史数据清理进度
+        from ..services.retention_service import retention_service
+        retention_status = retention_service.get_progress()
+        
+        # 检测记录存储布局
+        from ..services.detection_storage import detection_storage
+        storage_status = detection_storage.get_stats()
+        
+        # 检测记录压缩状态
+        from ..services.compaction_service import compaction_service
+        compaction_status = compaction_service.get_status()
         
         return jsonify({
             'code': 200,
@@ -45,8 +52,12 @@ def get_system_status():
             'data': {
                 'memory': memory_stats,
                 'cache': cache_stats,
+                'shared_cache': shared_cache_stats,
                 'cpu_percent': cpu_percent,
                 'database_pool': pool_status,
+                'retention': retention_status,
+                'detection_storage': storage_status,
+                'compaction': compaction_status,
                 'garbage_collection': {
                     'generation_0': gc.get_count()[0],
                     'generation_1': gc.get_count()[1], 
@@ -150,4 +161,201 @@ def optimize_system():
             'code': 500,
             'message': f'获取优化建议失败: {str(e)}',
             'data': None
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+@bp.route('/retention', methods=['GET'])
+def get_retention_progress():
+    """获取历史数据清理进度"""
+    try:
+        from ..services.retention_service import retention_service
+
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': retention_service.get_progress()
+        })
+
+    except Exception as e:
+        logger.error(f"获取数据清理进度失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取数据清理进度失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/retention/purge', methods=['POST'])
+def start_retention_purge():
+    """启动后台历史数据清理，未完成的同参数清理从断点继续"""
+    try:
+        from ..services.retention_service import retention_service
+
+        data = request.get_json(silent=True) or {}
+        retain_days = data.get('retain_days')
+        if retain_days is not None:
+            try:
+                retain_days = int(retain_days)
+            except (TypeError, ValueError):
+                retain_days = -1
+            if retain_days < 0:
+                return jsonify({
+                    'code': 400,
+                    'message': '保留天数必须是非负整数',
+                    'data': None
+                }), 400
+
+        if not retention_service.start_purge(retain_days):
+            return jsonify({
+                'code': 409,
+                'message': '数据清理任务正在运行',
+                'data': retention_service.get_progress()
+            }), 409
+
+        return jsonify({
+            'code': 200,
+            'message': '数据清理任务已启动',
+            'data': retention_service.get_progress()
+        })
+
+    except Exception as e:
+        logger.error(f"启动数据清理失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'启动数据清理失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/retention/cancel', methods=['POST'])
+def cancel_retention_purge():
+    """取消正在运行的历史数据清理"""
+    try:
+        from ..services.retention_service import retention_service
+
+        if not retention_service.cancel():
+            return jsonify({
+                'code': 400,
+                'message': '没有正在运行的数据清理任务',
+                'data': None
+            }), 400
+
+        return jsonify({
+            'code': 200,
+            'message': '已请求取消数据清理',
+            'data': retention_service.get_progress()
+        })
+
+    except Exception as e:
+        logger.error(f"取消数据清理失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'取消数据清理失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/compaction', methods=['GET'])
+def get_compaction_status():
+    """获取检测记录压缩状态"""
+    try:
+        from ..services.compaction_service import compaction_service
+
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': compaction_service.get_status()
+        })
+
+    except Exception as e:
+        logger.error(f"获取压缩状态失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取压缩状态失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/compaction/run', methods=['POST'])
+def run_compaction():
+    """将超过明细保留天数的检测记录汇总为小时统计（background=false 时同步执行并返回结果）"""
+    try:
+        from ..services.compaction_service import compaction_service, CompactionBusy
+
+        data = request.get_json(silent=True) or {}
+        background = str(data.get('background', 'true')).lower() == 'true'
+        older_than_days = data.get('older_than_days')
+        if older_than_days is not None:
+            try:
+                older_than_days = int(older_than_days)
+            except (TypeError, ValueError):
+                older_than_days = -1
+            if older_than_days < 1:
+                return jsonify({
+                    'code': 400,
+                    'message': '明细保留天数必须是正整数',
+                    'data': None
+                }), 400
+
+        if background:
+            if older_than_days is not None:
+                return jsonify({
+                    'code': 400,
+                    'message': '后台压缩使用配置的明细保留天数',
+                    'data': None
+                }), 400
+            if not compaction_service.start_compaction():
+                return jsonify({
+                    'code': 409,
+                    'message': '压缩未启用或已在运行',
+                    'data': compaction_service.get_status()
+                }), 409
+            return jsonify({
+                'code': 200,
+                'message': '压缩任务已启动',
+                'data': compaction_service.get_status()
+            })
+
+        try:
+            result = compaction_service.run_compaction(older_than_days)
+        except CompactionBusy as e:
+            return jsonify({
+                'code': 409,
+                'message': str(e),
+                'data': compaction_service.get_status()
+            }), 409
+
+        return jsonify({
+            'code': 200,
+            'message': f"压缩完成，汇总了 {result['compacted_records']} 条检测记录",
+            'data': result
+        })
+
+    except Exception as e:
+        logger.error(f"执行检测记录压缩失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'执行检测记录压缩失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/archive', methods=['GET'])
+def get_archive_stats():
+    """获取检测记录冷归档统计"""
+    try:
+        from ..services.archive_service import archive_service
+
+        return jsonify({
+            'code': 200,
+            'message': 'success',
+            'data': archive_service.get_stats()
+        })
+
+    except Exception as e:
+        logger.error(f"获取归档统计失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取归档统计失败: {str(e)}',
+            'data': None
+        }), 500
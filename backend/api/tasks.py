@@ -8,12 +8,16 @@ from typing import Dict, List
 import threading
 from datetime import datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, text
 from ..database import get_db
-from ..models import Website, DetectionTask, DetectionRecord, WebsiteStatusChange, FailedSiteMonitorTask
+from ..models import Website, DetectionTask, WebsiteStatusChange, FailedSiteMonitorTask, task_websites
 from ..services.website_detector import WebsiteDetector
+from ..services.result_writer import result_writer, build_detection_row, RESULT_WAIT_TIMEOUT
+from ..services.detection_storage import detection_storage
 from ..services.scheduler import TaskScheduler
+from ..utils.cache import TAG_TASKS, TAG_WEBSITES, detection_tags, invalidate_detections, shared_cache
+from ..utils.http_cache import conditional_get
 
 import logging
 
@@ -86,36 +90,20 @@ def execute_detection_task(task_id: int):
                 website = websites[i]
                 logger.info(f"结果 {i}: 网站ID={website.id}, URL={result.original_url}, 状态={result.status}, Final={result.final_url}")
             
-            # 保存检测结果
-            detection_records = []
-            for i, result in enumerate(results):
-                website = websites[i]
-                
-                record = DetectionRecord(
-                    task_id=task.id,
-                    website_id=website.id,
-                    status=result.status,
-                    response_time=result.response_time or 0.0,
-                    http_status_code=result.http_status_code,
-                    final_url=result.final_url or '',
-                    error_message=result.error_message or '',
-                    failure_reason=getattr(result, 'failure_reason', '') or '',
-                    ssl_info=getattr(result, 'ssl_info', {}) or {},
-                    page_title=getattr(result, 'page_title', ''),
-                    page_content_length=getattr(result, 'page_content_length', 0),
-                    retry_count=getattr(result, 'retry_count', 0),
-                    redirect_chain=getattr(result, 'redirect_chain', []),
-                    detected_at=result.detected_at.replace(tzinfo=None) if result.detected_at else datetime.now()
-                )
-                
-                detection_records.append(record)
-                db.add(record)
-                logger.debug(f"添加检测记录: 网站{website.id}, 状态{result.status}")
-            
-            db.commit()
+            # 保存检测结果（经写入缓冲批量落库）
+            rows = [
+                build_detection_row(task.id, websites[i].id, result)
+                for i, result in enumerate(results)
+            ]
+            ticket = result_writer.submit(rows)
             
             # 检测状态变化
             try:
+                # 状态变化需要记录ID，等待本批结果写入完成
+                record_ids = ticket.wait(timeout=RESULT_WAIT_TIMEOUT)
+                with get_db() as record_db:
+                    detection_records = detection_storage.records_by_ids(record_db, record_ids)
+                
                 from ..services.status_change_service import StatusChangeService
                 status_change_service = StatusChangeService()
                 status_changes = status_change_service.detect_status_changes(task.id, detection_records)
@@ -154,6 +142,7 @@ def execute_detection_task(task_id: int):
 
 
 @bp.route('/', methods=['GET'])
+@conditional_get([TAG_TASKS])
 def get_tasks():
     """
     获取检测任务列表
@@ -175,11 +164,18 @@ def get_tasks():
             total = query.count()
             tasks = query.order_by(DetectionTask.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
             
+            # 任务关联的网站数量一次分组统计
+            website_counts = dict(db.query(
+                task_websites.c.task_id,
+                func.count(task_websites.c.website_id)
+            ).filter(
+                task_websites.c.task_id.in_([task.id for task in tasks])
+            ).group_by(task_websites.c.task_id).all()) if tasks else {}
+            
             # 序列化数据
             tasks_data = []
             for task in tasks:
-                # 获取任务关联的网站数量
-                website_count = len(task.websites) if hasattr(task, 'websites') else 0
+                website_count = website_counts.get(task.id, 0)
                 
                 tasks_data.append({
                     'id': task.id,
@@ -333,6 +329,7 @@ def create_task():
 
 
 @bp.route('/<int:task_id>', methods=['GET'])
+@conditional_get([TAG_TASKS, TAG_WEBSITES])
 def get_task(task_id: int):
     """
     获取任务详情
@@ -728,9 +725,9 @@ def delete_task_impl(task_id: int):
     """
     try:
         # 使用原始数据库连接以避免SQLAlchemy ORM的自动关系管理
-        from ..database import engine
+        from ..database import writer_engine
         
-        with engine.connect() as conn:
+        with writer_engine.connect() as conn:
             # 开始事务
             trans = conn.begin()
             
@@ -792,14 +789,21 @@ def delete_task_impl(task_id: int):
                     )
                     logger.info(f"删除失败监控任务: {result.rowcount} 条")
                 
-                # 5. 删除检测记录
+                # 5. 删除检测记录（含分区表）
                 result = conn.execute(
                     text("DELETE FROM detection_records WHERE task_id = :task_id"),
                     {"task_id": task_id}
                 )
-                logger.info(f"删除检测记录: {result.rowcount} 条")
+                partition_deleted = detection_storage.delete_partition_records(conn, task_id=task_id)
+                logger.info(f"删除检测记录: {result.rowcount + partition_deleted} 条")
                 
-                # 6. 删除任务与网站的关联记录
+                # 6. 删除任务与网站的关联记录（先记下网站ID用于失效缓存）
+                website_ids = [
+                    row[0] for row in conn.execute(
+                        text("SELECT website_id FROM task_websites WHERE task_id = :task_id"),
+                        {"task_id": task_id}
+                    ).fetchall()
+                ]
                 result = conn.execute(
                     text("DELETE FROM task_websites WHERE task_id = :task_id"),
                     {"task_id": task_id}
@@ -816,6 +820,10 @@ def delete_task_impl(task_id: int):
                 # 提交事务
                 trans.commit()
                 
+                # 原始SQL不经过ORM会话的数据版本跟踪，手动失效任务、网站和该任务检测数据的缓存
+                shared_cache.invalidate_tags(TAG_TASKS, TAG_WEBSITES)
+                invalidate_detections([task_id], website_ids)
+                
                 logger.info(f"删除任务成功: {task_id}")
                 
                 return jsonify({
@@ -840,6 +848,7 @@ def delete_task_impl(task_id: int):
 
 
 @bp.route('/<int:task_id>/results', methods=['GET'])
+@conditional_get(lambda task_id: [TAG_WEBSITES, *detection_tags([task_id])])
 def get_task_results(task_id: int):
     """
     获取任务检测结果
@@ -860,10 +869,13 @@ def get_task_results(task_id: int):
             per_page = min(request.args.get('per_page', 20, type=int), 100)
             
             # 获取检测结果
-            query = db.query(DetectionRecord).filter(DetectionRecord.task_id == task_id)
+            R = detection_storage.record_source()
+            query = db.query(R).filter(R.task_id == task_id)
             
             total = query.count()
-            results = query.order_by(DetectionRecord.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+            results = query.options(joinedload(R.website)).order_by(
+                R.detected_at.desc()
+            ).offset((page - 1) * per_page).limit(per_page).all()
             
             # 序列化数据
             results_data = []
@@ -878,7 +890,7 @@ def get_task_results(task_id: int):
                     'http_status_code': result.http_status_code,
                     'final_url': result.final_url,
                     'error_message': result.error_message,
-                    'created_at': result.created_at.isoformat()
+                    'created_at': result.detected_at.isoformat()
                 })
             
             return jsonify({
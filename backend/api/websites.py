@@ -7,11 +7,17 @@ from flask import Blueprint, request, jsonify
 from typing import Dict, List
 import traceback
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from ..database import get_db
-from ..models import Website, WebsiteGroup
+from ..models import Website, WebsiteGroup, UploadRecord
 from ..utils.validators import validate_url
 from ..services.file_parser import FileParser
+from ..services.website_search_service import website_search_service
+from ..services.website_import_service import website_import_service, ImportSummary
+from ..services.detection_storage import detection_storage
+from ..utils.cache import TAG_TASKS, TAG_WEBSITES, invalidate_detections, shared_cache
+from ..utils.http_cache import conditional_get
+from ..utils.json_provider import stream_json_response
 
 import logging
 
@@ -20,7 +26,45 @@ logger = logging.getLogger(__name__)
 bp = Blueprint('websites', __name__, url_prefix='/api/websites')
 
 
+# 流式输出时每批从数据库游标读取的网站数
+STREAM_BATCH_SIZE = 1000
+
+
+def _build_websites_query(db: Session):
+    """按请求参数构建网站查询（搜索、分组、状态过滤）"""
+    search = request.args.get('search', '', type=str)
+    group_id = request.args.get('group_id')
+    is_active = request.args.get('is_active')
+    
+    query = db.query(Website)
+    
+    if search:
+        # 通过搜索索引解析候选网站ID
+        query = query.filter(
+            Website.id.in_(website_search_service.website_id_subquery(search))
+        )
+    
+    # 分组过滤
+    if group_id is not None:
+        if group_id == '':  # 未分组
+            query = query.filter(Website.group_id.is_(None))
+        else:
+            try:
+                group_id_int = int(group_id)
+                query = query.filter(Website.group_id == group_id_int)
+            except ValueError:
+                pass
+    
+    # 状态过滤
+    if is_active is not None:
+        is_active_bool = is_active.lower() in ('true', '1', 'yes')
+        query = query.filter(Website.is_active == is_active_bool)
+    
+    return query
+
+
 @bp.route('/', methods=['GET'])
+@conditional_get([TAG_WEBSITES])
 def get_websites():
     """
     获取网站列表
@@ -31,40 +75,15 @@ def get_websites():
             # 获取查询参数
             page = request.args.get('page', 1, type=int)
             per_page = min(request.args.get('per_page', 20, type=int), 100)
-            search = request.args.get('search', '', type=str)
-            group_id = request.args.get('group_id')
-            is_active = request.args.get('is_active')
             
             # 构建查询
-            query = db.query(Website)
-            
-            if search:
-                query = query.filter(
-                    Website.name.contains(search) | 
-                    Website.url.contains(search)
-                )
-            
-            # 分组过滤
-            if group_id is not None:
-                if group_id == '':  # 未分组
-                    query = query.filter(Website.group_id.is_(None))
-                else:
-                    try:
-                        group_id_int = int(group_id)
-                        query = query.filter(Website.group_id == group_id_int)
-                    except ValueError:
-                        pass
-            
-            # 状态过滤
-            if is_active is not None:
-                is_active_bool = is_active.lower() in ('true', '1', 'yes')
-                query = query.filter(Website.is_active == is_active_bool)
+            query = _build_websites_query(db)
             
             # 分页
             total = query.count()
-            websites = query.offset((page - 1) * per_page).limit(per_page).all()
+            websites = query.options(joinedload(Website.group)).offset((page - 1) * per_page).limit(per_page).all()
             
-            # 序列化数据
+            # 序列化数据（分组随网站一次加载）
             websites_data = []
             for website in websites:
                 websites_data.append(website.to_dict())
@@ -92,6 +111,27 @@ def get_websites():
         }), 500
 
 
+@bp.route('/stream', methods=['GET'])
+@conditional_get([TAG_WEBSITES])
+def stream_websites():
+    """
+    流式获取全部匹配的网站（不分页）
+    筛选参数与网站列表相同，按数据库游标分批读取并增量输出
+    """
+    def generate():
+        # 会话在生成器内打开，覆盖整个输出过程
+        with get_db() as db:
+            query = _build_websites_query(db).options(joinedload(Website.group))
+            yield from query.order_by(Website.id).yield_per(STREAM_BATCH_SIZE)
+    
+    return stream_json_response(
+        generate(),
+        {'code': 200, 'message': 'success', 'data': {}},
+        key='websites',
+        serialize=Website.to_dict
+    )
+
+
 @bp.route('/', methods=['POST'])
 def create_website():
     """
@@ -122,9 +162,8 @@ def create_website():
                     'data': None
                 }), 400
             
-            # 检查是否已存在
-            existing = db.query(Website).filter(Website.url == url).first()
-            if existing:
+            # 检查是否已存在（按标准化网址去重键）
+            if website_import_service.url_exists(db, url):
                 return jsonify({
                     'code': 400,
                     'message': '该网址已存在',
@@ -148,7 +187,7 @@ def create_website():
             )
             
             db.add(website)
-            db.flush()  # 刷新获取ID，但不提交
+            db.commit()
             
             logger.info(f"创建网站成功: {website.name} ({website.url})")
             
@@ -199,8 +238,8 @@ def batch_create_websites():
                     'data': None
                 }), 400
             
-            created_websites = []
-            failed_urls = []
+            summary = ImportSummary()
+            rows = []
             
             for item in websites_data:
                 try:
@@ -209,52 +248,37 @@ def batch_create_websites():
                     description = item.get('description', '').strip()
                     
                     if not url:
-                        failed_urls.append({'url': url or 'empty', 'reason': '网址不能为空'})
+                        summary.failed_urls.append({'url': url or 'empty', 'reason': '网址不能为空'})
                         continue
                     
                     # 验证URL格式
                     if not validate_url(url):
-                        failed_urls.append({'url': url, 'reason': '网址格式不正确'})
+                        summary.failed_urls.append({'url': url, 'reason': '网址格式不正确'})
                         continue
                     
-                    # 检查是否已存在
-                    existing = db.query(Website).filter(Website.url == url).first()
-                    if existing:
-                        failed_urls.append({'url': url, 'reason': '该网址已存在'})
+                    row = website_import_service.build_website_row(url, name=name, description=description)
+                    if not row:
+                        summary.failed_urls.append({'url': url, 'reason': '网址格式不正确'})
                         continue
                     
-                    # 从URL中提取域名
-                    from urllib.parse import urlparse
-                    parsed_url = urlparse(url)
-                    domain = parsed_url.netloc or url
-                    
-                    # 创建网站
-                    website = Website(
-                        name=name or url,
-                        url=url,
-                        domain=domain,
-                        original_url=url,
-                        normalized_url=url,
-                        description=description
-                    )
-                    
-                    db.add(website)
-                    created_websites.append(website)
+                    rows.append(row)
                     
                 except Exception as e:
-                    failed_urls.append({'url': item.get('url', 'unknown'), 'reason': str(e)})
+                    summary.failed_urls.append({'url': item.get('url', 'unknown'), 'reason': str(e)})
             
-            # 批量提交（这里会自动提交，因为with语句结束时会调用commit）
+            # 按去重键集合去重后批量插入
+            website_import_service.bulk_create(db, rows, summary)
+            db.commit()
             
-            logger.info(f"批量创建网站完成: 成功 {len(created_websites)} 个，失败 {len(failed_urls)} 个")
+            logger.info(f"批量创建网站完成: 成功 {summary.created_count} 个，失败 {summary.failed_count} 个")
             
             return jsonify({
                 'code': 200,
-                'message': f'批量创建完成，成功 {len(created_websites)} 个，失败 {len(failed_urls)} 个',
+                'message': f'批量创建完成，成功 {summary.created_count} 个，失败 {summary.failed_count} 个',
                 'data': {
-                    'created_count': len(created_websites),
-                    'failed_count': len(failed_urls),
-                    'failed_urls': failed_urls
+                    'created_count': summary.created_count,
+                    'failed_count': summary.failed_count,
+                    'failed_urls': summary.failed_urls
                 }
             })
         
@@ -268,6 +292,7 @@ def batch_create_websites():
 
 
 @bp.route('/<int:website_id>', methods=['GET'])
+@conditional_get([TAG_WEBSITES])
 def get_website(website_id: int):
     """
     获取单个网站详情
@@ -350,12 +375,7 @@ def update_website(website_id: int):
                     }), 400
                 
                 # 检查新URL是否与其他网站重复
-                existing = db.query(Website).filter(
-                    Website.url == new_url,
-                    Website.id != website_id
-                ).first()
-                
-                if existing:
+                if website_import_service.url_exists(db, new_url, exclude_id=website_id):
                     return jsonify({
                         'code': 400,
                         'message': '该网址已被其他网站使用',
@@ -426,10 +446,15 @@ def delete_website(website_id: int):
                     'data': None
                 }), 404
             
-            # 删除网站
+            # 删除网站（分区表中的检测记录不在级联范围内，单独删除）
+            detection_storage.delete_partition_records(db, website_ids=[website.id])
             db.delete(website)
             db.commit()
             
+            # 级联删除的检测记录和任务关联不在数据版本跟踪的表中，手动失效
+            shared_cache.invalidate_tags(TAG_TASKS)
+            invalidate_detections(website_ids=[website_id])
+            
             logger.info(f"删除网站成功: {website.name} ({website.url})")
             
             return jsonify({
@@ -482,7 +507,9 @@ def batch_delete_websites():
                     'data': None
                 }), 404
             
-            # 批量删除
+            # 批量删除（分区表中的检测记录单独删除）
+            deleted_ids = [website.id for website in websites]
+            detection_storage.delete_partition_records(db, website_ids=deleted_ids)
             deleted_count = 0
             for website in websites:
                 db.delete(website)
@@ -490,6 +517,10 @@ def batch_delete_websites():
             
             db.commit()
             
+            # 级联删除的检测记录和任务关联不在数据版本跟踪的表中，手动失效
+            shared_cache.invalidate_tags(TAG_TASKS)
+            invalidate_detections(website_ids=deleted_ids)
+            
             logger.info(f"批量删除网站成功: {deleted_count} 个")
             
             return jsonify({
@@ -604,76 +635,31 @@ def import_websites_from_file():
                     'data': None
                 }), 400
             
-            # 批量创建网站
+            # 按去重键集合去重后批量创建网站
             with get_db() as db:
-                created_websites = []
-                failed_urls = []
+                summary = ImportSummary()
+                rows = []
                 
                 for url in parse_result.valid_urls:
-                    try:
-                        # 检查是否已存在
-                        existing = db.query(Website).filter(Website.url == url).first()
-                        if existing:
-                            failed_urls.append({'url': url, 'reason': '网址已存在'})
-                            continue
-                        
-                        # 从URL中提取域名
-                        from urllib.parse import urlparse
-                        
-                        # 初始化变量
-                        normalized_url = url
-                        domain = url
-                        original_url = url
-                        
-                        try:
-                            # 标准化URL
-                            if not url.startswith(('http://', 'https://')):
-                                normalized_url = 'http://' + url
-                            
-                            logger.info(f"处理URL: {url} -> {normalized_url}")
-                            
-                            parsed = urlparse(normalized_url)
-                            if parsed.netloc:
-                                domain = parsed.netloc.lower()
-                            
-                            logger.info(f"解析结果: domain={domain}, netloc={parsed.netloc}")
-                                
-                        except Exception as e:
-                            logger.warning(f"域名提取失败: {url}, 使用原URL: {e}")
-                        
-                        # 创建网站
-                        logger.info(f"创建网站对象: name={url}, url={normalized_url}, domain={domain}, original_url={original_url}")
-                        
-                        website = Website(
-                            name=url,  # 默认使用URL作为名称
-                            url=normalized_url,
-                            domain=domain,
-                            original_url=original_url,
-                            normalized_url=normalized_url
-                        )
-                        
-                        db.add(website)
-                        created_websites.append(website)
-                        
-                    except Exception as e:
-                        failed_urls.append({'url': url, 'reason': str(e)})
+                    row = website_import_service.build_website_row(url)
+                    if row:
+                        rows.append(row)
+                    else:
+                        summary.failed_urls.append({'url': url, 'reason': '网址格式不正确'})
                 
-                # 提交事务
-                if created_websites:
-                    db.commit()
-                    for website in created_websites:
-                        db.refresh(website)
+                website_import_service.bulk_create(db, rows, summary)
+                db.commit()
             
-                logger.info(f"从文件导入网站完成: 成功 {len(created_websites)} 个，失败 {len(failed_urls)} 个")
+                logger.info(f"从文件导入网站完成: 成功 {summary.created_count} 个，失败 {summary.failed_count} 个")
             
                 return jsonify({
                 'code': 200,
-                'message': f'导入完成，成功 {len(created_websites)} 个，失败 {len(failed_urls)} 个',
+                'message': f'导入完成，成功 {summary.created_count} 个，失败 {summary.failed_count} 个',
                 'data': {
                     'total_urls': len(parse_result.valid_urls),
-                    'created_count': len(created_websites),
-                    'failed_count': len(failed_urls),
-                    'failed_urls': failed_urls
+                    'created_count': summary.created_count,
+                    'failed_count': summary.failed_count,
+                    'failed_urls': summary.failed_urls
                 }
                 })
             
@@ -688,4 +674,133 @@ def import_websites_from_file():
             'code': 500,
             'message': f'导入网站失败: {str(e)}',
             'data': None
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+@bp.route('/import/async', methods=['POST'])
+def import_websites_async():
+    """
+    后台流式导入网站
+    文件保存后立即返回上传记录，导入进度通过 /import/<record_id> 查询
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({
+                'code': 400,
+                'message': '没有上传文件',
+                'data': None
+            }), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({
+                'code': 400,
+                'message': '文件名不能为空',
+                'data': None
+            }), 400
+        
+        # 检查文件扩展名
+        allowed_extensions = {'.xlsx', '.xls', '.csv'}
+        file_ext = '.' + file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+        
+        if file_ext not in allowed_extensions:
+            return jsonify({
+                'code': 400,
+                'message': '文件格式不支持，请上传 Excel 或 CSV 文件',
+                'data': None
+            }), 400
+        
+        group_id = request.form.get('group_id', type=int)
+        
+        # 保存上传文件，导入结束后由后台任务删除
+        import os
+        from ..config import Config
+        from ..utils.helpers import generate_unique_filename
+        
+        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        filename = generate_unique_filename(file.filename, Config.UPLOAD_FOLDER)
+        file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
+        file.save(file_path)
+        
+        with get_db() as db:
+            if group_id is not None and not db.query(WebsiteGroup.id).filter(WebsiteGroup.id == group_id).first():
+                os.unlink(file_path)
+                return jsonify({
+                    'code': 400,
+                    'message': '指定的分组不存在',
+                    'data': None
+                }), 400
+            
+            upload_record = UploadRecord(
+                filename=filename,
+                original_filename=file.filename,
+                file_path=file_path,
+                file_size=os.path.getsize(file_path),
+                file_type=file_ext,
+                status='pending'
+            )
+            db.add(upload_record)
+            db.flush()
+            record_data = upload_record.to_dict()
+        
+        website_import_service.start_file_import(record_data['id'], file_path, group_id=group_id)
+        
+        logger.info(f"后台导入任务已提交: {file.filename} (记录 {record_data['id']})")
+        
+        return jsonify({
+            'code': 200,
+            'message': '导入任务已提交',
+            'data': record_data
+        })
+        
+    except Exception as e:
+        logger.error(f"提交导入任务失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'提交导入任务失败: {str(e)}',
+            'data': None
+        }), 500
+
+
+@bp.route('/import/<int:record_id>', methods=['GET'])
+def get_import_progress(record_id: int):
+    """
+    查询后台导入进度
+    """
+    try:
+        with get_db() as db:
+            upload_record = db.query(UploadRecord).filter(UploadRecord.id == record_id).first()
+            
+            if not upload_record:
+                return jsonify({
+                    'code': 404,
+                    'message': '导入记录不存在',
+                    'data': None
+                }), 404
+            
+            data = upload_record.to_dict()
+            total_rows = upload_record.total_rows or 0
+            processed_rows = upload_record.processed_rows or 0
+            
+            if upload_record.status == 'completed':
+                data['progress'] = 100.0
+            elif total_rows > 0:
+                data['progress'] = round(min(processed_rows / total_rows, 1.0) * 100, 1)
+            else:
+                data['progress'] = 0.0
+            data['is_running'] = website_import_service.is_import_running(record_id)
+            
+            return jsonify({
+                'code': 200,
+                'message': 'success',
+                'data': data
+            })
+        
+    except Exception as e:
+        logger.error(f"获取导入进度失败: {e}")
+        return jsonify({
+            'code': 500,
+            'message': f'获取导入进度失败: {str(e)}',
+            'data': None
+        }), 500
@@ -21,9 +21,11 @@ from backend.config import Config
 from backend.models import init_db
 from backend.database import get_db
 from backend.utils.helpers import ensure_dir
+from backend.utils.compression import setup_compression
+from backend.utils.json_provider import FastJSONProvider
 
 # 导入API蓝图
-from backend.api import websites, tasks, results, files, groups, performance, status_changes, settings, auth, dify_api
+from backend.api import websites, tasks, results, files, groups, performance, status_changes, settings, auth, dify_api, system
 
 
 def create_app(config_class=Config):
@@ -33,6 +35,9 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # 快速JSON序列化（安装 orjson 时启用，日期时间输出 ISO 8601）
+    app.json = FastJSONProvider(app)
+    
     # 配置JWT
     setup_jwt(app)
     
@@ -73,6 +78,12 @@ def create_app(config_class=Config):
     # 初始化数据库
     init_db(app)
     
+    # 初始化网站搜索索引
+    setup_search_index()
+    
+    # 初始化检测记录存储布局
+    setup_detection_storage()
+    
     # 启动优化组件
     setup_optimizations(app)
     
@@ -85,6 +96,9 @@ def create_app(config_class=Config):
     # 注册请求钩子
     register_request_hooks(app)
     
+    # 响应压缩
+    setup_compression(app, app.config.get('COMPRESSION_CONFIG'))
+    
     # 设置关闭处理器
     setup_shutdown_handlers(app)
     
@@ -153,6 +167,24 @@ def ensure_directories():
         ensure_dir(directory)
 
 
+def setup_search_index():
+    """初始化网站搜索索引"""
+    try:
+        from backend.services.website_search_service import website_search_service
+        website_search_service.ensure_index()
+    except Exception as e:
+        logger.error(f"初始化网站搜索索引失败: {e}")
+
+
+def setup_detection_storage():
+    """初始化检测记录存储布局（分区表/原生分区）"""
+    try:
+        from backend.services.detection_storage import detection_storage
+        detection_storage.ensure_layout()
+    except Exception as e:
+        logger.error(f"初始化检测记录存储失败: {e}")
+
+
 def register_blueprints(app):
     """注册API蓝图"""
     app.register_blueprint(websites.bp)
@@ -165,6 +197,7 @@ def register_blueprints(app):
     app.register_blueprint(settings.bp)
     app.register_blueprint(auth.bp)
     app.register_blueprint(dify_api.bp)
+    app.register_blueprint(system.bp)
 
     logger.info("API蓝图注册完成")
 
@@ -182,6 +215,18 @@ def setup_optimizations(app):
         # 注册数据库连接清理回调
         register_global_cleanup_callback(close_all_connections)
         
+        # 启动检测结果写入缓冲（响应时间草图与检测记录在同一事务内更新，提交后按任务和网站失效共享缓存）
+        from backend.services.result_writer import result_writer
+        from backend.services.latency_sketch_service import latency_sketch_service
+        from backend.utils.cache import invalidate_detection_rows
+        result_writer.add_listener(latency_sketch_service.record_rows, 'before_commit')
+        result_writer.add_listener(invalidate_detection_rows, 'after_commit')
+        
+        # 网站、分组、任务修改提交后递增数据版本（共享缓存失效和 ETag）
+        from backend.utils.data_version import register_session_hooks
+        register_session_hooks()
+        result_writer.start()
+        
         # 启动调度服务
         try:
             from backend.services.scheduler_service import SchedulerService
@@ -277,6 +322,18 @@ def setup_shutdown_handlers(app):
             from backend.services.memory_monitor import stop_global_memory_monitoring
             stop_global_memory_monitoring()
             
+            # 停止后台导出任务
+            from backend.services.export_job_service import export_job_service
+            export_job_service.shutdown()
+            
+            # 写入累计的API密钥使用记录
+            from backend.services.api_key_service import api_key_service
+            api_key_service.stop()
+            
+            # 刷写缓冲中的检测结果
+            from backend.services.result_writer import result_writer
+            result_writer.stop()
+            
             # 关闭数据库连接
             from backend.database import close_all_connections
             close_all_connections()
@@ -420,11 +477,12 @@ def register_basic_routes(app):
             
             # 数据库统计
             with get_db() as db:
-                from backend.models import Website, DetectionTask, DetectionRecord
+                from backend.models import Website, DetectionTask
+                from backend.services.detection_storage import detection_storage
                 
                 website_count = db.query(Website).count()
                 task_count = db.query(DetectionTask).count()
-                record_count = db.query(DetectionRecord).count()
+                record_count = db.query(detection_storage.record_source()).count()
             
             # 调度器状态
             scheduler_status = {}
@@ -0,0 +1,140 @@
+"""
+检测统计分析基准
+对比逐行 Python 循环（原统计/导出接口的做法）与 NumPy 向量化分析引擎
+计算按网站的可用率、平均响应时间、P50/P90/P99、每日序列和响应时间直方图的耗时
+
+两者输入均为一次查询返回的行元组：逐行循环拿到 datetime 检测时间，
+分析引擎的投影查询由数据库直接返回微秒数；向量化路径的耗时包含行转数组
+
+使用方式:
+    python -m backend.benchmarks.analytics --records 5000000 --websites 2000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ..services.analytics_engine import STATUSES, DetectionFrame, analytics_engine
+
+PERCENTILES = (50, 90, 99)
+HISTOGRAM_EDGES = (2, 5, 10)
+
+
+def make_rows(record_count: int, website_count: int, days: int, seed: int):
+    """
+    生成查询形式的行 (网站ID, 状态, HTTP状态码, 响应时间, 检测时间, 检测次数)
+
+    Returns:
+        (检测时间为 datetime 的行, 检测时间为微秒数的行)
+    """
+    rng = np.random.default_rng(seed)
+    website_ids = rng.integers(1, website_count + 1, record_count).tolist()
+    statuses = np.array(STATUSES, dtype=object)[rng.choice(3, record_count, p=(0.8, 0.1, 0.1))].tolist()
+    codes = rng.choice((200, 301, 500), record_count).tolist()
+    response_times = np.round(rng.lognormal(-0.5, 0.8, record_count), 3)
+    response_times[rng.random(record_count) < 0.02] = np.nan
+    response_times = [None if np.isnan(value) else value for value in response_times.tolist()]
+    base_time = datetime.now().replace(microsecond=0) - timedelta(days=days)
+    seconds = np.sort(rng.integers(0, days * 86400, record_count))
+    detected_at = [base_time + timedelta(seconds=second) for second in seconds.tolist()]
+    epoch = (np.datetime64(base_time, 'us') + seconds.astype('timedelta64[s]')).astype(np.int64).tolist()
+    weights = [1] * record_count
+    return (
+        list(zip(website_ids, statuses, codes, response_times, detected_at, weights)),
+        list(zip(website_ids, statuses, codes, response_times, epoch, weights)),
+    )
+
+
+def percentile(values, p):
+    """排序后取第 p% 位置的值"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def legacy_statistics(rows):
+    """逐行循环统计"""
+    websites = {}
+    daily = {}
+    histogram = [0] * (len(HISTOGRAM_EDGES) + 1)
+    for website_id, status, _, response_time, detected_at, checks in rows:
+        stats = websites.setdefault(website_id, {
+            'total': 0, 'standard': 0, 'redirect': 0, 'failed': 0, 'response_times': []
+        })
+        stats['total'] += checks
+        stats[status] += checks
+        if response_time is not None:
+            stats['response_times'].append(response_time)
+            bucket = 0
+            while bucket < len(HISTOGRAM_EDGES) and response_time >= HISTOGRAM_EDGES[bucket]:
+                bucket += 1
+            histogram[bucket] += checks
+
+        day = daily.setdefault(detected_at.strftime('%Y-%m-%d'), {'standard': 0, 'redirect': 0, 'failed': 0})
+        day[status] += checks
+
+    result = {}
+    for website_id, stats in websites.items():
+        response_times = stats.pop('response_times')
+        stats['availability'] = round((stats['standard'] + stats['redirect']) / stats['total'] * 100, 2)
+        stats['avg_response_time'] = sum(response_times) / len(response_times) if response_times else 0
+        for p in PERCENTILES:
+            stats[f'p{p}'] = percentile(response_times, p)
+        result[website_id] = stats
+    return result, daily, histogram
+
+
+def vectorized_statistics(rows):
+    """向量化统计（含行转数组）"""
+    frame = DetectionFrame.from_rows(rows)
+    return (
+        analytics_engine.website_statistics(frame, percentiles=PERCENTILES),
+        analytics_engine.daily_series(frame),
+        analytics_engine.histogram(frame, HISTOGRAM_EDGES, include_zero=True),
+    )
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测统计分析基准')
+    parser.add_argument('--records', type=int, default=5000000, help='检测记录数')
+    parser.add_argument('--websites', type=int, default=2000, help='网站数量')
+    parser.add_argument('--days', type=int, default=30, help='时间跨度（天）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--skip-legacy', action='store_true', help='跳过逐行循环（记录数很大时耗时较长）')
+    args = parser.parse_args()
+
+    print(f"生成 {args.records} 条检测记录（{args.websites} 个网站，{args.days} 天）...")
+    rows, projected_rows = make_rows(args.records, args.websites, args.days, args.seed)
+
+    vectorized_time, (websites, daily, histogram) = timed(vectorized_statistics, projected_rows)
+    print(f"\n{'模式':<12}{'耗时(秒)':>12}{'记录/秒':>16}")
+    print(f"{'vectorized':<12}{vectorized_time:>12.2f}{args.records / vectorized_time:>16.0f}")
+
+    if args.skip_legacy:
+        return
+
+    legacy_time, (legacy_websites, legacy_daily, legacy_histogram) = timed(legacy_statistics, rows)
+    print(f"{'legacy':<12}{legacy_time:>12.2f}{args.records / legacy_time:>16.0f}")
+    print(f"\n加速比: {legacy_time / vectorized_time:.1f}x")
+
+    # 结果一致性校验
+    mismatched = [
+        website_id for website_id, stats in legacy_websites.items()
+        if any(stats[key] != websites[website_id][key] for key in ('total', 'standard', 'redirect', 'failed'))
+        or abs(stats['avg_response_time'] - websites[website_id]['avg_response_time']) > 1e-6
+    ]
+    print(f"网站统计不一致: {len(mismatched)}，"
+          f"每日序列一致: {legacy_daily == daily}，直方图一致: {legacy_histogram == histogram}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+检测结果导出基准
+在临时 SQLite 数据库上分批造数，依次导出各格式，记录耗时、峰值内存（tracemalloc）和文件大小；
+对比不同记录数下的峰值内存，流式导出的峰值应基本不随记录数增长
+（tracemalloc 跟踪每次分配，表中的吞吐明显低于实际导出速度）
+
+使用方式:
+    python -m backend.benchmarks.export --records 100000 500000
+    python -m backend.benchmarks.export --records 5000000 --formats csv ndjson
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+STATUSES = ('standard', 'redirect', 'failed')
+FORMATS = ('csv', 'ndjson', 'json', 'excel')
+SEED_BATCH = 50000
+
+
+def seed(website_count: int, record_count: int, start_id: int, rng: random.Random):
+    """追加检测记录，网站不存在时先创建"""
+    from sqlalchemy import func, insert
+
+    from ..database import get_write_db
+    from ..models import DetectionRecord, Website
+
+    now = datetime.now()
+    with get_write_db() as db:
+        if not db.query(func.count(Website.id)).scalar():
+            db.add_all([
+                Website(name=f'示例网站{i}', url=f'https://www.site{i}.example.com/',
+                        domain=f'site{i}.example.com', original_url=f'site{i}.example.com')
+                for i in range(website_count)
+            ])
+
+    for offset in range(0, record_count, SEED_BATCH):
+        rows = []
+        for i in range(start_id + offset, start_id + min(offset + SEED_BATCH, record_count)):
+            status = rng.choices(STATUSES, weights=(80, 12, 8))[0]
+            rows.append({
+                'website_id': rng.randint(1, website_count),
+                'task_id': None,
+                'status': status,
+                'response_time': rng.uniform(0.05, 5) if status != 'failed' else None,
+                'http_status_code': 200 if status == 'standard' else None,
+                'final_url': 'https://example.net/home' if status == 'redirect' else None,
+                'error_message': '连接超时' if status == 'failed' else None,
+                'detected_at': now - timedelta(seconds=i),
+            })
+        with get_write_db() as db:
+            db.execute(insert(DetectionRecord.__table__), rows)
+
+
+def run_export(export_format: str):
+    """执行一次导出，返回 (记录数, 耗时, 峰值内存MB, 文件MB)"""
+    from ..database import get_db
+    from ..services.export_service import ExportService
+
+    service = ExportService()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with get_db() as db:
+        result = service.export_detection_results(db, export_format=export_format)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if not result.success:
+        raise RuntimeError(result.error_message)
+    size = os.path.getsize(result.file_path)
+    os.unlink(result.file_path)
+    return result.record_count, elapsed, peak / 1024 / 1024, size / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测结果导出基准')
+    parser.add_argument('--records', type=int, nargs='+', default=(100000, 300000), help='依次测试的记录总数')
+    parser.add_argument('--websites', type=int, default=2000, help='网站数量')
+    parser.add_argument('--formats', nargs='+', default=FORMATS, choices=FORMATS, help='导出格式')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 应用在导入时读取数据库配置
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        os.environ.setdefault('FLASK_ENV', 'production')
+        os.environ.setdefault('DETECTION_ARCHIVE', 'false')
+
+        from ..app import app  # noqa: F401  初始化数据库和存储布局
+
+        rng = random.Random(args.seed)
+        seeded = 0
+        print(f"{'记录数':>10}  {'格式':<8}{'耗时(秒)':>10}{'记录/秒':>12}{'峰值内存(MB)':>14}{'文件(MB)':>10}")
+        for total in sorted(args.records):
+            seed(args.websites, total - seeded, seeded, rng)
+            seeded = total
+            for export_format in args.formats:
+                count, elapsed, peak, size = run_export(export_format)
+                print(f"{count:>10}  {export_format:<8}{elapsed:>10.2f}{count / elapsed:>12.0f}"
+                      f"{peak:>14.1f}{size:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+列表接口SQL查询数基准
+在临时 SQLite 数据库上造数，统计各列表接口在不同页大小下执行的SQL语句数，
+查询数随页大小增长说明存在逐行懒加载（N+1）；每次测量前清空缓存，统计的是未命中缓存时的查询数
+
+使用方式:
+    python -m backend.benchmarks.query_count --websites 300 --records 3000
+    python -m backend.benchmarks.query_count --check   # 存在随页大小增长的接口时以非0退出
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+STATUSES = ('standard', 'redirect', 'failed')
+
+# (名称, URL模板)，{size} 为页大小
+ENDPOINTS = (
+    ('网站列表', '/api/websites/?per_page={size}'),
+    ('分组列表', '/api/groups/?include_stats=true'),
+    ('分组详情', '/api/groups/1'),
+    ('任务列表', '/api/tasks/?per_page={size}'),
+    ('任务检测结果', '/api/tasks/1/results?per_page={size}'),
+    ('检测结果列表', '/api/results/?per_page={size}'),
+    ('最近状态变化', '/api/status-changes/task/1/recent?limit={size}'),
+    ('最近恢复网站', '/api/status-changes/task/1/recovered?hours=48'),
+    ('失败监控状态', '/api/status-changes/task/1/failed-monitor'),
+)
+
+
+def seed(args):
+    """造数：分组、网站、任务、检测记录、状态变化、失败监控任务"""
+    from ..database import get_write_db
+    from ..models import (
+        WebsiteGroup, Website, DetectionTask, DetectionRecord, WebsiteStatusChange, FailedSiteMonitorTask
+    )
+
+    random.seed(args.seed)
+    now = datetime.now()
+    with get_write_db() as db:
+        groups = [WebsiteGroup(name=f'分组{i}') for i in range(args.groups)]
+        db.add_all(groups)
+        db.flush()
+
+        websites = [
+            Website(name=f'site{i}', url=f'http://site{i}.example.com/', domain=f'site{i}.example.com',
+                    original_url=f'site{i}.example.com', group_id=groups[i % len(groups)].id)
+            for i in range(args.websites)
+        ]
+        db.add_all(websites)
+        db.flush()
+
+        tasks = [DetectionTask(name=f'任务{i}', websites=websites[i::args.tasks]) for i in range(args.tasks)]
+        db.add_all(tasks)
+        db.flush()
+
+        db.bulk_insert_mappings(DetectionRecord, [
+            {
+                'website_id': random.choice(websites).id,
+                'task_id': tasks[0].id,
+                'status': random.choice(STATUSES),
+                'response_time': random.uniform(0.1, 3),
+                'detected_at': now - timedelta(seconds=i * 30),
+            }
+            for i in range(args.records)
+        ])
+        db.bulk_insert_mappings(WebsiteStatusChange, [
+            {
+                'website_id': websites[i % len(websites)].id,
+                'task_id': tasks[0].id,
+                'previous_status': 'failed',
+                'current_status': 'standard',
+                'change_type': 'became_accessible',
+                'detected_at': now - timedelta(minutes=i),
+            }
+            for i in range(min(args.records, 500))
+        ])
+        db.add(FailedSiteMonitorTask(name='失败监控', parent_task_id=tasks[0].id,
+                                     monitored_websites=websites[:args.websites // 2]))
+
+
+def count_queries(client, url: str, engines) -> int:
+    """执行一次请求并返回执行的SQL语句数（只统计当前线程，排除调度等后台线程）"""
+    from sqlalchemy import event
+
+    from ..utils.cache import app_cache, shared_cache
+
+    # 接口结果缓存命中时不执行查询，清空后测量实际查询数
+    app_cache.clear()
+    shared_cache.clear()
+
+    counter = {'queries': 0}
+    thread_id = threading.get_ident()
+
+    def before_execute(*_):
+        if threading.get_ident() == thread_id:
+            counter['queries'] += 1
+
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_execute)
+    try:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_execute)
+    return counter['queries']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列表接口SQL查询数基准')
+    parser.add_argument('--websites', type=int, default=300, help='网站数量')
+    parser.add_argument('--groups', type=int, default=30, help='分组数量')
+    parser.add_argument('--tasks', type=int, default=30, help='任务数量')
+    parser.add_argument('--records', type=int, default=3000, help='检测记录数')
+    parser.add_argument('--sizes', type=int, nargs=2, default=(10, 100), help='对比的两个页大小')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--check', action='store_true', help='查询数随页大小增长时以非0退出')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 应用在导入时读取数据库配置
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        os.environ.setdefault('FLASK_ENV', 'production')
+
+        from ..app import app
+        from ..database import engine, writer_engine
+
+        seed(args)
+        client = app.test_client()
+        engines = {engine, writer_engine}
+
+        small, large = args.sizes
+        print(f"{'接口':<14}{f'页大小{small}':>10}{f'页大小{large}':>10}  结论")
+        unbounded = []
+        for name, template in ENDPOINTS:
+            # 预热一次，排除首次请求的初始化查询
+            client.get(template.format(size=small))
+            small_count = count_queries(client, template.format(size=small), engines)
+            large_count = count_queries(client, template.format(size=large), engines)
+            bounded = large_count <= small_count
+            if not bounded:
+                unbounded.append(name)
+            print(f"{name:<14}{small_count:>10}{large_count:>10}  {'有界' if bounded else '随页大小增长'}")
+
+    if args.check and unbounded:
+        print(f"\n查询数随页大小增长的接口: {', '.join(unbounded)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+SQLite 并发读写基准
+对比旧连接方式（自动提交、无PRAGMA、读写共用连接池）与性能配置
+（WAL + PRAGMA + 单写连接）在 N 个读线程与检测写线程并发时的表现
+
+使用方式:
+    python -m backend.benchmarks.sqlite_concurrency --readers 8 --writers 2 --duration 10
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from ..database import build_engine
+from ..models import Base, Website, DetectionRecord
+
+STATUSES = ('standard', 'redirect', 'failed')
+
+
+def build_legacy_engine(uri: str, busy_timeout: float):
+    """旧连接方式：自动提交模式、无PRAGMA，读写共用一个连接池"""
+    return create_engine(
+        uri,
+        poolclass=QueuePool,
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        connect_args={
+            'check_same_thread': False,
+            'timeout': busy_timeout,
+            'isolation_level': None,
+        }
+    )
+
+
+def make_records(website_count: int, count: int, base_time: datetime):
+    """生成检测记录行"""
+    return [
+        {
+            'website_id': random.randint(1, website_count),
+            'task_id': 1,
+            'status': random.choice(STATUSES),
+            'final_url': 'http://example.com/',
+            'response_time': random.uniform(0.05, 3.0),
+            'http_status_code': 200,
+            'error_message': '',
+            'failure_reason': '',
+            'detected_at': base_time + timedelta(seconds=i),
+            'retry_count': 0,
+        }
+        for i in range(count)
+    ]
+
+
+def seed_database(write_engine, website_count: int, record_count: int):
+    """创建表结构并写入初始数据"""
+    Base.metadata.create_all(bind=write_engine)
+    now = datetime.now()
+    with write_engine.begin() as conn:
+        conn.execute(insert(Website.__table__), [
+            {
+                'name': f'site{i}',
+                'url': f'http://site{i}.example.com/',
+                'url_key': f'{i:064d}',
+                'domain': f'site{i}.example.com',
+                'original_url': f'site{i}.example.com',
+                'normalized_url': f'http://site{i}.example.com/',
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for i in range(1, website_count + 1)
+        ])
+        for start in range(0, record_count, 5000):
+            conn.execute(
+                insert(DetectionRecord.__table__),
+                make_records(website_count, min(5000, record_count - start), now - timedelta(days=1))
+            )
+
+
+def percentile(values, pct: float) -> float:
+    """计算百分位数"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_workload(read_engine, write_engine, args) -> dict:
+    """运行并发读写负载"""
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_latencies, write_latencies = [], []
+    stats = {'reads': 0, 'written_rows': 0, 'read_errors': 0, 'write_errors': 0}
+
+    def reader():
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with read_engine.connect() as conn:
+                    website_id = random.randint(1, args.websites)
+                    conn.execute(text(
+                        "SELECT status, COUNT(*) FROM detection_records "
+                        "WHERE website_id = :website_id GROUP BY status"
+                    ), {'website_id': website_id}).fetchall()
+                    conn.execute(text(
+                        "SELECT id, website_id, status, response_time FROM detection_records "
+                        "ORDER BY detected_at DESC LIMIT 20"
+                    )).fetchall()
+                local.append(time.perf_counter() - started)
+            except OperationalError:
+                with lock:
+                    stats['read_errors'] += 1
+        with lock:
+            read_latencies.extend(local)
+            stats['reads'] += len(local)
+
+    def writer():
+        local = []
+        while not stop.is_set():
+            rows = make_records(args.websites, args.batch, datetime.now())
+            started = time.perf_counter()
+            try:
+                with write_engine.begin() as conn:
+                    conn.execute(insert(DetectionRecord.__table__), rows)
+                local.append(time.perf_counter() - started)
+                with lock:
+                    stats['written_rows'] += len(rows)
+            except OperationalError:
+                with lock:
+                    stats['write_errors'] += 1
+            time.sleep(args.write_interval)
+        with lock:
+            write_latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'reads_per_sec': stats['reads'] / args.duration,
+        'read_p50_ms': percentile(read_latencies, 50) * 1000,
+        'read_p99_ms': percentile(read_latencies, 99) * 1000,
+        'read_max_ms': max(read_latencies, default=0) * 1000,
+        'rows_written_per_sec': stats['written_rows'] / args.duration,
+        'write_p50_ms': percentile(write_latencies, 50) * 1000,
+        'write_p99_ms': percentile(write_latencies, 99) * 1000,
+        'write_max_ms': max(write_latencies, default=0) * 1000,
+        'read_errors': stats['read_errors'],
+        'write_errors': stats['write_errors'],
+    }
+
+
+def run_mode(mode: str, args) -> dict:
+    """在临时数据库上运行指定模式"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+        if mode == 'legacy':
+            read_engine = write_engine = build_legacy_engine(uri, args.busy_timeout)
+        else:
+            read_engine = build_engine(uri)
+            write_engine = build_engine(uri, writer=True)
+
+        try:
+            seed_database(write_engine, args.websites, args.records)
+            return run_workload(read_engine, write_engine, args)
+        finally:
+            read_engine.dispose()
+            write_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 并发读写基准')
+    parser.add_argument('--readers', type=int, default=8, help='读线程数')
+    parser.add_argument('--writers', type=int, default=2, help='写线程数（模拟并发检测任务）')
+    parser.add_argument('--duration', type=float, default=10, help='每种模式运行秒数')
+    parser.add_argument('--batch', type=int, default=50, help='每次写入的检测记录数')
+    parser.add_argument('--write-interval', type=float, default=0.05, help='写入间隔（秒）')
+    parser.add_argument('--websites', type=int, default=500, help='网站数量')
+    parser.add_argument('--records', type=int, default=50000, help='初始检测记录数')
+    parser.add_argument('--busy-timeout', type=float, default=5, help='旧连接方式的锁等待超时（秒）')
+    args = parser.parse_args()
+
+    print(f"读线程 {args.readers}，写线程 {args.writers}，每种模式 {args.duration} 秒")
+    results = {mode: run_mode(mode, args) for mode in ('legacy', 'profile')}
+
+    print(f"\n{'指标':<24}{'legacy':>14}{'profile':>14}")
+    for key in results['legacy']:
+        print(f"{key:<24}{results['legacy'][key]:>14.1f}{results['profile'][key]:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -29,10 +29,21 @@ class Config:
         'pool_recycle': 300,
     }
     
+    # SQLite性能配置（连接建立时通过PRAGMA应用）
+    SQLITE_CONFIG = {
+        'journal_mode': 'WAL',           # WAL日志，读写互不阻塞
+        'synchronous': 'NORMAL',         # WAL模式下安全且减少fsync
+        'mmap_size': 256 * 1024 * 1024,  # 内存映射读取大小（字节）
+        'cache_size': -64 * 1024,        # 页缓存大小（负数表示KiB）
+        'temp_store': 'MEMORY',          # 临时表和排序使用内存
+        'busy_timeout': 60000,           # 锁等待超时（毫秒）
+        'writer_pool_timeout': 60,       # 等待写连接的超时时间（秒）
+    }
+    
     # 文件上传配置
     UPLOAD_FOLDER = str(BASE_DIR / 'uploads')
     DOWNLOAD_FOLDER = str(BASE_DIR / 'downloads')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB 最大文件大小
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 默认16MB 最大文件大小
     ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
     
     # 日志配置
@@ -74,11 +85,101 @@ class Config:
         'log_files_days': 30,           # 日志文件保留天数
         'upload_files_days': 7,         # 上传文件保留天数
     }
+
+    # 历史数据清理配置（按主键区间分块删除）
+    RETENTION_PURGE_CONFIG = {
+        'chunk_size': 1000,             # 每个事务删除的最大行数
+        'rows_per_second': 5000,        # 后台清理的删除速率上限，0表示不限速
+        'interval_hours': 24,           # 定时清理间隔（小时）
+    }
+
+    # 检测记录压缩配置（超过 compact_after_days 的明细汇总为每小时统计后删除）
+    COMPACTION_CONFIG = {
+        'enabled': os.environ.get('DETECTION_COMPACTION', 'true').lower() == 'true',
+        'compact_after_days': 7,        # 保留检测明细的天数
+        'chunk_size': 2000,             # 每个事务汇总的最大记录数
+        'interval_hours': 1,            # 定时压缩间隔（小时）
+        'summary_retention_days': 365,  # 小时汇总保留天数，0表示永久保留
+    }
+
+    # 网站响应时间草图配置（写入检测结果时按网站按小时更新，用于合并求分位数）
+    LATENCY_SKETCH_CONFIG = {
+        'enabled': os.environ.get('LATENCY_SKETCHES', 'true').lower() == 'true',
+        'retention_days': 365,          # 草图保留天数，0表示永久保留
+        'purge_interval_hours': 24,     # 过期草图清理间隔（小时）
+    }
+
+    # 可用时长（SLA）配置（由状态变化记录计算，已结束的自然日结果缓存）
+    UPTIME_CONFIG = {
+        'cache_enabled': True,
+        'cache_delay_minutes': 60,      # 自然日结束后等待多久再缓存（分钟）
+        'default_days': 30,             # 报表默认天数
+    }
+
+    # 检测记录冷归档配置（删除前写入按日期分目录的压缩文件，导出和统计可读取）
+    ARCHIVE_CONFIG = {
+        'enabled': os.environ.get('DETECTION_ARCHIVE', 'true').lower() == 'true',
+        'path': os.environ.get('DETECTION_ARCHIVE_PATH') or str(BASE_DIR / 'archive'),
+        'format': os.environ.get('DETECTION_ARCHIVE_FORMAT', 'auto'),  # auto、parquet 或 ndjson
+    }
+
+    # 检测记录分区存储配置（可选，启用后保留期清理按整个分区删除）
+    DETECTION_PARTITION_CONFIG = {
+        'enabled': os.environ.get('DETECTION_PARTITIONING', 'false').lower() == 'true',
+        'granularity': os.environ.get('DETECTION_PARTITION_GRANULARITY', 'month'),  # month 或 week
+        'premake_periods': 2,           # 提前创建的后续分区数
+    }
+
+    # 变化存储模式配置（可选，连续相同的检测结果合并为一条记录）
+    CHANGE_ONLY_STORAGE_CONFIG = {
+        'enabled': os.environ.get('DETECTION_CHANGE_ONLY', 'false').lower() == 'true',
+        'max_run_hours': 24,            # 单条合并记录覆盖的最长时间（小时），超过后新建记录
+    }
+
+    # 检测结果写入缓冲配置
+    RESULT_WRITER_CONFIG = {
+        'max_batch_size': 500,          # 单次刷写的最大记录数
+        'flush_interval_seconds': 1.0,  # 最长刷写间隔（秒）
+        'max_queue_rows': 20000,        # 队列容量（记录数），满时提交方阻塞
+        'submit_timeout_seconds': 30,   # 队列满时的最长等待时间，超时后同步写入
+        'max_retries': 3,               # 刷写失败重试次数
+    }
+    
+    # 应用缓存配置（进程内 LRU 缓存，按条目数和估算字节数双重限制；共享缓存供多个工作进程共用）
+    CACHE_CONFIG = {
+        'default_ttl': 300,             # 默认过期时间（秒）
+        'max_entries': int(os.environ.get('CACHE_MAX_ENTRIES', 1000)),
+        'max_bytes': int(os.environ.get('CACHE_MAX_MB', 64)) * 1024 * 1024,
+        'shared_backend': os.environ.get('CACHE_BACKEND', 'auto'),  # auto、memory、sqlite 或 redis
+        'sqlite_path': os.environ.get('CACHE_SQLITE_PATH') or str(BASE_DIR / 'database' / 'cache.db'),
+        'redis_url': os.environ.get('REDIS_URL'),
+        'shared_max_entries': 10000,    # sqlite 共享缓存最大条目数
+    }
+
+    # 响应压缩配置（无 nginx 前置时由应用压缩；已由 nginx 压缩的部署可关闭）
+    COMPRESSION_CONFIG = {
+        'enabled': os.environ.get('RESPONSE_COMPRESSION', 'true').lower() == 'true',
+        'min_size': 1024,               # 普通响应的最小压缩字节数，流式响应始终压缩
+        'gzip_level': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+        'brotli_quality': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)),
+    }
+
+    # 后台导出任务配置
+    EXPORT_JOB_CONFIG = {
+        'max_workers': int(os.environ.get('EXPORT_MAX_WORKERS', 2)),  # 同时执行的导出任务数
+        'expire_hours': int(os.environ.get('EXPORT_EXPIRE_HOURS', 24)),  # 结果文件保留时间（小时）
+        'progress_interval_seconds': 1.0,  # 进度写入数据库的最短间隔（秒）
+        'purge_interval_hours': 1,      # 过期任务清理间隔（小时）
+    }
+
+    # 网站导入配置
+    IMPORT_CONFIG = {
+        'chunk_size': 1000,             # 流式导入每块行数
+    }
     
     # API配置
     API_CONFIG = {
         'pagination_per_page': 50,      # 分页每页数量
-        'max_export_records': 10000,    # 最大导出记录数
     }
 
 
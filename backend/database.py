@@ -3,9 +3,11 @@
 """
 
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool, QueuePool
+from sqlalchemy.sql import Insert, Update, Delete
+from sqlalchemy.sql.elements import TextClause
 from contextlib import contextmanager
 from .config import get_config
 from .models import Base, db
@@ -15,31 +17,141 @@ logger = logging.getLogger(__name__)
 # 获取配置
 config = get_config()
 
-# 创建数据库引擎 - 优化资源占用配置
-engine = create_engine(
-    config.SQLALCHEMY_DATABASE_URI,
-    echo=getattr(config, 'SQLALCHEMY_ECHO', False),
-    # 进一步优化连接池配置 - 大幅降低资源占用
-    poolclass=QueuePool,
-    pool_size=5,                  # 连接池大小（适度增加到5）
-    max_overflow=10,              # 最大溢出连接数（增加到10）
-    pool_timeout=30,              # 获取连接超时时间（增加到30秒）
-    pool_recycle=1800,            # 连接回收时间(30分钟)
-    pool_pre_ping=True,           # 连接前检查
-    # SQLite优化配置
-    connect_args={
-        "check_same_thread": False,  # SQLite特有配置
-        "timeout": 60,               # SQLite连接超时
-        "isolation_level": None,     # 自动提交模式
-    } if 'sqlite' in config.SQLALCHEMY_DATABASE_URI else {
-        # PostgreSQL/MySQL 优化配置 - 修复PyMySQL兼容性问题
-        "connect_timeout": 60,
-        "charset": "utf8mb4"         # 替换server_side_cursors为charset配置
-    }
-)
+IS_SQLITE = config.SQLALCHEMY_DATABASE_URI.startswith('sqlite')
+SQLITE_CONFIG = getattr(config, 'SQLITE_CONFIG', {})
+
+# 会直接修改数据的原生SQL语句
+WRITE_STATEMENT_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict = None):
+    """
+    为SQLite连接应用性能PRAGMA
+
+    Args:
+        dbapi_connection: sqlite3 原始连接
+        pragmas: PRAGMA配置，默认使用 Config.SQLITE_CONFIG
+    """
+    pragmas = SQLITE_CONFIG if pragmas is None else pragmas
+    cursor = dbapi_connection.cursor()
+    try:
+        for name in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store', 'busy_timeout'):
+            if pragmas.get(name) is not None:
+                cursor.execute(f"PRAGMA {name} = {pragmas[name]}")
+    finally:
+        cursor.close()
+
+
+def _setup_sqlite_engine(sqlite_engine, begin_statement: str):
+    """
+    注册SQLite连接事件
+    pysqlite 以 isolation_level=None 打开连接，由事件显式发出 BEGIN，
+    使事务边界与 SQLAlchemy 会话一致（写连接使用 BEGIN IMMEDIATE 提前获取写锁）
+    """
+
+    @event.listens_for(sqlite_engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+
+    @event.listens_for(sqlite_engine, 'begin')
+    def _on_begin(conn):
+        conn.exec_driver_sql(begin_statement)
+
+
+def build_engine(uri: str = None, writer: bool = False):
+    """
+    创建数据库引擎
+
+    Args:
+        uri: 数据库连接地址，默认使用配置
+        writer: 是否为SQLite专用写引擎（单连接，写操作在进程内排队）
+
+    Returns:
+        数据库引擎
+    """
+    uri = uri or config.SQLALCHEMY_DATABASE_URI
+    is_sqlite = uri.startswith('sqlite')
+
+    if is_sqlite:
+        pool_options = {
+            'pool_size': 1 if writer else 5,
+            'max_overflow': 0 if writer else 10,
+            'pool_timeout': SQLITE_CONFIG.get('writer_pool_timeout', 60) if writer else 30,
+        }
+        connect_args = {
+            "check_same_thread": False,  # SQLite特有配置
+            "timeout": 60,               # SQLite连接超时
+            "isolation_level": None,     # 由begin事件显式管理事务
+        }
+    else:
+        pool_options = {
+            'pool_size': 5,              # 连接池大小（适度增加到5）
+            'max_overflow': 10,          # 最大溢出连接数（增加到10）
+            'pool_timeout': 30,          # 获取连接超时时间（增加到30秒）
+        }
+        connect_args = {
+            # PostgreSQL/MySQL 优化配置 - 修复PyMySQL兼容性问题
+            "connect_timeout": 60,
+            "charset": "utf8mb4"         # 替换server_side_cursors为charset配置
+        }
+
+    new_engine = create_engine(
+        uri,
+        echo=getattr(config, 'SQLALCHEMY_ECHO', False),
+        poolclass=QueuePool,
+        pool_recycle=1800,            # 连接回收时间(30分钟)
+        pool_pre_ping=True,           # 连接前检查
+        connect_args=connect_args,
+        **pool_options
+    )
+
+    if is_sqlite:
+        _setup_sqlite_engine(new_engine, 'BEGIN IMMEDIATE' if writer else 'BEGIN')
+
+    return new_engine
+
+
+# 创建数据库引擎 - 读操作使用连接池
+engine = build_engine()
+
+# SQLite 写操作统一经过单个写连接串行执行，避免多个连接争抢写锁出现 "database is locked"
+writer_engine = build_engine(writer=True) if IS_SQLITE else engine
+
+
+class RoutingSession(Session):
+    """
+    读写分离会话
+    flush 和 INSERT/UPDATE/DELETE 语句使用写引擎，其余查询使用读连接池；
+    事务中一旦发生写操作，后续查询也使用写连接以读取未提交的数据
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get('writer_only'):
+            return writer_engine
+        if self.info.get('use_writer') or self._flushing or self._is_write_clause(clause):
+            self.info['use_writer'] = True
+            return writer_engine
+        return engine
+
+    @staticmethod
+    def _is_write_clause(clause) -> bool:
+        if isinstance(clause, (Insert, Update, Delete)):
+            return True
+        if isinstance(clause, TextClause):
+            return clause.text.lstrip().upper().startswith(WRITE_STATEMENT_PREFIXES)
+        return False
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_writer_binding(session, transaction):
+    """事务结束后释放写连接绑定"""
+    if transaction.parent is None:
+        session.info.pop('use_writer', None)
+
 
 # 创建会话工厂
 SessionLocal = sessionmaker(
+    class_=RoutingSession if IS_SQLITE else Session,
     autocommit=False, 
     autoflush=False, 
     bind=engine,
@@ -80,11 +192,31 @@ def create_session():
     return SessionLocal()
 
 
+@contextmanager
+def get_write_db():
+    """
+    获取写会话（上下文管理器）
+    所有语句都在写连接上执行，适合先读后写、需要读取自身写入的批量操作
+    """
+    db = SessionLocal()
+    db.info['writer_only'] = True
+    try:
+        yield db
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 def close_all_connections():
     """关闭所有数据库连接"""
     try:
         # 关闭所有活跃连接
         engine.dispose()
+        if writer_engine is not engine:
+            writer_engine.dispose()
         logger.info("所有数据库连接已关闭")
     except Exception as e:
         logger.error(f"关闭数据库连接时出错: {e}")
@@ -94,13 +226,18 @@ def get_connection_stats():
     """获取连接池统计信息"""
     try:
         pool = engine.pool
-        return {
+        stats = {
             'pool_size': pool.size(),
             'checked_in': pool.checkedin(),
             'checked_out': pool.checkedout(),
             'overflow': pool.overflow(),
-            'invalid': pool.invalidated()
         }
+        if writer_engine is not engine:
+            stats['writer'] = {
+                'pool_size': writer_engine.pool.size(),
+                'checked_out': writer_engine.pool.checkedout(),
+            }
+        return stats
     except Exception as e:
         logger.error(f"获取连接池统计信息失败: {e}")
         return None
\ No newline at end of file
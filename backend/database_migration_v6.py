@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本 v6
+为网站表添加标准化网址去重键 url_key 并建立唯一索引
+"""
+
+import sqlite3
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.helpers import make_url_key
+
+BATCH_SIZE = 1000
+
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = '../database/website_monitor.db'
+
+    if not os.path.exists(db_path):
+        print("数据库文件不存在，跳过迁移")
+        return
+
+    print("开始数据库迁移 v6...")
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        # 检查网站表是否已有url_key字段
+        cursor.execute("PRAGMA table_info(websites)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if 'url_key' not in columns:
+            print("添加 url_key 字段到 websites 表...")
+            cursor.execute("ALTER TABLE websites ADD COLUMN url_key VARCHAR(64)")
+            print("url_key 字段添加成功")
+        else:
+            print("url_key 字段已存在，跳过")
+
+        # 按ID分批回填去重键，重复网址只保留ID最小的一条
+        print("回填 url_key...")
+        seen_keys = set(
+            row[0] for row in cursor.execute("SELECT url_key FROM websites WHERE url_key IS NOT NULL")
+        )
+        duplicates = []
+        filled_count = 0
+        last_id = 0
+
+        while True:
+            cursor.execute("""
+                SELECT id, url FROM websites
+                WHERE id > ? AND url_key IS NULL
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, BATCH_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for website_id, url in rows:
+                key = make_url_key(url)
+                if not key:
+                    continue
+                if key in seen_keys:
+                    duplicates.append((website_id, url))
+                    continue
+                seen_keys.add(key)
+                updates.append((key, website_id))
+
+            cursor.executemany("UPDATE websites SET url_key = ? WHERE id = ?", updates)
+            filled_count += len(updates)
+            last_id = rows[-1][0]
+
+        print(f"回填 {filled_count} 个网站的 url_key")
+
+        if duplicates:
+            print(f"发现 {len(duplicates)} 个重复网址，url_key 保持为空，请手动清理:")
+            for website_id, url in duplicates:
+                print(f"  ID {website_id}: {url}")
+
+        # 创建唯一索引（与模型定义的索引名一致）
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_websites_url_key
+            ON websites(url_key)
+        """)
+        print("创建 ix_websites_url_key 唯一索引")
+
+        conn.commit()
+        print("数据库迁移 v6 完成！")
+
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    migrate_database()
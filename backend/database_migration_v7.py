@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本 v7
+为检测记录表（含分区表）添加变化存储模式所需的字段：
+last_seen_at、check_count、min_response_time、max_response_time
+"""
+
+import sqlite3
+import os
+
+# 新增字段及类型
+NEW_COLUMNS = (
+    ('last_seen_at', 'DATETIME'),
+    ('check_count', 'INTEGER DEFAULT 1'),
+    ('min_response_time', 'FLOAT'),
+    ('max_response_time', 'FLOAT'),
+)
+
+
+def migrate_database():
+    """执行数据库迁移"""
+    db_path = '../database/website_monitor.db'
+
+    if not os.path.exists(db_path):
+        print("数据库文件不存在，跳过迁移")
+        return
+
+    print("开始数据库迁移 v7...")
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        # 基础表及分区存储创建的分区表
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND (name = 'detection_records' OR name LIKE 'detection_records_p%')
+            ORDER BY name
+        """)
+        tables = [row[0] for row in cursor.fetchall()]
+
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [column[1] for column in cursor.fetchall()]
+
+            for name, column_type in NEW_COLUMNS:
+                if name not in columns:
+                    print(f"添加 {name} 字段到 {table} 表...")
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                else:
+                    print(f"{table}.{name} 字段已存在，跳过")
+
+        conn.commit()
+        print("数据库迁移 v7 完成！")
+
+    except Exception as e:
+        print(f"迁移失败: {e}")
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    migrate_database()
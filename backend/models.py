@@ -4,9 +4,14 @@
 """
 
 from datetime import datetime, timezone, timedelta
+from typing import Optional
+
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Index, text
+from sqlalchemy import Index, func, select, text
 from sqlalchemy.dialects.sqlite import JSON
+from sqlalchemy.orm import object_session, validates
+
+from .utils.helpers import make_url_key
 
 # 北京时区
 BEIJING_TZ = timezone(timedelta(hours=8))
@@ -40,15 +45,22 @@ class WebsiteGroup(db.Model):
     def __repr__(self):
         return f'<WebsiteGroup {self.name}>'
     
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, website_count: Optional[int] = None):
+        """
+        转换为字典
+        
+        Args:
+            website_count: 预先分组统计的网站数量（列表接口传入，避免逐个分组查询）
+        """
+        if website_count is None:
+            website_count = self.websites.count()
         return {
             'id': self.id,
             'name': self.name,
             'description': self.description,
             'color': self.color,
             'is_default': self.is_default,
-            'website_count': self.websites.count(),
+            'website_count': website_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -64,6 +76,7 @@ class Website(db.Model):
     domain = db.Column(db.String(255), nullable=False, index=True, comment='中文域名')
     original_url = db.Column(db.Text, nullable=False, comment='原始网址')
     normalized_url = db.Column(db.Text, comment='标准化网址')
+    url_key = db.Column(db.String(64), unique=True, index=True, comment='标准化网址哈希（去重键）')
     description = db.Column(db.Text, comment='网站描述')
     group_id = db.Column(db.Integer, db.ForeignKey('website_groups.id'), index=True, comment='所属分组ID')
     is_active = db.Column(db.Boolean, default=True, nullable=False, index=True, comment='是否激活')
@@ -72,6 +85,9 @@ class Website(db.Model):
     
     # 关联关系
     detection_records = db.relationship('DetectionRecord', backref='website', lazy='dynamic', cascade='all, delete-orphan')
+    hourly_summaries = db.relationship('DetectionHourlySummary', backref='website', lazy='dynamic', cascade='all, delete-orphan')
+    latency_sketches = db.relationship('WebsiteLatencySketch', backref='website', lazy='dynamic', cascade='all, delete-orphan')
+    daily_uptimes = db.relationship('WebsiteDailyUptime', backref='website', lazy='dynamic', cascade='all, delete-orphan')
     
     # 索引
     __table_args__ = (
@@ -82,6 +98,12 @@ class Website(db.Model):
     def __repr__(self):
         return f'<Website {self.domain}>'
     
+    @validates('url')
+    def _sync_url_key(self, key, value):
+        """设置URL时同步更新去重键"""
+        self.url_key = make_url_key(value)
+        return value
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -129,6 +151,12 @@ class DetectionRecord(db.Model):
     retry_count = db.Column(db.Integer, default=0, comment='重试次数')
     detection_duration = db.Column(db.Float, comment='检测耗时(秒)')
     
+    # 连续相同结果合并（仅变化存储模式下 check_count 可能大于1，response_time 为平均值）
+    last_seen_at = db.Column(db.DateTime, comment='最后一次检测时间')
+    check_count = db.Column(db.Integer, default=1, comment='合并的检测次数')
+    min_response_time = db.Column(db.Float, comment='最小响应时间(秒)')
+    max_response_time = db.Column(db.Float, comment='最大响应时间(秒)')
+    
     # 索引
     __table_args__ = (
         Index('idx_detection_website_time', website_id, detected_at),
@@ -158,9 +186,90 @@ class DetectionRecord(db.Model):
             'detected_at': self.detected_at.isoformat() if self.detected_at else None,
             'retry_count': self.retry_count,
             'detection_duration': self.detection_duration,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None,
+            'check_count': self.check_count or 1,
+            'min_response_time': self.min_response_time,
+            'max_response_time': self.max_response_time,
         }
 
 
+class DetectionHourlySummary(db.Model):
+    """检测记录小时汇总模型（压缩后的历史检测数据）"""
+    __tablename__ = 'detection_hourly_summaries'
+
+    id = db.Column(db.Integer, primary_key=True, comment='汇总ID')
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False, comment='网站ID')
+    hour_start = db.Column(db.DateTime, nullable=False, index=True, comment='小时起始时间')
+
+    # 各状态检测次数
+    total_count = db.Column(db.Integer, default=0, nullable=False, comment='检测次数')
+    standard_count = db.Column(db.Integer, default=0, nullable=False, comment='标准解析次数')
+    redirect_count = db.Column(db.Integer, default=0, nullable=False, comment='跳转解析次数')
+    failed_count = db.Column(db.Integer, default=0, nullable=False, comment='失败次数')
+
+    # 响应时间
+    response_time_sum = db.Column(db.Float, default=0.0, nullable=False, comment='响应时间总和(秒)')
+    response_time_count = db.Column(db.Integer, default=0, nullable=False, comment='有响应时间的检测次数')
+    min_response_time = db.Column(db.Float, comment='最小响应时间(秒)')
+    max_response_time = db.Column(db.Float, comment='最大响应时间(秒)')
+    latency_sketch = db.Column(db.LargeBinary, comment='响应时间分位数草图')
+
+    # 失败原因
+    first_failure_at = db.Column(db.DateTime, comment='首次失败时间')
+    first_failure_reason = db.Column(db.String(50), comment='首次失败原因')
+    last_failure_at = db.Column(db.DateTime, comment='最后一次失败时间')
+    last_failure_reason = db.Column(db.String(50), comment='最后一次失败原因')
+
+    updated_at = db.Column(db.DateTime, default=get_beijing_time, onupdate=get_beijing_time, comment='更新时间')
+
+    # 索引
+    __table_args__ = (
+        Index('idx_hourly_summary_website_hour', website_id, hour_start, unique=True),
+    )
+
+    def __repr__(self):
+        return f'<DetectionHourlySummary {self.website_id}:{self.hour_start}>'
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'website_id': self.website_id,
+            'hour_start': self.hour_start.isoformat() if self.hour_start else None,
+            'total_count': self.total_count,
+            'standard_count': self.standard_count,
+            'redirect_count': self.redirect_count,
+            'failed_count': self.failed_count,
+            'avg_response_time': self.response_time_sum / self.response_time_count if self.response_time_count else None,
+            'min_response_time': self.min_response_time,
+            'max_response_time': self.max_response_time,
+            'first_failure_at': self.first_failure_at.isoformat() if self.first_failure_at else None,
+            'first_failure_reason': self.first_failure_reason,
+            'last_failure_at': self.last_failure_at.isoformat() if self.last_failure_at else None,
+            'last_failure_reason': self.last_failure_reason,
+        }
+
+
+class WebsiteLatencySketch(db.Model):
+    """网站响应时间小时草图模型（写入检测结果时更新，可合并求分位数）"""
+    __tablename__ = 'website_latency_sketches'
+
+    id = db.Column(db.Integer, primary_key=True, comment='草图ID')
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False, comment='网站ID')
+    hour_start = db.Column(db.DateTime, nullable=False, index=True, comment='小时起始时间')
+    sample_count = db.Column(db.Integer, default=0, nullable=False, comment='记录的响应时间个数')
+    sketch = db.Column(db.LargeBinary, nullable=False, comment='响应时间分位数草图')
+    updated_at = db.Column(db.DateTime, default=get_beijing_time, onupdate=get_beijing_time, comment='更新时间')
+
+    # 索引
+    __table_args__ = (
+        Index('idx_latency_sketch_website_hour', website_id, hour_start, unique=True),
+    )
+
+    def __repr__(self):
+        return f'<WebsiteLatencySketch {self.website_id}:{self.hour_start}>'
+
+
 class DetectionTask(db.Model):
     """检测任务模型"""
     __tablename__ = 'detection_tasks'
@@ -314,6 +423,58 @@ class UploadRecord(db.Model):
         }
 
 
+class ExportJob(db.Model):
+    """后台导出任务模型"""
+    __tablename__ = 'export_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True, comment='任务ID')
+    export_type = db.Column(db.String(30), nullable=False, default='detection_results', comment='导出类型')
+    export_format = db.Column(db.String(20), nullable=False, comment='导出格式')
+    params = db.Column(JSON, comment='导出参数')
+    
+    # 状态：pending(排队中), running(导出中), cancelling(取消中), completed(完成),
+    # failed(失败), cancelled(已取消), expired(已过期)
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True, comment='任务状态')
+    progress = db.Column(db.Float, default=0, comment='进度百分比')
+    total_rows = db.Column(db.Integer, comment='预计总行数')
+    processed_rows = db.Column(db.Integer, default=0, comment='已导出行数')
+    error_message = db.Column(db.Text, comment='错误信息')
+    
+    # 结果文件
+    file_name = db.Column(db.String(255), comment='结果文件名')
+    file_size = db.Column(db.BigInteger, comment='结果文件大小(字节)')
+    
+    # 时间信息
+    created_at = db.Column(db.DateTime, default=get_beijing_time, nullable=False, index=True, comment='创建时间')
+    started_at = db.Column(db.DateTime, comment='开始时间')
+    finished_at = db.Column(db.DateTime, comment='结束时间')
+    expires_at = db.Column(db.DateTime, index=True, comment='结果过期时间')
+    
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'export_type': self.export_type,
+            'export_format': self.export_format,
+            'params': self.params,
+            'status': self.status,
+            'progress': round(self.progress or 0, 1),
+            'total_rows': self.total_rows,
+            'processed_rows': self.processed_rows or 0,
+            'error_message': self.error_message,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'download_url': f'/api/results/export/jobs/{self.id}/download' if self.status == 'completed' else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+
 class UserFile(db.Model):
     """用户文件管理模型"""
     __tablename__ = 'user_files'
@@ -376,7 +537,10 @@ class WebsiteStatusChange(db.Model):
     
     # 变化时间
     detected_at = db.Column(db.DateTime, default=get_beijing_time, nullable=False, index=True, comment='检测到变化的时间')
-    
+
+    # 关系（列表查询通过 contains_eager/joinedload 随变化记录一次加载）
+    website = db.relationship('Website')
+
     # 索引
     __table_args__ = (
         Index('idx_status_change_website_time', website_id, detected_at),
@@ -403,6 +567,31 @@ class WebsiteStatusChange(db.Model):
         }
 
 
+class WebsiteDailyUptime(db.Model):
+    """网站每日可用时长模型（由状态变化记录计算的已结束自然日结果缓存）"""
+    __tablename__ = 'website_daily_uptime'
+
+    id = db.Column(db.Integer, primary_key=True, comment='记录ID')
+    website_id = db.Column(db.Integer, db.ForeignKey('websites.id'), nullable=False, comment='网站ID')
+    day = db.Column(db.Date, nullable=False, index=True, comment='日期')
+
+    observed_seconds = db.Column(db.Float, default=0.0, nullable=False, comment='有监控数据的时长(秒)')
+    downtime_seconds = db.Column(db.Float, default=0.0, nullable=False, comment='不可访问时长(秒)')
+    failure_count = db.Column(db.Integer, default=0, nullable=False, comment='当日开始的故障次数')
+    recovery_count = db.Column(db.Integer, default=0, nullable=False, comment='当日恢复的故障次数')
+    repair_seconds = db.Column(db.Float, default=0.0, nullable=False, comment='当日恢复的故障总时长(秒)')
+
+    computed_at = db.Column(db.DateTime, default=get_beijing_time, onupdate=get_beijing_time, comment='计算时间')
+
+    # 索引
+    __table_args__ = (
+        Index('idx_daily_uptime_website_day', website_id, day, unique=True),
+    )
+
+    def __repr__(self):
+        return f'<WebsiteDailyUptime {self.website_id}:{self.day}>'
+
+
 class FailedSiteMonitorTask(db.Model):
     """失败网站专项监控任务模型"""
     __tablename__ = 'failed_site_monitor_tasks'
@@ -437,8 +626,25 @@ class FailedSiteMonitorTask(db.Model):
     def __repr__(self):
         return f'<FailedSiteMonitorTask {self.name}>'
     
-    def to_dict(self):
-        """转换为字典"""
+    def count_monitored_websites(self) -> int:
+        """监控网站数量（已加载关联时直接计数，否则只查询关联表计数，不加载网站）"""
+        if 'monitored_websites' in self.__dict__:
+            return len(self.monitored_websites)
+        return object_session(self).scalar(
+            select(func.count()).select_from(failed_site_monitor_websites).where(
+                failed_site_monitor_websites.c.monitor_task_id == self.id
+            )
+        ) or 0
+    
+    def to_dict(self, monitored_websites_count: Optional[int] = None):
+        """
+        转换为字典
+        
+        Args:
+            monitored_websites_count: 预先统计的监控网站数量
+        """
+        if monitored_websites_count is None:
+            monitored_websites_count = self.count_monitored_websites()
         return {
             'id': self.id,
             'name': self.name,
@@ -451,7 +657,7 @@ class FailedSiteMonitorTask(db.Model):
             'retry_times': self.retry_times,
             'is_active': self.is_active,
             'is_running': self.is_running,
-            'monitored_websites_count': len(self.monitored_websites),
+            'monitored_websites_count': monitored_websites_count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
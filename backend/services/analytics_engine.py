@@ -0,0 +1,396 @@
+"""
+检测统计分析引擎
+用一次投影查询把 (网站ID, 状态, HTTP状态码, 响应时间, 检测时间, 检测次数) 读入 NumPy 数组，
+按网站的可用率、分位数、每日/每小时序列和响应时间直方图均用向量化分组计算
+（np.unique 映射分组、np.bincount 计数、np.lexsort + np.searchsorted 求分组分位数），
+结果统计、统计导出和性能监控接口共用
+- 变化存储模式下的合并记录按 check_count 加权
+"""
+
+import logging
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+from .detection_storage import detection_storage
+
+logger = logging.getLogger(__name__)
+
+# 状态编码（数组中按序号存储，未知状态编码为 len(STATUSES)）
+STATUSES = ('standard', 'redirect', 'failed')
+STATUS_INDEX = {status: index for index, status in enumerate(STATUSES)}
+OTHER_STATUS = len(STATUSES)
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+DAY = np.timedelta64(1, 'D')
+HOUR = np.timedelta64(1, 'h')
+
+
+class DetectionFrame:
+    """列式检测记录（NumPy 数组）"""
+
+    __slots__ = ('website_ids', 'status', 'http_status_code', 'response_time',
+                 'detected_at', 'weights', 'failure_reasons')
+
+    def __init__(self, website_ids: np.ndarray, status: np.ndarray, http_status_code: np.ndarray,
+                 response_time: np.ndarray, detected_at: np.ndarray, weights: np.ndarray,
+                 failure_reasons: Optional[np.ndarray] = None):
+        self.website_ids = website_ids
+        self.status = status
+        self.http_status_code = http_status_code
+        self.response_time = response_time
+        self.detected_at = detected_at
+        self.weights = weights
+        self.failure_reasons = failure_reasons
+
+    def __len__(self) -> int:
+        return len(self.website_ids)
+
+    @classmethod
+    def from_columns(cls, website_ids: Sequence[int], statuses: Sequence[str],
+                     http_status_codes: Sequence[Optional[int]], response_times: Sequence[Optional[float]],
+                     detected_at: Sequence, weights: Sequence[Optional[int]] = None,
+                     failure_reasons: Sequence[Optional[str]] = None) -> 'DetectionFrame':
+        """
+        由列数据构建（检测时间为 datetime 或自 1970-01-01 起的微秒数；
+        空值：HTTP状态码记为0，响应时间记为NaN，检测次数记为1）
+        """
+        count = len(website_ids)
+        frame = cls(
+            website_ids=np.fromiter(website_ids, dtype=np.int64, count=count),
+            status=np.fromiter((STATUS_INDEX.get(status, OTHER_STATUS) for status in statuses),
+                               dtype=np.int8, count=count),
+            http_status_code=np.fromiter((code or 0 for code in http_status_codes), dtype=np.int32, count=count),
+            response_time=np.fromiter((np.nan if value is None else value for value in response_times),
+                                      dtype=np.float64, count=count),
+            detected_at=_to_datetime64(detected_at, count),
+            weights=np.fromiter((weight or 1 for weight in weights), dtype=np.int64, count=count)
+            if weights is not None else np.ones(count, dtype=np.int64),
+        )
+        if failure_reasons is not None:
+            frame.failure_reasons = np.array([reason or 'unknown' for reason in failure_reasons], dtype=object)
+        return frame
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence]) -> 'DetectionFrame':
+        """由投影查询的行构建（按列逐个取值，比 zip(*rows) 转置快）"""
+        if not rows:
+            return cls.empty()
+        return cls.from_columns(*(list(map(itemgetter(index), rows)) for index in range(len(rows[0]))))
+
+    @classmethod
+    def empty(cls) -> 'DetectionFrame':
+        return cls.from_columns([], [], [], [], [], [])
+
+    @property
+    def total_checks(self) -> int:
+        return int(self.weights.sum())
+
+    def response_mask(self, include_zero: bool = True) -> np.ndarray:
+        """有响应时间的记录（include_zero=False 时排除0秒，通常是连接失败）"""
+        mask = ~np.isnan(self.response_time)
+        if not include_zero:
+            mask &= self.response_time > 0
+        return mask
+
+    def select(self, mask: np.ndarray) -> 'DetectionFrame':
+        """按布尔掩码筛选"""
+        return DetectionFrame(
+            self.website_ids[mask], self.status[mask], self.http_status_code[mask],
+            self.response_time[mask], self.detected_at[mask], self.weights[mask],
+            self.failure_reasons[mask] if self.failure_reasons is not None else None,
+        )
+
+
+class AnalyticsEngine:
+    """检测统计分析引擎"""
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+
+    def load_frame(self, db, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                   website_ids: Optional[Iterable[int]] = None, task_id: Optional[int] = None,
+                   with_failure_reason: bool = False) -> DetectionFrame:
+        """
+        用一次投影查询加载检测记录列
+
+        Args:
+            db: 数据库会话
+            start_date: 起始时间
+            end_date: 结束时间
+            website_ids: 网站ID列表
+            task_id: 任务ID
+            with_failure_reason: 是否加载失败原因列
+
+        Returns:
+            列式检测记录
+        """
+        start_date = start_date.replace(tzinfo=None) if start_date else None
+        end_date = end_date.replace(tzinfo=None) if end_date else None
+
+        R = detection_storage.record_source(start_date, end_date)
+        columns = [
+            R.website_id, R.status, R.http_status_code, R.response_time,
+            epoch_microseconds(R.detected_at, db.get_bind().dialect.name),
+            detection_storage.check_weight(R)
+        ]
+        if with_failure_reason:
+            columns.append(R.failure_reason)
+
+        query = select(*columns).where(*detection_storage.window_conditions(R, start_date, end_date))
+        if website_ids:
+            query = query.where(R.website_id.in_(list(website_ids)))
+        if task_id:
+            query = query.where(R.task_id == task_id)
+
+        return DetectionFrame.from_rows(db.execute(query).all())
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def status_counts(frame: DetectionFrame) -> Dict[str, int]:
+        """各状态检测次数"""
+        counts = np.bincount(frame.status, weights=frame.weights, minlength=OTHER_STATUS + 1)
+        return {status: int(counts[index]) for index, status in enumerate(STATUSES)}
+
+    @staticmethod
+    def response_time_summary(frame: DetectionFrame, include_zero: bool = True,
+                              percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict:
+        """
+        响应时间汇总（加权平均、最小、最大、分位数）
+
+        Returns:
+            {'count', 'sum', 'avg', 'min', 'max', 'p50', ...}，没有数据时 count 为0
+        """
+        mask = frame.response_mask(include_zero)
+        values = frame.response_time[mask]
+        weights = frame.weights[mask]
+        if not len(values):
+            return {'count': 0, 'sum': 0.0}
+
+        total = float((values * weights).sum())
+        count = int(weights.sum())
+        summary = {
+            'count': count,
+            'sum': total,
+            'avg': total / count,
+            'min': float(values.min()),
+            'max': float(values.max()),
+        }
+        summary.update(zip(
+            (f'p{p:g}' for p in percentiles),
+            weighted_percentiles(values, weights, percentiles).tolist()
+        ))
+        return summary
+
+    @staticmethod
+    def website_statistics(frame: DetectionFrame, include_zero: bool = True,
+                           percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[int, Dict]:
+        """
+        按网站分组统计
+
+        Returns:
+            {网站ID: {'total', 'standard', 'redirect', 'failed', 'availability',
+                      'response_time_sum', 'response_time_count', 'avg_response_time', 'p50', ...}}
+        """
+        if not len(frame):
+            return {}
+
+        website_ids, groups = np.unique(frame.website_ids, return_inverse=True)
+        group_count = len(website_ids)
+
+        # 各网站各状态检测次数：分组序号 × 状态数 + 状态 作为 bincount 的桶
+        width = OTHER_STATUS + 1
+        status_matrix = np.bincount(
+            groups * width + frame.status, weights=frame.weights, minlength=group_count * width
+        ).reshape(group_count, width)
+        totals = status_matrix.sum(axis=1)
+        success = status_matrix[:, STATUS_INDEX['standard']] + status_matrix[:, STATUS_INDEX['redirect']]
+        availability = np.divide(success * 100.0, totals, out=np.zeros(group_count), where=totals > 0)
+
+        # 响应时间
+        mask = frame.response_mask(include_zero)
+        values = frame.response_time[mask]
+        weights = frame.weights[mask]
+        value_groups = groups[mask]
+        rt_sum = np.bincount(value_groups, weights=values * weights, minlength=group_count)
+        rt_count = np.bincount(value_groups, weights=weights, minlength=group_count)
+        rt_avg = np.divide(rt_sum, rt_count, out=np.zeros(group_count), where=rt_count > 0)
+        group_percentiles = grouped_weighted_percentiles(value_groups, values, weights, group_count, percentiles)
+
+        result = {}
+        for index, website_id in enumerate(website_ids.tolist()):
+            stats = {
+                'total': int(totals[index]),
+                'availability': round(float(availability[index]), 2),
+                'response_time_sum': float(rt_sum[index]),
+                'response_time_count': int(rt_count[index]),
+                'avg_response_time': float(rt_avg[index]),
+            }
+            for status, status_index in STATUS_INDEX.items():
+                stats[status] = int(status_matrix[index, status_index])
+            for p, column in zip(percentiles, group_percentiles):
+                stats[f'p{p:g}'] = None if np.isnan(column[index]) else float(column[index])
+            result[website_id] = stats
+        return result
+
+    @staticmethod
+    def daily_series(frame: DetectionFrame) -> Dict[str, Dict[str, int]]:
+        """每日各状态检测次数 {YYYY-MM-DD: {状态: 次数}}"""
+        if not len(frame):
+            return {}
+
+        days = frame.detected_at.astype('datetime64[D]')
+        first = days.min()
+        day_index = (days - first) // DAY
+        day_count = int(day_index.max()) + 1
+        width = OTHER_STATUS + 1
+        matrix = np.bincount(
+            day_index * width + frame.status, weights=frame.weights, minlength=day_count * width
+        ).reshape(day_count, width)
+
+        series = {}
+        for index in np.flatnonzero(matrix.sum(axis=1)).tolist():
+            day = str(first + np.timedelta64(index, 'D'))
+            series[day] = {status: int(matrix[index, status_index]) for status, status_index in STATUS_INDEX.items()}
+        return series
+
+    @staticmethod
+    def hourly_series(frame: DetectionFrame, end_time: datetime, hours: int = 24) -> List[Dict]:
+        """
+        截至 end_time 的最近若干小时各状态检测次数（最近的小时在前）
+
+        Returns:
+            [{'hour': 'HH:00', 'total', 'standard', 'redirect', 'failed'}, ...]
+        """
+        end = np.datetime64(end_time.replace(tzinfo=None), 'us')
+        width = OTHER_STATUS + 1
+        matrix = np.zeros((hours, width))
+        if len(frame):
+            # 第 i 个桶为 [end - (i+1)h, end - i h)
+            offset = (end - frame.detected_at) // np.timedelta64(1, 'us')
+            bucket = np.floor_divide(offset - 1, 3600 * 10 ** 6)
+            mask = (offset > 0) & (bucket < hours)
+            matrix = np.bincount(
+                bucket[mask] * width + frame.status[mask], weights=frame.weights[mask], minlength=hours * width
+            ).reshape(hours, width)
+
+        series = []
+        for index in range(hours):
+            hour_start = end_time - timedelta(hours=index + 1)
+            row = {'hour': hour_start.strftime('%H:00'), 'total': int(matrix[index].sum())}
+            row.update({status: int(matrix[index, status_index]) for status, status_index in STATUS_INDEX.items()})
+            series.append(row)
+        return series
+
+    @staticmethod
+    def histogram(frame: DetectionFrame, edges: Sequence[float], include_zero: bool = False) -> List[int]:
+        """
+        响应时间直方图（按 searchsorted 分桶）
+
+        Args:
+            edges: 升序的分桶边界，结果长度为 len(edges) + 1（首桶小于 edges[0]，末桶不小于 edges[-1]）
+        """
+        mask = frame.response_mask(include_zero)
+        buckets = np.searchsorted(np.asarray(edges, dtype=np.float64), frame.response_time[mask], side='right')
+        return np.bincount(buckets, weights=frame.weights[mask], minlength=len(edges) + 1).astype(np.int64).tolist()
+
+    @staticmethod
+    def failure_reason_counts(frame: DetectionFrame) -> Dict[str, int]:
+        """失败原因计数（需以 with_failure_reason=True 加载）"""
+        if frame.failure_reasons is None:
+            raise ValueError("检测记录未加载失败原因列")
+        mask = frame.status == STATUS_INDEX['failed']
+        if not mask.any():
+            return {}
+        reasons, inverse = np.unique(frame.failure_reasons[mask].astype(str), return_inverse=True)
+        counts = np.bincount(inverse, weights=frame.weights[mask], minlength=len(reasons))
+        return {reason: int(count) for reason, count in zip(reasons.tolist(), counts)}
+
+
+def epoch_microseconds(column, dialect_name: str):
+    """
+    检测时间转为自 1970-01-01 起的微秒数（按无时区时间计算，与 datetime64 一致）
+    由数据库直接返回数值，避免逐行构造 datetime 对象
+    """
+    if dialect_name == 'sqlite':
+        return func.round((func.julianday(column) - 2440587.5) * 86400000000.0)
+    if dialect_name == 'mysql':
+        return func.timestampdiff(text('MICROSECOND'), '1970-01-01 00:00:00', column)
+    if dialect_name == 'postgresql':
+        return func.round(func.extract('epoch', column) * 1000000)
+    return column
+
+
+def _to_datetime64(values: Sequence, count: int) -> np.ndarray:
+    """检测时间列（微秒数或 datetime）转为 datetime64[us]"""
+    if not count:
+        return np.empty(0, dtype='datetime64[us]')
+    if isinstance(values[0], datetime):
+        return np.array(values, dtype='datetime64[us]')
+    return np.fromiter(values, dtype=np.int64, count=count).astype('datetime64[us]')
+
+
+def weighted_percentiles(values: np.ndarray, weights: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """
+    加权分位数（取累计权重首次达到 p% 的值）
+
+    Args:
+        values: 数值
+        weights: 权重
+        percentiles: 百分位（0~100）
+
+    Returns:
+        与 percentiles 对应的分位数，没有数据时为 NaN
+    """
+    if not len(values):
+        return np.full(len(percentiles), np.nan)
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    targets = np.asarray(percentiles, dtype=np.float64) / 100.0 * cumulative[-1]
+    positions = np.searchsorted(cumulative, targets, side='left')
+    return values[order][np.minimum(positions, len(values) - 1)]
+
+
+def grouped_weighted_percentiles(groups: np.ndarray, values: np.ndarray, weights: np.ndarray,
+                                 group_count: int, percentiles: Sequence[float]) -> List[np.ndarray]:
+    """
+    分组加权分位数
+    按 (分组, 数值) 排序后，全局累计权重单调递增，每组的目标累计值 = 组起点累计值 + p% × 组内权重和，
+    一次 searchsorted 求出所有分组的分位数位置
+
+    Returns:
+        每个百分位一个长度为 group_count 的数组，没有数据的分组为 NaN
+    """
+    result = [np.full(group_count, np.nan) for _ in percentiles]
+    if not len(values):
+        return result
+
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    sorted_values = values[order]
+    cumulative = np.cumsum(weights[order], dtype=np.float64)
+
+    group_weight = np.bincount(sorted_groups, weights=weights[order], minlength=group_count)
+    present = np.flatnonzero(group_weight > 0)
+    # 每组之前的累计权重
+    before = np.concatenate(([0.0], np.cumsum(group_weight)))[:-1]
+
+    for column, p in zip(result, percentiles):
+        targets = before[present] + group_weight[present] * (p / 100.0)
+        positions = np.searchsorted(cumulative, targets, side='left')
+        # 浮点误差可能越过组末尾，限制在组内最后一个位置
+        group_end = np.searchsorted(sorted_groups, present, side='right') - 1
+        column[present] = sorted_values[np.minimum(positions, group_end)]
+    return result
+
+
+# 全局检测统计分析引擎实例
+analytics_engine = AnalyticsEngine()
@@ -1,25 +1,56 @@
 """
 API密钥管理服务
 用于管理Dify平台的API密钥，包括生成、验证、存储等功能
+- 验证：有效密钥按哈希建立内存索引，每次请求只计算一次哈希并查表；
+  创建和删除密钥时递增共享缓存标签，各进程每秒至多一次比较该标签和数据库侧的
+  密钥版本（有效密钥数和最近修改时间），变化时重建索引
+- 使用记录：使用次数和最后使用时间在内存中累计，由后台线程定期批量写入
 """
 
+import json
 import secrets
 import hashlib
 import hmac
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import logging
 
+from sqlalchemy import func
+
+from ..database import get_db, get_write_db
+from ..utils.cache import TAG_API_KEYS, shared_cache
+
 logger = logging.getLogger(__name__)
 
 class ApiKeyService:
     """API密钥管理服务"""
     
+    # 使用记录批量写入间隔（秒）
+    USAGE_FLUSH_INTERVAL = 30
+    
+    # 检查其他进程是否修改了密钥的最短间隔（秒）
+    INDEX_CHECK_INTERVAL = 1.0
+    
     def __init__(self):
         """初始化API密钥服务"""
         self.key_prefix = "dify_"
         self.key_length = 32
         self.logger = logger
+        
+        # 密钥哈希 -> {'id': 设置ID, 'key_info': 密钥信息}
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_version: Optional[tuple] = None
+        self._index_checked_at = 0.0
+        self._index_lock = threading.Lock()
+        
+        # 设置ID -> {'count': 未写入的使用次数, 'last_used_at': 最后使用时间}
+        self._usage: Dict[int, Dict[str, Any]] = {}
+        self._usage_lock = threading.Lock()
+        self._flush_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        
         self.logger.info("API密钥服务初始化完成")
     
     def generate_api_key(self, name: str = "Default") -> Dict[str, Any]:
@@ -112,7 +143,6 @@ class ApiKeyService:
             from backend.models import SystemSetting
 
             # 转换datetime对象为字符串以便JSON序列化
-            import json
             serializable_key_info = {
                 'name': key_info['name'],
                 'key_hash': key_info['key_hash'],
@@ -135,6 +165,7 @@ class ApiKeyService:
             db.add(key_setting)
             db.commit()
             db.refresh(key_setting)
+            self.invalidate_index()
             
             logger.info(f"API密钥保存成功: {key_info['name']}")
             return key_setting.id
@@ -157,6 +188,9 @@ class ApiKeyService:
         try:
             from backend.models import SystemSetting
 
+            # 先写入内存中累计的使用记录
+            self.flush_usage()
+
             keys = db.query(SystemSetting).filter(
                 SystemSetting.category == "dify_api",
                 SystemSetting.is_active == True
@@ -165,8 +199,6 @@ class ApiKeyService:
             result = []
             for key in keys:
                 try:
-                    import json
-                    from datetime import datetime
                     key_info = json.loads(key.value)
                     result.append({
                         'id': key.id,
@@ -208,6 +240,7 @@ class ApiKeyService:
             if key:
                 key.is_active = False
                 db.commit()
+                self.invalidate_index()
                 self.logger.info(f"API密钥删除成功: {key_id}")
                 return True
             else:
@@ -221,43 +254,22 @@ class ApiKeyService:
     
     def update_key_usage(self, db, key_hash: str):
         """
-        更新密钥使用记录
+        记录密钥使用（累计在内存中，由后台线程定期批量写入）
         
         Args:
-            db: 数据库连接
+            db: 数据库连接（索引需要重建时使用）
             key_hash: 密钥哈希
         """
-        try:
-            from backend.models import SystemSetting
-
-            keys = db.query(SystemSetting).filter(
-                SystemSetting.category == "dify_api",
-                SystemSetting.is_active == True
-            ).all()
-            
-            for key in keys:
-                try:
-                    import json
-                    key_info = json.loads(key.value)
-                    if key_info.get('key_hash') == key_hash:
-                        key_info['last_used_at'] = datetime.now().isoformat()
-                        key_info['usage_count'] = key_info.get('usage_count', 0) + 1
-                        key.value = json.dumps(key_info)
-                        db.commit()
-                        break
-                except Exception as e:
-                    self.logger.warning(f"更新密钥使用记录失败: {e}")
-                    continue
-                    
-        except Exception as e:
-            self.logger.error(f"更新密钥使用记录失败: {e}")
+        entry = self._lookup(db, key_hash)
+        if entry:
+            self._record_usage(entry['id'])
     
     def authenticate_request(self, db, api_key: str) -> Optional[Dict[str, Any]]:
         """
         验证API请求
         
         Args:
-            db: 数据库连接
+            db: 数据库连接（可为None，索引需要重建时自行打开会话）
             api_key: API密钥
             
         Returns:
@@ -267,33 +279,142 @@ class ApiKeyService:
             if not api_key or not api_key.startswith(self.key_prefix):
                 return None
             
-            from backend.models import SystemSetting
-
-            keys = db.query(SystemSetting).filter(
-                SystemSetting.category == "dify_api",
-                SystemSetting.is_active == True
-            ).all()
+            entry = self._lookup(db, self._hash_key(api_key))
+            if entry is None:
+                return None
             
-            for key in keys:
-                try:
-                    import json
-                    key_info = json.loads(key.value)
-                    stored_hash = key_info.get('key_hash')
-
-                    if self.verify_api_key(api_key, stored_hash):
-                        # 更新使用记录
-                        self.update_key_usage(db, stored_hash)
-
-                        return {
-                            'valid': True,
-                            'key_info': key_info
-                        }
-                except Exception as e:
-                    self.logger.warning(f"验证API密钥时解析失败: {e}")
-                    continue
+            # 更新使用记录
+            self._record_usage(entry['id'])
             
-            return None
+            return {
+                'valid': True,
+                'key_info': entry['key_info']
+            }
             
         except Exception as e:
             self.logger.error(f"API请求验证失败: {e}")
             return None
+    
+    def _lookup(self, db, key_hash: str) -> Optional[Dict[str, Any]]:
+        """按哈希查找有效密钥"""
+        index = self._index
+        if index is None or time.monotonic() - self._index_checked_at >= self.INDEX_CHECK_INTERVAL:
+            index = self._refresh_index(db)
+        return index.get(key_hash)
+    
+    def _refresh_index(self, db) -> Dict[str, Dict[str, Any]]:
+        """密钥版本变化（或尚未加载）时重建索引"""
+        with self._index_lock:
+            if db is None:
+                with get_db() as session:
+                    return self._refresh_index_locked(session)
+            return self._refresh_index_locked(db)
+    
+    def _refresh_index_locked(self, db) -> Dict[str, Dict[str, Any]]:
+        # 共享缓存版本在配置 Redis/SQLite 后端时跨进程生效；进程内存后端下
+        # 其他进程的创建和删除只能从数据库察觉，因此同时比较数据库侧的版本
+        version = (shared_cache.version([TAG_API_KEYS]), self._db_version(db))
+        if self._index is None or version != self._index_version:
+            self._index = self._load_index(db)
+            self._index_version = version
+            self.logger.info(f"API密钥索引已加载: {len(self._index)} 个有效密钥")
+        self._index_checked_at = time.monotonic()
+        return self._index
+    
+    @staticmethod
+    def _db_version(db) -> tuple:
+        """数据库侧的密钥版本：有效密钥数和最近修改时间（创建、删除都会改变）"""
+        from backend.models import SystemSetting
+        
+        return tuple(db.query(
+            func.count(SystemSetting.id).filter(SystemSetting.is_active == True),
+            func.max(SystemSetting.updated_at)
+        ).filter(SystemSetting.category == "dify_api").one())
+    
+    def _load_index(self, db) -> Dict[str, Dict[str, Any]]:
+        from backend.models import SystemSetting
+        
+        keys = db.query(SystemSetting.id, SystemSetting.value).filter(
+            SystemSetting.category == "dify_api",
+            SystemSetting.is_active == True
+        ).all()
+        
+        index = {}
+        for key_id, value in keys:
+            try:
+                key_info = json.loads(value)
+            except (TypeError, ValueError) as e:
+                self.logger.warning(f"解析API密钥信息失败: {key_id}, {e}")
+                continue
+            if key_info.get('key_hash') and key_info.get('is_active', True):
+                index[key_info['key_hash']] = {'id': key_id, 'key_info': key_info}
+        return index
+    
+    def invalidate_index(self):
+        """密钥创建或删除后使所有进程的索引失效"""
+        with self._index_lock:
+            self._index = None
+        shared_cache.invalidate_tags(TAG_API_KEYS)
+    
+    def _record_usage(self, key_id: int):
+        with self._usage_lock:
+            usage = self._usage.setdefault(key_id, {'count': 0, 'last_used_at': None})
+            usage['count'] += 1
+            usage['last_used_at'] = datetime.now()
+            
+            if self._flush_thread is None or not self._flush_thread.is_alive():
+                self._stop_event.clear()
+                self._flush_thread = threading.Thread(
+                    target=self._flush_loop, name='api-key-usage', daemon=True
+                )
+                self._flush_thread.start()
+    
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.USAGE_FLUSH_INTERVAL):
+            self.flush_usage()
+    
+    def flush_usage(self) -> int:
+        """
+        批量写入累计的使用记录（一个事务）
+        
+        Returns:
+            更新的密钥数量
+        """
+        with self._usage_lock:
+            pending, self._usage = self._usage, {}
+        if not pending:
+            return 0
+        
+        try:
+            from backend.models import SystemSetting
+            
+            with get_write_db() as db:
+                keys = db.query(SystemSetting).filter(SystemSetting.id.in_(list(pending))).all()
+                for key in keys:
+                    usage = pending[key.id]
+                    key_info = json.loads(key.value)
+                    key_info['usage_count'] = key_info.get('usage_count', 0) + usage['count']
+                    key_info['last_used_at'] = usage['last_used_at'].isoformat()
+                    key.value = json.dumps(key_info)
+            return len(keys)
+            
+        except Exception as e:
+            self.logger.error(f"更新密钥使用记录失败: {e}")
+            # 写入失败时放回，下次重试
+            with self._usage_lock:
+                for key_id, usage in pending.items():
+                    current = self._usage.setdefault(key_id, {'count': 0, 'last_used_at': usage['last_used_at']})
+                    current['count'] += usage['count']
+                    current['last_used_at'] = max(current['last_used_at'], usage['last_used_at'])
+            return 0
+    
+    def stop(self):
+        """停止后台写入线程并写入剩余的使用记录"""
+        self._stop_event.set()
+        if self._flush_thread and self._flush_thread.is_alive():
+            self._flush_thread.join(timeout=5)
+        self.flush_usage()
+
+
+# 全局API密钥服务实例
+api_key_service = ApiKeyService()
@@ -0,0 +1,371 @@
+"""
+检测记录冷归档服务
+从数据库删除的历史检测记录（超过保留期或已压缩为小时汇总）先写入按日期分目录的压缩文件，
+数据库只保留近期数据，历史明细仍可导出和统计
+- 目录结构：{归档目录}/YYYY/MM/DD/part-{来源}-{表名}-{起始ID}-{结束ID}.{parquet|ndjson.gz}
+- 安装了 pyarrow 时写 Parquet（zstd 压缩），否则写 gzip 压缩的 NDJSON
+- 每个数据文件旁有 .idx.json 列索引（行数、网站ID集合与范围、检测时间范围、状态集合），
+  查询按日期目录和列索引跳过无关文件；Parquet 读取时再按网站ID和时间下推过滤
+- 文件名由表名和ID区间确定，同一块重试写入会覆盖而不是重复
+"""
+
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ..config import Config
+from ..utils.helpers import get_beijing_time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+logger = logging.getLogger(__name__)
+
+# 归档的检测记录字段
+ARCHIVE_COLUMNS = (
+    'id', 'website_id', 'task_id', 'status', 'final_url', 'response_time', 'http_status_code',
+    'error_message', 'failure_reason', 'ssl_info', 'redirect_chain', 'page_title',
+    'page_content_length', 'detected_at', 'retry_count', 'detection_duration',
+    'last_seen_at', 'check_count', 'min_response_time', 'max_response_time',
+)
+DATETIME_COLUMNS = ('detected_at', 'last_seen_at')
+JSON_COLUMNS = ('ssl_info', 'redirect_chain')
+
+# 归档来源：retention 为超过保留期的记录，compaction 为已压缩为小时汇总的记录
+SOURCES = ('retention', 'compaction')
+
+# 列索引中保存完整网站ID集合的上限，超过时只保存范围
+MAX_INDEXED_WEBSITE_IDS = 2000
+
+INDEX_SUFFIX = '.idx.json'
+
+
+class ArchiveService:
+    """检测记录冷归档服务"""
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'ARCHIVE_CONFIG', {})
+        self.enabled = bool(config.get('enabled', False))
+        self.root = Path(config.get('path') or 'archive')
+        requested = config.get('format', 'auto')
+        if requested == 'parquet' and not PARQUET_SUPPORT:
+            logger.warning("未安装 pyarrow，检测记录归档使用 NDJSON 格式")
+        self.format = 'parquet' if requested in ('auto', 'parquet') and PARQUET_SUPPORT else 'ndjson'
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def write_rows(self, rows: Iterable, source: str, table_name: str) -> int:
+        """
+        归档一块检测记录（调用方在文件写入成功后再删除数据库中的记录）
+
+        Args:
+            rows: 检测记录行（SQLAlchemy Row 或字典），需包含 ARCHIVE_COLUMNS
+            source: 归档来源（retention 或 compaction）
+            table_name: 记录所在的表
+
+        Returns:
+            归档的记录数
+        """
+        if source not in SOURCES:
+            raise ValueError(f"不支持的归档来源: {source}")
+
+        by_day: Dict[date, List[Dict]] = {}
+        for row in rows:
+            record = self._to_record(row)
+            by_day.setdefault(record['detected_at'].date(), []).append(record)
+
+        for day, records in by_day.items():
+            records.sort(key=lambda record: record['id'])
+            directory = self.root / f"{day:%Y}" / f"{day:%m}" / f"{day:%d}"
+            directory.mkdir(parents=True, exist_ok=True)
+            stem = f"part-{source}-{table_name}-{records[0]['id']}-{records[-1]['id']}"
+
+            if self.format == 'parquet':
+                data_path = directory / f"{stem}.parquet"
+                self._write_parquet(data_path, records)
+            else:
+                data_path = directory / f"{stem}.ndjson.gz"
+                self._write_ndjson(data_path, records)
+
+            # 列索引最后写入，没有索引的文件视为未完成
+            self._write_json(directory / f"{stem}{INDEX_SUFFIX}", self._build_index(data_path, source, records))
+
+        return sum(len(records) for records in by_day.values())
+
+    @staticmethod
+    def _to_record(row) -> Dict:
+        """转换为可归档的字典"""
+        mapping = row if isinstance(row, dict) else row._mapping
+        record = {column: mapping.get(column) for column in ARCHIVE_COLUMNS}
+        for column in DATETIME_COLUMNS:
+            if isinstance(record[column], datetime):
+                record[column] = record[column].replace(tzinfo=None)
+        return record
+
+    def _write_parquet(self, path: Path, records: List[Dict]):
+        """写入 Parquet 文件（JSON 字段序列化为字符串）"""
+        columns = {column: [record[column] for record in records] for column in ARCHIVE_COLUMNS}
+        for column in JSON_COLUMNS:
+            columns[column] = [json.dumps(value, ensure_ascii=False) if value is not None else None
+                               for value in columns[column]]
+        table = pa.table(columns)
+        temp_path = path.with_name(path.name + '.tmp')
+        pq.write_table(table, temp_path, compression='zstd', row_group_size=50000)
+        os.replace(temp_path, path)
+
+    def _write_ndjson(self, path: Path, records: List[Dict]):
+        """写入 gzip 压缩的 NDJSON 文件"""
+        temp_path = path.with_name(path.name + '.tmp')
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=self._json_default))
+                f.write('\n')
+        os.replace(temp_path, path)
+
+    def _build_index(self, data_path: Path, source: str, records: List[Dict]) -> Dict:
+        """生成数据文件的列索引"""
+        website_ids = sorted({record['website_id'] for record in records})
+        detected = [record['detected_at'] for record in records]
+        last_seen = [record['last_seen_at'] or record['detected_at'] for record in records]
+        return {
+            'file': data_path.name,
+            'format': self.format,
+            'source': source,
+            'rows': len(records),
+            'checks': sum(record['check_count'] or 1 for record in records),
+            'columns': list(ARCHIVE_COLUMNS),
+            'min_id': records[0]['id'],
+            'max_id': records[-1]['id'],
+            'min_website_id': website_ids[0],
+            'max_website_id': website_ids[-1],
+            'website_ids': website_ids if len(website_ids) <= MAX_INDEXED_WEBSITE_IDS else None,
+            'task_ids': sorted({record['task_id'] for record in records if record['task_id'] is not None}),
+            'statuses': sorted({record['status'] for record in records if record['status']}),
+            'min_detected_at': min(detected).isoformat(),
+            'max_detected_at': max(detected).isoformat(),
+            'max_last_seen_at': max(last_seen).isoformat(),
+            'created_at': get_beijing_time().isoformat(),
+        }
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict):
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return str(value)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def scan(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+             website_ids: Optional[Iterable[int]] = None, task_id: Optional[int] = None,
+             sources: Iterable[str] = SOURCES, newest_first: bool = False) -> Iterator[Dict]:
+        """
+        扫描归档中的检测记录
+
+        Args:
+            start_date: 起始时间（记录区间 [detected_at, last_seen_at] 与范围重叠即返回）
+            end_date: 结束时间
+            website_ids: 网站ID列表
+            task_id: 任务ID
+            sources: 读取的归档来源
+            newest_first: 按日期从新到旧读取（日期内保持归档文件中的顺序）
+
+        Returns:
+            检测记录字典迭代器（时间字段已还原为 datetime）
+        """
+        start_date = start_date.replace(tzinfo=None) if start_date else None
+        end_date = end_date.replace(tzinfo=None) if end_date else None
+        website_set = set(website_ids) if website_ids else None
+        sources = set(sources)
+
+        directories = self._day_directories(start_date, end_date)
+        if newest_first:
+            directories.reverse()
+
+        for directory in directories:
+            for index_path in sorted(directory.glob(f'*{INDEX_SUFFIX}')):
+                try:
+                    with open(index_path, encoding='utf-8') as f:
+                        index = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"读取归档索引失败: {index_path}, {e}")
+                    continue
+
+                if not self._index_matches(index, sources, start_date, end_date, website_set, task_id):
+                    continue
+
+                data_path = directory / index['file']
+                if index['format'] == 'parquet':
+                    records = self._read_parquet(data_path, end_date, website_set)
+                else:
+                    records = self._read_ndjson(data_path)
+
+                for record in records:
+                    if self._record_matches(record, start_date, end_date, website_set, task_id):
+                        yield record
+
+    def aggregate(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                  website_ids: Optional[Iterable[int]] = None,
+                  sources: Iterable[str] = ('retention',)) -> Dict:
+        """
+        汇总归档中的检测次数和响应时间（默认只读取保留期归档，已压缩的数据由小时汇总提供）
+
+        Returns:
+            {'total', 'response_time_sum', 'response_time_count',
+             'daily': {日期: {状态: 次数}},
+             'websites': {网站ID: {'total', 'response_time_sum', 'response_time_count', 'statuses': {状态: 次数}}}}
+        """
+        result = {'total': 0, 'response_time_sum': 0.0, 'response_time_count': 0, 'daily': {}, 'websites': {}}
+        for record in self.scan(start_date, end_date, website_ids, sources=sources):
+            checks = record.get('check_count') or 1
+            status = record['status']
+            website = result['websites'].setdefault(record['website_id'], {
+                'total': 0, 'response_time_sum': 0.0, 'response_time_count': 0, 'statuses': {}
+            })
+
+            for totals in (result, website):
+                totals['total'] += checks
+                if record.get('response_time') is not None:
+                    totals['response_time_sum'] += record['response_time'] * checks
+                    totals['response_time_count'] += checks
+            website['statuses'][status] = website['statuses'].get(status, 0) + checks
+
+            day = result['daily'].setdefault(record['detected_at'].strftime('%Y-%m-%d'), {})
+            day[status] = day.get(status, 0) + checks
+        return result
+
+    def get_stats(self) -> Dict:
+        """获取归档统计（文件数、记录数、占用空间、日期范围）"""
+        stats = {'enabled': self.enabled, 'format': self.format, 'path': str(self.root),
+                 'files': 0, 'rows': 0, 'bytes': 0, 'oldest_day': None, 'newest_day': None}
+        days = list(self._day_directories(None, None))
+        for directory in days:
+            for index_path in directory.glob(f'*{INDEX_SUFFIX}'):
+                try:
+                    with open(index_path, encoding='utf-8') as f:
+                        index = json.load(f)
+                    stats['files'] += 1
+                    stats['rows'] += index.get('rows', 0)
+                    stats['bytes'] += (directory / index['file']).stat().st_size
+                except (OSError, ValueError, KeyError):
+                    continue
+        if days:
+            stats['oldest_day'] = self._directory_day(days[0]).isoformat()
+            stats['newest_day'] = self._directory_day(days[-1]).isoformat()
+        return stats
+
+    def _day_directories(self, start_date: Optional[datetime], end_date: Optional[datetime]) -> List[Path]:
+        """按日期范围列出归档日期目录（按日期排序）"""
+        if not self.root.exists():
+            return []
+
+        # 变化存储模式下的记录可能跨越到下一天，起始日期向前放宽一天
+        first = (start_date - timedelta(days=1)).date() if start_date else None
+        last = end_date.date() if end_date else None
+
+        directories = []
+        for year_dir in sorted(self.root.iterdir()):
+            if not year_dir.is_dir() or not year_dir.name.isdigit():
+                continue
+            if (first and int(year_dir.name) < first.year) or (last and int(year_dir.name) > last.year):
+                continue
+            for month_dir in sorted(year_dir.iterdir()):
+                if not month_dir.is_dir() or not month_dir.name.isdigit():
+                    continue
+                for day_dir in sorted(month_dir.iterdir()):
+                    if not day_dir.is_dir() or not day_dir.name.isdigit():
+                        continue
+                    day = self._directory_day(day_dir)
+                    if day and (first is None or day >= first) and (last is None or day <= last):
+                        directories.append(day_dir)
+        return directories
+
+    @staticmethod
+    def _directory_day(directory: Path) -> Optional[date]:
+        try:
+            return date(int(directory.parent.parent.name), int(directory.parent.name), int(directory.name))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _index_matches(index: Dict, sources: set, start_date: Optional[datetime], end_date: Optional[datetime],
+                       website_set: Optional[set], task_id: Optional[int]) -> bool:
+        """按列索引判断文件是否可能包含匹配的记录"""
+        if index.get('source') not in sources:
+            return False
+        if start_date and datetime.fromisoformat(index['max_last_seen_at']) < start_date:
+            return False
+        if end_date and datetime.fromisoformat(index['min_detected_at']) > end_date:
+            return False
+        if website_set:
+            if index.get('website_ids') is not None:
+                if website_set.isdisjoint(index['website_ids']):
+                    return False
+            elif max(website_set) < index['min_website_id'] or min(website_set) > index['max_website_id']:
+                return False
+        if task_id is not None and task_id not in index.get('task_ids', []):
+            return False
+        return True
+
+    @staticmethod
+    def _record_matches(record: Dict, start_date: Optional[datetime], end_date: Optional[datetime],
+                        website_set: Optional[set], task_id: Optional[int]) -> bool:
+        if website_set and record['website_id'] not in website_set:
+            return False
+        if task_id is not None and record['task_id'] != task_id:
+            return False
+        if start_date and (record['last_seen_at'] or record['detected_at']) < start_date:
+            return False
+        if end_date and record['detected_at'] > end_date:
+            return False
+        return True
+
+    def _read_ndjson(self, path: Path) -> Iterator[Dict]:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield self._restore(json.loads(line))
+
+    def _read_parquet(self, path: Path, end_date: Optional[datetime],
+                      website_set: Optional[set]) -> Iterator[Dict]:
+        """读取 Parquet 文件，网站ID和检测时间条件下推到行组过滤（起始时间需按 last_seen_at 判断，在读取后过滤）"""
+        filters = []
+        if website_set:
+            filters.append(('website_id', 'in', sorted(website_set)))
+        if end_date:
+            filters.append(('detected_at', '<=', end_date))
+        table = pq.read_table(path, filters=filters or None)
+        for record in table.to_pylist():
+            for column in JSON_COLUMNS:
+                if record.get(column):
+                    record[column] = json.loads(record[column])
+            yield record
+
+    @staticmethod
+    def _restore(record: Dict) -> Dict:
+        for column in DATETIME_COLUMNS:
+            if record.get(column):
+                record[column] = datetime.fromisoformat(record[column])
+        return record
+
+
+# 全局检测记录归档服务实例
+archive_service = ArchiveService()
@@ -13,9 +13,9 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 
 from .website_detector import WebsiteDetector, DetectionResult
-from ..database import get_db
-from ..models import DetectionRecord, Website, DetectionTask
+from ..models import Website, DetectionTask
 from ..utils.helpers import get_beijing_time, batch_process_list
+from .result_writer import result_writer, build_detection_row
 
 logger = logging.getLogger(__name__)
 
@@ -354,46 +354,14 @@ class BatchDetectionService:
             
             logger.info(f"开始批量保存 {len(all_results)} 条检测记录")
             
-            # 分批插入数据库
-            batch_size = 100
-            for batch_start in range(0, len(all_results), batch_size):
-                batch_end = min(batch_start + batch_size, len(all_results))
-                batch_records = all_results[batch_start:batch_end]
-                
-                with get_db() as db:
-                    records_to_insert = []
-                    
-                    for i, result in enumerate(batch_records):
-                        website_idx = batch_start + i
-                        if website_idx < len(websites):
-                            website = websites[website_idx]
-                            
-                            record = DetectionRecord(
-                                task_id=task_id,
-                                website_id=website.id,
-                                status=result.status,
-                                response_time=result.response_time or 0.0,
-                                http_status_code=result.http_status_code,
-                                final_url=result.final_url or '',
-                                error_message=result.error_message or '',
-                                failure_reason=getattr(result, 'failure_reason', '') or '',
-                                ssl_info=getattr(result, 'ssl_info', {}) or {},
-                                page_title=getattr(result, 'page_title', '') or '',
-                                page_content_length=getattr(result, 'page_content_length', 0) or 0,
-                                retry_count=getattr(result, 'retry_count', 0) or 0,
-                                redirect_chain=getattr(result, 'redirect_chain', []) or [],
-                                detected_at=result.detected_at,
-                                detection_duration=result.detection_duration
-                            )
-                            records_to_insert.append(record)
-                    
-                    # 批量插入
-                    db.bulk_save_objects(records_to_insert)
-                    db.commit()
-                    
-                    logger.debug(f"批量插入 {len(records_to_insert)} 条记录")
+            # 提交到写入缓冲，由后台按批次落库
+            rows = [
+                build_detection_row(task_id, website.id, result)
+                for website, result in zip(websites, all_results)
+            ]
+            result_writer.submit(rows)
             
-            logger.info(f"批量保存完成，共保存 {len(all_results)} 条记录")
+            logger.info(f"批量保存完成，共提交 {len(rows)} 条记录")
             return True
             
         except Exception as e:
@@ -0,0 +1,206 @@
+"""
+变化存储模式
+连续相同的检测结果（状态、HTTP状态码、最终URL、失败原因均相同）合并为一条记录，
+只延长 last_seen_at、累加 check_count 并更新响应时间的最小/平均/最大值；
+任一字段变化或记录覆盖时间超过 max_run_hours 时新建记录
+- 每个网站/任务的当前记录缓存在内存中，所有写入都经由写入缓冲的单一刷写路径，缓存与数据库一致
+- 缓存的记录在每批写入前校验是否仍存在（可能已被清理），不存在时新建记录
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, update
+
+from ..config import Config
+from .detection_storage import detection_storage
+
+logger = logging.getLogger(__name__)
+
+# 决定是否为同一段连续结果的字段
+RUN_KEY_FIELDS = ('status', 'http_status_code', 'final_url', 'failure_reason')
+
+# 缓存记录需要的字段
+RUN_FIELDS = RUN_KEY_FIELDS + (
+    'id', 'website_id', 'task_id', 'detected_at', 'last_seen_at',
+    'check_count', 'response_time', 'min_response_time', 'max_response_time',
+)
+
+RunKey = Tuple[int, Optional[int]]
+
+
+class ChangeOnlyStorage:
+    """变化存储模式写入器"""
+
+    # 每次 IN 查询的网站数
+    CHUNK_SIZE = 500
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'CHANGE_ONLY_STORAGE_CONFIG', {})
+        self.enabled = bool(config.get('enabled', False))
+        self.max_run = timedelta(hours=config.get('max_run_hours', 24))
+
+        # (website_id, task_id) -> 当前记录；None 表示已确认没有可延续的记录
+        self._runs: Dict[RunKey, Optional[Dict]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'inserted_rows': 0, 'merged_checks': 0}
+
+    def write_rows(self, db, rows: List[Dict]) -> List[int]:
+        """
+        写入检测记录，与当前记录结果相同时合并
+
+        Args:
+            db: 写会话（调用方负责提交）
+            rows: build_detection_row 生成的检测记录行
+
+        Returns:
+            每行对应的检测记录ID（合并的行返回被延长记录的ID）
+        """
+        with self._lock:
+            since = min(row['detected_at'] for row in rows) - self.max_run
+            self._prepare_runs(db, {self._key(row) for row in rows}, since)
+
+            targets: List[Dict] = []
+            new_runs: List[Dict] = []
+            extended: Dict[int, Dict] = {}
+
+            for row in rows:
+                key = self._key(row)
+                run = self._runs.get(key)
+                if run is not None and self._continues(run, row):
+                    self._merge(run, row)
+                    if run.get('id') is not None:
+                        extended[run['id']] = run
+                else:
+                    run = {field: row.get(field) for field in RUN_FIELDS if field != 'id'}
+                    run['row'] = dict(row)
+                    self._runs[key] = run
+                    new_runs.append(run)
+                targets.append(run)
+
+            self._update_runs(db, extended.values())
+
+            if new_runs:
+                for run in new_runs:
+                    run['row'].update({
+                        field: run[field]
+                        for field in ('last_seen_at', 'check_count', 'response_time',
+                                      'min_response_time', 'max_response_time')
+                    })
+                ids = detection_storage.insert_rows(db, [run.pop('row') for run in new_runs])
+                for run, record_id in zip(new_runs, ids):
+                    run['id'] = record_id
+
+            self._stats['inserted_rows'] += len(new_runs)
+            self._stats['merged_checks'] += len(rows) - len(new_runs)
+            return [run['id'] for run in targets]
+
+    def reset(self):
+        """清空当前记录缓存（回滚或数据被批量删除后调用）"""
+        with self._lock:
+            self._runs.clear()
+
+    def get_stats(self) -> Dict:
+        """获取合并统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_runs'] = sum(1 for run in self._runs.values() if run is not None)
+        total = stats['inserted_rows'] + stats['merged_checks']
+        stats['enabled'] = self.enabled
+        stats['compression_ratio'] = round(total / stats['inserted_rows'], 2) if stats['inserted_rows'] else 0
+        return stats
+
+    @staticmethod
+    def _key(row: Dict) -> RunKey:
+        return row['website_id'], row.get('task_id')
+
+    def _continues(self, run: Dict, row: Dict) -> bool:
+        """新检测结果是否延续当前记录"""
+        if any(run.get(field) != row.get(field) for field in RUN_KEY_FIELDS):
+            return False
+        return row['detected_at'] - run['detected_at'] <= self.max_run
+
+    @staticmethod
+    def _merge(run: Dict, row: Dict):
+        """将一次检测合并到当前记录"""
+        response_time = row.get('response_time') or 0.0
+        count = run.get('check_count') or 1
+        average = run.get('response_time') or 0.0
+
+        run['check_count'] = count + 1
+        run['response_time'] = (average * count + response_time) / (count + 1)
+        minimum = run.get('min_response_time')
+        run['min_response_time'] = response_time if minimum is None else min(minimum, response_time)
+        run['max_response_time'] = max(run.get('max_response_time') or 0.0, response_time)
+        run['last_seen_at'] = max(run.get('last_seen_at') or run['detected_at'], row['detected_at'])
+
+    def _update_runs(self, db, runs: Iterable[Dict]):
+        """将延长后的记录写回数据库"""
+        for run in runs:
+            table = detection_storage.table_for_id(run['id'])
+            db.execute(
+                update(table).where(table.c.id == run['id']).values(
+                    last_seen_at=run['last_seen_at'],
+                    check_count=run['check_count'],
+                    response_time=run['response_time'],
+                    min_response_time=run['min_response_time'],
+                    max_response_time=run['max_response_time'],
+                )
+            )
+
+    def _prepare_runs(self, db, keys: set, since):
+        """
+        校验缓存记录仍存在，并为未缓存的网站加载最近一条记录
+
+        Args:
+            db: 写会话
+            keys: 本批涉及的 (网站ID, 任务ID)
+            since: 可延续记录的最早检测时间（超过 max_run 的记录不会再延续）
+        """
+        cached = {key: self._runs[key] for key in keys if self._runs.get(key) is not None}
+        cached_ids = [run['id'] for run in cached.values()]
+        if cached_ids:
+            existing = {record.id for record in detection_storage.records_by_ids(db, cached_ids)}
+            for key, run in cached.items():
+                if run['id'] not in existing:
+                    self._runs.pop(key, None)
+
+        missing = [key for key in keys if key not in self._runs]
+        if not missing:
+            return
+
+        for key in missing:
+            self._runs[key] = None
+
+        website_ids = sorted({website_id for website_id, _ in missing})
+        missing_set = set(missing)
+
+        for start in range(0, len(website_ids), self.CHUNK_SIZE):
+            chunk = website_ids[start:start + self.CHUNK_SIZE]
+            R = detection_storage.record_source(start_date=since)
+            latest = db.query(
+                R.website_id,
+                R.task_id,
+                func.max(R.detected_at).label('last_detected_at')
+            ).filter(
+                R.website_id.in_(chunk),
+                R.detected_at >= since
+            ).group_by(R.website_id, R.task_id).subquery()
+
+            records = db.query(R).join(
+                latest,
+                (R.website_id == latest.c.website_id) &
+                (func.coalesce(R.task_id, 0) == func.coalesce(latest.c.task_id, 0)) &
+                (R.detected_at == latest.c.last_detected_at)
+            ).all()
+
+            for record in records:
+                key = (record.website_id, record.task_id)
+                if key in missing_set:
+                    self._runs[key] = {field: getattr(record, field) for field in RUN_FIELDS}
+
+
+# 全局变化存储写入器
+change_only_storage = ChangeOnlyStorage()
@@ -0,0 +1,348 @@
+"""
+检测记录压缩服务
+将超过保留明细天数的检测记录按 网站 × 小时 汇总为 DetectionHourlySummary 后删除原始记录，
+长期可用率报表读取汇总，检测记录表只保留近期明细
+- 汇总内容：各状态检测次数、响应时间总和/最小/最大值、分位数草图、首次/最后一次失败原因
+- 每块在独立的写事务中完成“汇总合并 + 删除原始记录”，中断后重新运行即可继续，不会重复计数
+- 近期范围读取原始记录，更早的范围读取汇总（两者不重叠）
+- 启用冷归档时，原始记录删除前写入归档文件，仍可导出历史明细
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+
+from ..config import Config
+from ..database import get_write_db
+from ..models import DetectionHourlySummary, WebsiteStatusChange
+from ..utils.cache import invalidate_detections
+from ..utils.helpers import get_beijing_time
+from ..utils.latency_sketch import LatencySketch
+from .archive_service import archive_service
+from .detection_storage import detection_storage
+
+logger = logging.getLogger(__name__)
+
+# 汇总的状态计数字段
+STATUS_FIELDS = {
+    'standard': 'standard_count',
+    'redirect': 'redirect_count',
+    'failed': 'failed_count',
+}
+
+SummaryKey = Tuple[int, datetime]
+
+
+class CompactionBusy(Exception):
+    """已有压缩任务在运行"""
+
+
+def hour_floor(value: datetime) -> datetime:
+    """截断到整点"""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class CompactionService:
+    """检测记录压缩服务"""
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'COMPACTION_CONFIG', {})
+        self.enabled = bool(config.get('enabled', True))
+        self.compact_after_days = config.get('compact_after_days', 7)
+        self.chunk_size = config.get('chunk_size', 2000)
+        self.interval_hours = config.get('interval_hours', 1)
+        self.summary_retention_days = config.get('summary_retention_days', 365)
+
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_result: Optional[Dict] = None
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """压缩截止时间：早于该时间的检测记录已汇总，不再保留明细"""
+        now = (now or datetime.now()).replace(tzinfo=None)
+        return hour_floor(now - timedelta(days=self.compact_after_days))
+
+    def is_running(self) -> bool:
+        """是否有压缩任务在运行"""
+        return self._run_lock.locked()
+
+    def start_compaction(self) -> bool:
+        """
+        启动后台压缩任务
+
+        Returns:
+            是否成功启动（未启用或已有任务在运行时返回False）
+        """
+        if not self.enabled or not self._run_lock.acquire(blocking=False):
+            return False
+
+        self._thread = threading.Thread(target=self._run_locked, name='detection-compaction', daemon=True)
+        self._thread.start()
+        return True
+
+    def run_compaction(self, older_than_days: Optional[int] = None) -> Dict:
+        """
+        在当前线程中执行压缩
+
+        Args:
+            older_than_days: 保留明细的天数，默认使用 compact_after_days
+
+        Returns:
+            压缩结果
+
+        Raises:
+            CompactionBusy: 已有压缩任务在运行
+        """
+        if not self._run_lock.acquire(blocking=False):
+            raise CompactionBusy('检测记录压缩任务正在运行')
+        return self._run_locked(older_than_days)
+
+    def get_status(self) -> Dict:
+        """获取压缩服务状态"""
+        return {
+            'enabled': self.enabled,
+            'running': self.is_running(),
+            'compact_after_days': self.compact_after_days,
+            'cutoff': self.cutoff().isoformat(),
+            'last_result': self._last_result,
+        }
+
+    # ------------------------------------------------------------------
+    # 读取汇总
+    # ------------------------------------------------------------------
+
+    def summary_filters(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                        website_ids: Optional[Iterable[int]] = None) -> List:
+        """
+        汇总的过滤条件（按小时起始时间落在范围内）
+
+        Args:
+            start_date: 起始时间
+            end_date: 结束时间
+            website_ids: 网站ID列表
+
+        Returns:
+            过滤条件列表
+        """
+        S = DetectionHourlySummary
+        conditions = []
+        if start_date is not None:
+            conditions.append(S.hour_start >= start_date.replace(tzinfo=None))
+        if end_date is not None:
+            conditions.append(S.hour_start <= end_date.replace(tzinfo=None))
+        if website_ids:
+            conditions.append(S.website_id.in_(list(website_ids)))
+        return conditions
+
+    def covers(self, start_date: Optional[datetime]) -> bool:
+        """查询范围是否可能包含已压缩的数据"""
+        return start_date is None or start_date.replace(tzinfo=None) < self.cutoff()
+
+    # ------------------------------------------------------------------
+    # 压缩
+    # ------------------------------------------------------------------
+
+    def _run_locked(self, older_than_days: Optional[int] = None) -> Dict:
+        """持有运行锁执行压缩，结束后释放"""
+        try:
+            result = self._compact(older_than_days)
+            self._last_result = result
+            return result
+        except Exception as e:
+            logger.error(f"检测记录压缩失败: {e}")
+            self._last_result = {'status': 'failed', 'error': str(e), 'finished_at': get_beijing_time().isoformat()}
+            raise
+        finally:
+            self._run_lock.release()
+
+    def _compact(self, older_than_days: Optional[int]) -> Dict:
+        """逐表分块压缩早于截止时间的检测记录，并清理过期汇总"""
+        days = self.compact_after_days if older_than_days is None else older_than_days
+        cutoff = hour_floor(datetime.now() - timedelta(days=days))
+        started = time.monotonic()
+        result = {
+            'status': 'completed',
+            'cutoff': cutoff.isoformat(),
+            'compacted_records': 0,
+            'compacted_checks': 0,
+            'summaries_touched': 0,
+            'archived_records': 0,
+            'chunks': 0,
+            'summaries_purged': 0,
+        }
+
+        for table in detection_storage.physical_tables(end_date=cutoff):
+            last_id = 0
+            while True:
+                last_id = self._compact_chunk(table, cutoff, last_id, result)
+                if last_id is None:
+                    break
+
+        result['summaries_purged'] = self._purge_expired_summaries()
+        result['elapsed_seconds'] = round(time.monotonic() - started, 2)
+        result['finished_at'] = get_beijing_time().isoformat()
+
+        if result['compacted_records']:
+            logger.info(
+                f"检测记录压缩完成: {result['compacted_records']} 条记录（{result['compacted_checks']} 次检测）"
+                f"汇总到 {result['summaries_touched']} 个小时汇总，耗时 {result['elapsed_seconds']}s"
+            )
+        return result
+
+    def _compact_chunk(self, table, cutoff: datetime, last_id: int, result: Dict) -> Optional[int]:
+        """
+        汇总并删除一块检测记录
+
+        Returns:
+            本块最后一条记录的ID，没有更多记录时返回None
+        """
+        c = table.c
+        with get_write_db() as db:
+            rows = db.execute(
+                select(table)
+                .where(c.id > last_id, func.coalesce(c.last_seen_at, c.detected_at) < cutoff)
+                .order_by(c.id)
+                .limit(self.chunk_size)
+            ).all()
+            if not rows:
+                return None
+
+            partials = self._aggregate(rows)
+            self._merge_summaries(db, partials)
+
+            # 明细先写入冷归档，归档失败时本块回滚
+            if archive_service.enabled:
+                result['archived_records'] += archive_service.write_rows(rows, 'compaction', table.name)
+
+            ids = [row.id for row in rows]
+            if db.get_bind().dialect.name != 'sqlite':
+                # 外键约束生效的数据库需先解除状态变化记录对待删检测记录的引用
+                for column in (WebsiteStatusChange.previous_detection_id, WebsiteStatusChange.current_detection_id):
+                    db.execute(
+                        update(WebsiteStatusChange)
+                        .where(column.in_(ids))
+                        .values({column.key: None})
+                        .execution_options(synchronize_session=False)
+                    )
+            db.execute(delete(table).where(c.id.in_(ids)))
+
+        # 明细已移入汇总，失效涉及的任务和网站的检测数据缓存
+        invalidate_detections({row.task_id for row in rows}, {row.website_id for row in rows})
+
+        result['compacted_records'] += len(rows)
+        result['compacted_checks'] += sum(row.check_count or 1 for row in rows)
+        result['summaries_touched'] += len(partials)
+        result['chunks'] += 1
+        return ids[-1]
+
+    @staticmethod
+    def _aggregate(rows) -> Dict[SummaryKey, Dict]:
+        """按 网站 × 小时 汇总一块检测记录（合并记录按检测次数加权，归入起始小时）"""
+        partials: Dict[SummaryKey, Dict] = {}
+        for row in rows:
+            key = (row.website_id, hour_floor(row.detected_at))
+            partial = partials.get(key)
+            if partial is None:
+                partial = partials[key] = {
+                    'total_count': 0, 'standard_count': 0, 'redirect_count': 0, 'failed_count': 0,
+                    'response_time_sum': 0.0, 'response_time_count': 0,
+                    'min_response_time': None, 'max_response_time': None,
+                    'sketch': LatencySketch(),
+                    'first_failure_at': None, 'first_failure_reason': None,
+                    'last_failure_at': None, 'last_failure_reason': None,
+                }
+
+            checks = row.check_count or 1
+            partial['total_count'] += checks
+            field = STATUS_FIELDS.get(row.status)
+            if field:
+                partial[field] += checks
+
+            if row.response_time is not None:
+                partial['response_time_sum'] += row.response_time * checks
+                partial['response_time_count'] += checks
+                partial['sketch'].add(row.response_time, checks)
+                low = row.min_response_time if row.min_response_time is not None else row.response_time
+                high = row.max_response_time if row.max_response_time is not None else row.response_time
+                if partial['min_response_time'] is None or low < partial['min_response_time']:
+                    partial['min_response_time'] = low
+                if partial['max_response_time'] is None or high > partial['max_response_time']:
+                    partial['max_response_time'] = high
+
+            if row.status == 'failed':
+                failed_from = row.detected_at
+                failed_until = row.last_seen_at or row.detected_at
+                reason = row.failure_reason or 'unknown'
+                if partial['first_failure_at'] is None or failed_from < partial['first_failure_at']:
+                    partial['first_failure_at'] = failed_from
+                    partial['first_failure_reason'] = reason
+                if partial['last_failure_at'] is None or failed_until >= partial['last_failure_at']:
+                    partial['last_failure_at'] = failed_until
+                    partial['last_failure_reason'] = reason
+        return partials
+
+    @staticmethod
+    def _merge_summaries(db, partials: Dict[SummaryKey, Dict]):
+        """将部分汇总合并到已有的小时汇总（不存在时新建）"""
+        S = DetectionHourlySummary
+        website_ids = sorted({website_id for website_id, _ in partials})
+        hours = [hour for _, hour in partials]
+        existing = {
+            (summary.website_id, summary.hour_start): summary
+            for summary in db.query(S).filter(
+                S.website_id.in_(website_ids),
+                S.hour_start >= min(hours),
+                S.hour_start <= max(hours)
+            )
+        }
+
+        for key, partial in partials.items():
+            summary = existing.get(key)
+            if summary is None:
+                summary = S(
+                    website_id=key[0], hour_start=key[1],
+                    total_count=0, standard_count=0, redirect_count=0, failed_count=0,
+                    response_time_sum=0.0, response_time_count=0
+                )
+                db.add(summary)
+
+            for field in ('total_count', 'standard_count', 'redirect_count', 'failed_count',
+                          'response_time_sum', 'response_time_count'):
+                setattr(summary, field, (getattr(summary, field) or 0) + partial[field])
+
+            if partial['min_response_time'] is not None:
+                if summary.min_response_time is None or partial['min_response_time'] < summary.min_response_time:
+                    summary.min_response_time = partial['min_response_time']
+                if summary.max_response_time is None or partial['max_response_time'] > summary.max_response_time:
+                    summary.max_response_time = partial['max_response_time']
+
+            if partial['sketch'].count:
+                summary.latency_sketch = LatencySketch.from_bytes(summary.latency_sketch) \
+                    .merge(partial['sketch']).to_bytes()
+
+            if partial['first_failure_at'] is not None:
+                if summary.first_failure_at is None or partial['first_failure_at'] < summary.first_failure_at:
+                    summary.first_failure_at = partial['first_failure_at']
+                    summary.first_failure_reason = partial['first_failure_reason']
+                if summary.last_failure_at is None or partial['last_failure_at'] >= summary.last_failure_at:
+                    summary.last_failure_at = partial['last_failure_at']
+                    summary.last_failure_reason = partial['last_failure_reason']
+
+    def _purge_expired_summaries(self) -> int:
+        """删除超过汇总保留天数的小时汇总"""
+        if not self.summary_retention_days:
+            return 0
+        expire_before = datetime.now() - timedelta(days=self.summary_retention_days)
+        with get_write_db() as db:
+            result = db.execute(
+                delete(DetectionHourlySummary).where(DetectionHourlySummary.hour_start < expire_before)
+            )
+            return max(result.rowcount or 0, 0)
+
+
+# 全局检测记录压缩服务实例
+compaction_service = CompactionService()
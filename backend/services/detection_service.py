@@ -8,8 +8,9 @@ from typing import List, Optional
 from datetime import datetime
 
 from .batch_detector import BatchDetectionService, BatchDetectionConfig
+from .result_writer import result_writer, build_detection_row
 from ..database import get_db
-from ..models import DetectionTask, Website, DetectionRecord
+from ..models import DetectionTask, Website
 from ..utils.helpers import get_beijing_time
 
 logger = logging.getLogger(__name__)
@@ -144,31 +145,15 @@ class DetectionService:
                     failed_result.detected_at = get_beijing_time()
                     ordered_results.append(failed_result)
             
-            # 保存到数据库
-            with get_db() as db:
-                records = []
-                for i, (website, result) in enumerate(zip(websites, ordered_results)):
-                    record = DetectionRecord(
-                        task_id=task_id,
-                        website_id=website.id,
-                        status=result.status,
-                        http_status_code=result.http_status_code,
-                        response_time=result.response_time,
-                        final_url=result.final_url,
-                        page_title=result.page_title,
-                        page_content_length=result.page_content_length,
-                        error_message=result.error_message,
-                        failure_reason=result.failure_reason,
-                        detected_at=result.detected_at.replace(tzinfo=None) if result.detected_at else get_beijing_time().replace(tzinfo=None),
-                        detection_duration=result.detection_duration
-                    )
-                    records.append(record)
-                
-                db.add_all(records)
-                db.commit()
-                
-                logger.info(f"保存了 {len(records)} 条检测记录")
-                return True
+            # 提交到写入缓冲，由后台批量落库
+            rows = [
+                build_detection_row(task_id, website.id, result)
+                for website, result in zip(websites, ordered_results)
+            ]
+            result_writer.submit(rows)
+            
+            logger.info(f"提交了 {len(rows)} 条检测记录")
+            return True
                 
         except Exception as e:
             logger.error(f"保存检测结果失败: {e}")
@@ -0,0 +1,606 @@
+"""
+检测记录分区存储
+可选的按时间分区布局，保留期清理变为整体删除分区
+- SQLite: 按月/周建立分区表 detection_records_pYYYYMM / detection_records_pYYYYwWW，
+  写入按检测时间路由到分区表；分区ID从 分区起始日序号 × ID_SPAN 开始，全局唯一且可由ID定位分区；
+  读取时按时间范围合并相关分区（UNION ALL），启用前的数据保留在 detection_records 中一并读取
+- MySQL: detection_records 使用原生 RANGE 分区，查询依靠分区裁剪，后续分区提前创建
+- 未启用时写入和读取直接使用 detection_records
+- 变化存储模式下一条记录覆盖 [detected_at, last_seen_at] 区间，时间范围查询按区间重叠过滤
+"""
+
+import bisect
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, event, func, insert, select, text, union_all
+from sqlalchemy.orm import aliased
+
+from ..config import Config
+from ..database import writer_engine
+from ..models import DetectionRecord
+
+logger = logging.getLogger(__name__)
+
+BASE_TABLE = DetectionRecord.__table__.name
+MYSQL_MAX_PARTITION = 'pmax'
+
+# 每个分区可用的ID空间（按分区起始日序号偏移），周分区也可容纳数十亿行
+ID_SPAN = 10 ** 9
+
+
+class DetectionStorage:
+    """检测记录分区存储"""
+
+    def __init__(self, db_engine=None, config: Dict = None):
+        """
+        初始化分区存储
+
+        Args:
+            db_engine: 数据库引擎，默认使用写引擎（建表和分区维护需要写锁）
+            config: 分区配置，默认使用 DETECTION_PARTITION_CONFIG
+        """
+        config = config or getattr(Config, 'DETECTION_PARTITION_CONFIG', {})
+        self.engine = db_engine or writer_engine
+        self.enabled = bool(config.get('enabled', False))
+        self.granularity = config.get('granularity', 'month')
+        self.premake_periods = config.get('premake_periods', 2)
+        if self.granularity not in ('month', 'week'):
+            raise ValueError(f"不支持的分区粒度: {self.granularity}")
+
+        # 变化存储模式下单条记录可覆盖的最长时间，时间范围查询需向前放宽
+        change_only = getattr(Config, 'CHANGE_ONLY_STORAGE_CONFIG', {})
+        self.run_span = timedelta(hours=change_only.get('max_run_hours', 24)) \
+            if change_only.get('enabled') else timedelta(0)
+
+        self.mode: Optional[str] = None  # single, sqlite_tables, mysql_native
+        self._lock = threading.RLock()
+        self._metadata = MetaData()
+        self._tables: Dict[str, Table] = {}
+        # 已提交的SQLite分区：按起始日期排序
+        self._starts: List[date] = []
+        self._bases: List[int] = []
+
+    # ------------------------------------------------------------------
+    # 分区周期
+    # ------------------------------------------------------------------
+
+    def period_start(self, value) -> date:
+        """检测时间所属分区的起始日期"""
+        day = value.date() if isinstance(value, datetime) else value
+        if self.granularity == 'week':
+            return day - timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    def next_period_start(self, start: date) -> date:
+        """下一个分区的起始日期"""
+        if self.granularity == 'week':
+            return start + timedelta(days=7)
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def partition_name(self, start: date) -> str:
+        """分区名称（MySQL 分区名，SQLite 分区表名后缀）"""
+        if self.granularity == 'week':
+            year, week, _ = start.isocalendar()
+            return f'p{year}w{week:02d}'
+        return f'p{start:%Y%m}'
+
+    def table_name(self, start: date) -> str:
+        """SQLite 分区表名"""
+        return f'{BASE_TABLE}_{self.partition_name(start)}'
+
+    @staticmethod
+    def parse_partition_name(name: str) -> Optional[date]:
+        """由分区名解析起始日期，非分区名返回None"""
+        try:
+            if len(name) == 8 and name[0] == 'p' and name[5] == 'w':
+                return date.fromisocalendar(int(name[1:5]), int(name[6:8]), 1)
+            if len(name) == 7 and name[0] == 'p':
+                return date(int(name[1:5]), int(name[5:7]), 1)
+        except ValueError:
+            pass
+        return None
+
+    # ------------------------------------------------------------------
+    # 初始化与维护
+    # ------------------------------------------------------------------
+
+    def ensure_layout(self) -> str:
+        """
+        初始化存储布局（幂等）
+        SQLite 加载已有分区表（即使未启用也需读取），启用时预建后续分区；
+        MySQL 启用时将 detection_records 转换为 RANGE 分区表
+
+        Returns:
+            当前存储模式
+        """
+        with self._lock:
+            if self.mode is not None:
+                return self.mode
+
+            dialect = self.engine.dialect.name
+            try:
+                if dialect == 'sqlite':
+                    self._load_sqlite_partitions()
+                    self.mode = 'sqlite_tables' if self.enabled else 'single'
+                elif dialect == 'mysql' and self.enabled:
+                    self._ensure_mysql_partitioning()
+                    self.mode = 'mysql_native'
+                else:
+                    self.mode = 'single'
+            except Exception as e:
+                logger.error(f"初始化检测记录分区失败，使用单表存储: {e}")
+                self.mode = 'single'
+
+            if self.mode != 'single':
+                self.premake_partitions()
+
+            logger.info(f"检测记录存储就绪，模式: {self.mode}")
+            return self.mode
+
+    def premake_partitions(self):
+        """提前创建当前及后续分区，避免写入时建表或写入 MySQL 的 pmax 分区"""
+        mode = self.ensure_layout()
+        start = self.period_start(datetime.now())
+        starts = [start]
+        for _ in range(self.premake_periods):
+            starts.append(self.next_period_start(starts[-1]))
+
+        try:
+            if mode == 'sqlite_tables':
+                for period in starts:
+                    if self._committed_table(period) is None:
+                        with self.engine.begin() as conn:
+                            self._create_sqlite_partition(conn, period)
+                        self._register_sqlite_partition(period)
+            elif mode == 'mysql_native':
+                with self.engine.begin() as conn:
+                    self._premake_mysql_partitions(conn, self.next_period_start(starts[-1]))
+        except Exception as e:
+            logger.error(f"预建检测记录分区失败: {e}")
+
+    def get_stats(self) -> Dict:
+        """获取分区存储状态"""
+        mode = self.ensure_layout()
+        partitions = []
+        if mode == 'mysql_native':
+            try:
+                with self.engine.connect() as conn:
+                    partitions = [
+                        {'name': name, 'rows': rows}
+                        for name, _, rows in self._mysql_partitions(conn)
+                    ]
+            except Exception as e:
+                logger.warning(f"读取MySQL分区信息失败: {e}")
+        else:
+            with self._lock:
+                partitions = [
+                    {'name': self.table_name(start), 'start': start.isoformat(), 'id_base': base}
+                    for start, base in zip(self._starts, self._bases)
+                ]
+
+        return {
+            'mode': mode,
+            'enabled': self.enabled,
+            'granularity': self.granularity,
+            'partitions': partitions,
+        }
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def insert_rows(self, db, rows: List[Dict]) -> List[int]:
+        """
+        批量写入检测记录，分区模式下按检测时间路由到分区表
+
+        Args:
+            db: 数据库会话（调用方负责提交）
+            rows: 检测记录字段字典列表
+
+        Returns:
+            按提交顺序排列的检测记录ID
+        """
+        if self.ensure_layout() != 'sqlite_tables':
+            return self._insert_into(db, DetectionRecord.__table__, rows)
+
+        groups: Dict[date, List[Tuple[int, Dict]]] = {}
+        for position, row in enumerate(rows):
+            start = self.period_start(row.get('detected_at') or datetime.now())
+            groups.setdefault(start, []).append((position, row))
+
+        record_ids: List[int] = [0] * len(rows)
+        for start, items in groups.items():
+            table = self._partition_for_write(db, start)
+            ids = self._insert_into(db, table, [row for _, row in items])
+            for (position, _), record_id in zip(items, ids):
+                record_ids[position] = record_id
+        return record_ids
+
+    def _insert_into(self, db, table: Table, rows: List[Dict]) -> List[int]:
+        """向指定表批量插入并返回按顺序排列的ID"""
+        dialect = db.get_bind().dialect
+
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+            return list(db.scalars(stmt, rows))
+
+        if table is DetectionRecord.__table__:
+            # 不支持 RETURNING 的数据库通过ORM刷新获取ID
+            records = [DetectionRecord(**row) for row in rows]
+            db.add_all(records)
+            db.flush()
+            return [record.id for record in records]
+
+        return [db.execute(insert(table).values(**row)).inserted_primary_key[0] for row in rows]
+
+    def _partition_for_write(self, db, start: date) -> Table:
+        """获取写入用的分区表，不存在时在当前事务中创建，提交后对读取可见"""
+        table = self._committed_table(start)
+        if table is not None:
+            return table
+
+        table = self._create_sqlite_partition(db.connection(), start)
+        event.listen(db, 'after_commit', lambda session: self._register_sqlite_partition(start), once=True)
+        return table
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def record_source(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+        """
+        获取检测记录查询实体
+        SQLite 分区模式下返回覆盖时间范围的分区 UNION ALL 别名，其余情况返回 DetectionRecord
+
+        Args:
+            start_date: 查询起始时间，用于裁剪分区
+            end_date: 查询结束时间，用于裁剪分区
+
+        Returns:
+            可像 DetectionRecord 一样使用的ORM实体
+        """
+        self.ensure_layout()
+        start_date = start_date.replace(tzinfo=None) - self.run_span if start_date else None
+        end_date = end_date.replace(tzinfo=None) if end_date else None
+        with self._lock:
+            tables = [
+                self._tables[self.table_name(start)]
+                for start in self._starts
+                if (end_date is None or datetime.combine(start, datetime.min.time()) <= end_date)
+                and (start_date is None or datetime.combine(self.next_period_start(start), datetime.min.time()) > start_date)
+            ]
+        return self._source_for_tables(tables)
+
+    def window_conditions(self, R, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None) -> List:
+        """
+        时间范围过滤条件：记录区间 [detected_at, last_seen_at] 与查询范围重叠
+
+        Args:
+            R: record_source 返回的查询实体
+            start_date: 查询起始时间
+            end_date: 查询结束时间
+
+        Returns:
+            过滤条件列表
+        """
+        conditions = []
+        if start_date is not None:
+            if self.run_span:
+                # 起始时间放宽 run_span 以便使用 detected_at 索引
+                conditions.append(R.detected_at >= start_date - self.run_span)
+                conditions.append(func.coalesce(R.last_seen_at, R.detected_at) >= start_date)
+            else:
+                conditions.append(R.detected_at >= start_date)
+        if end_date is not None:
+            conditions.append(R.detected_at <= end_date)
+        return conditions
+
+    @staticmethod
+    def check_weight(R):
+        """记录代表的检测次数（合并记录大于1，旧数据为空时按1计）"""
+        return func.coalesce(R.check_count, 1)
+
+    def table_for_id(self, record_id: int) -> Table:
+        """检测记录所在的表（基础表或分区表）"""
+        with self._lock:
+            index = bisect.bisect_right(self._bases, record_id) - 1
+            if index >= 0:
+                return self._tables[self.table_name(self._starts[index])]
+        return DetectionRecord.__table__
+
+    def physical_tables(self, end_date: Optional[datetime] = None) -> List[Table]:
+        """
+        存放检测记录的实际表（基础表在首位，其后为起始时间不晚于 end_date 的分区表）
+
+        Args:
+            end_date: 只返回可能包含该时间之前记录的分区
+
+        Returns:
+            表对象列表
+        """
+        self.ensure_layout()
+        end_date = end_date.replace(tzinfo=None) if end_date else None
+        with self._lock:
+            tables = [
+                self._tables[self.table_name(start)]
+                for start in self._starts
+                if end_date is None or datetime.combine(start, datetime.min.time()) < end_date
+            ]
+        return [DetectionRecord.__table__] + tables
+
+    def records_by_ids(self, db, record_ids: Iterable[int]) -> List[DetectionRecord]:
+        """
+        按ID加载检测记录（按ID定位分区）
+
+        Args:
+            db: 数据库会话
+            record_ids: 检测记录ID
+
+        Returns:
+            按ID排序的检测记录
+        """
+        record_ids = list(record_ids)
+        if not record_ids:
+            return []
+
+        self.ensure_layout()
+        with self._lock:
+            starts = set()
+            for record_id in record_ids:
+                index = bisect.bisect_right(self._bases, record_id) - 1
+                if index >= 0:
+                    starts.add(self._starts[index])
+            tables = [self._tables[self.table_name(start)] for start in sorted(starts)]
+
+        R = self._source_for_tables(tables)
+        return db.query(R).filter(R.id.in_(record_ids)).order_by(R.id).all()
+
+    def _source_for_tables(self, tables: List[Table]):
+        """合并基础表与分区表；基础表在首位，使合并结果的列对应到 DetectionRecord"""
+        if not tables:
+            return DetectionRecord
+
+        base = DetectionRecord.__table__
+        selects = [select(*base.c)] + [select(*table.c) for table in tables]
+        return aliased(DetectionRecord, union_all(*selects).subquery(f'{BASE_TABLE}_all'))
+
+    # ------------------------------------------------------------------
+    # 删除与保留期
+    # ------------------------------------------------------------------
+
+    def delete_partition_records(self, conn, website_ids: Iterable[int] = None, task_id: Optional[int] = None) -> int:
+        """
+        删除分区表中属于指定网站或任务的检测记录（基础表由调用方处理）
+
+        Args:
+            conn: 数据库会话或连接（写连接）
+            website_ids: 网站ID列表
+            task_id: 任务ID
+
+        Returns:
+            删除的记录数
+        """
+        self.ensure_layout()
+        website_ids = list(website_ids or [])
+        with self._lock:
+            tables = [self._tables[self.table_name(start)] for start in self._starts]
+
+        deleted = 0
+        for table in tables:
+            if website_ids:
+                result = conn.execute(delete(table).where(table.c.website_id.in_(website_ids)))
+                deleted += max(result.rowcount or 0, 0)
+            if task_id is not None:
+                result = conn.execute(delete(table).where(table.c.task_id == task_id))
+                deleted += max(result.rowcount or 0, 0)
+        return deleted
+
+    def drop_expired_partitions(self, cutoff: Optional[datetime]) -> List[str]:
+        """
+        删除整个分区周期都早于截止时间的分区
+
+        Args:
+            cutoff: 截止时间，None 表示删除全部分区
+
+        Returns:
+            已删除的分区名称
+        """
+        mode = self.ensure_layout()
+        if mode == 'sqlite_tables' or (mode == 'single' and self._starts):
+            return self._drop_sqlite_partitions(cutoff)
+        if mode == 'mysql_native':
+            return self._drop_mysql_partitions(cutoff)
+        return []
+
+    def _is_expired(self, start: date, cutoff: Optional[datetime]) -> bool:
+        if cutoff is None:
+            return True
+        return datetime.combine(self.next_period_start(start), datetime.min.time()) <= cutoff.replace(tzinfo=None)
+
+    # ------------------------------------------------------------------
+    # SQLite 分区表
+    # ------------------------------------------------------------------
+
+    def _table(self, start: date) -> Table:
+        """构造（或获取缓存的）分区表定义：与基础表同列同索引，不含外键"""
+        name = self.table_name(start)
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                base = DetectionRecord.__table__
+                table = Table(
+                    name, self._metadata,
+                    *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in base.c],
+                    sqlite_autoincrement=True
+                )
+                for index in base.indexes:
+                    columns = [table.c[column.name] for column in index.columns]
+                    Index(f"ix_{name}_{'_'.join(column.name for column in columns)}", *columns)
+                self._tables[name] = table
+            return table
+
+    def _committed_table(self, start: date) -> Optional[Table]:
+        """已提交的分区表，不存在时返回None"""
+        with self._lock:
+            index = bisect.bisect_left(self._starts, start)
+            if index < len(self._starts) and self._starts[index] == start:
+                return self._tables[self.table_name(start)]
+        return None
+
+    def _create_sqlite_partition(self, conn, start: date) -> Table:
+        """创建分区表并设置自增起点"""
+        table = self._table(start)
+        table.create(conn, checkfirst=True)
+        conn.execute(
+            text("""
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT :name, :seq WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)
+            """),
+            {'name': table.name, 'seq': start.toordinal() * ID_SPAN}
+        )
+        logger.info(f"创建检测记录分区表: {table.name}")
+        return table
+
+    def _register_sqlite_partition(self, start: date):
+        """登记已提交的分区表"""
+        self._table(start)
+        with self._lock:
+            if start not in self._starts:
+                index = bisect.bisect_left(self._starts, start)
+                self._starts.insert(index, start)
+                self._bases.insert(index, start.toordinal() * ID_SPAN)
+
+    def _unregister_sqlite_partition(self, start: date):
+        with self._lock:
+            if start in self._starts:
+                index = self._starts.index(start)
+                del self._starts[index]
+                del self._bases[index]
+
+    def _load_sqlite_partitions(self):
+        """加载数据库中已有的分区表"""
+        prefix = f'{BASE_TABLE}_'
+        with self.engine.connect() as conn:
+            names = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :pattern"),
+                {'pattern': f'{prefix}p%'}
+            ).scalars().all()
+
+        for name in names:
+            start = self.parse_partition_name(name[len(prefix):])
+            if start and self.table_name(start) == name:
+                self._register_sqlite_partition(start)
+
+    def _drop_sqlite_partitions(self, cutoff: Optional[datetime]) -> List[str]:
+        with self._lock:
+            expired = [start for start in self._starts if self._is_expired(start, cutoff)]
+
+        dropped = []
+        for start in expired:
+            name = self.table_name(start)
+            # 先从读取路径移除再删表
+            self._unregister_sqlite_partition(start)
+            with self.engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': name})
+            dropped.append(name)
+            logger.info(f"删除过期检测记录分区表: {name}")
+        return dropped
+
+    # ------------------------------------------------------------------
+    # MySQL 原生分区
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _to_days(day: date) -> int:
+        """与 MySQL TO_DAYS() 相同的日序号"""
+        return day.toordinal() + 365
+
+    def _mysql_partitions(self, conn) -> List[Tuple[str, Optional[int], int]]:
+        """读取 detection_records 的分区（名称、上界 TO_DAYS、行数估计）"""
+        rows = conn.execute(text("""
+            SELECT partition_name, partition_description, table_rows
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = :table AND partition_name IS NOT NULL
+            ORDER BY partition_ordinal_position
+        """), {'table': BASE_TABLE}).all()
+        return [
+            (name, None if description == 'MAXVALUE' else int(description), rows or 0)
+            for name, description, rows in rows
+        ]
+
+    def _mysql_partition_clause(self, start: date, end: date) -> str:
+        """生成 [start, end) 范围内各周期的分区定义"""
+        definitions = []
+        period = start
+        while period < end:
+            upper = self.next_period_start(period)
+            definitions.append(f"PARTITION {self.partition_name(period)} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))")
+            period = upper
+        return ', '.join(definitions)
+
+    def _ensure_mysql_partitioning(self):
+        """将 detection_records 转换为按检测时间的 RANGE 分区表"""
+        with self.engine.begin() as conn:
+            if self._mysql_partitions(conn):
+                return
+
+            logger.warning("正在将 detection_records 转换为分区表，数据量大时耗时较长")
+
+            # 分区表不支持外键，且主键必须包含分区列
+            foreign_keys = conn.execute(text("""
+                SELECT table_name, constraint_name FROM information_schema.referential_constraints
+                WHERE constraint_schema = DATABASE()
+                  AND (table_name = :table OR referenced_table_name = :table)
+            """), {'table': BASE_TABLE}).all()
+            for table_name, constraint_name in foreign_keys:
+                conn.execute(text(f"ALTER TABLE `{table_name}` DROP FOREIGN KEY `{constraint_name}`"))
+
+            conn.execute(text(f"ALTER TABLE {BASE_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, detected_at)"))
+
+            oldest = conn.execute(text(f"SELECT MIN(detected_at) FROM {BASE_TABLE}")).scalar() or datetime.now()
+            end = self.next_period_start(self.period_start(datetime.now()))
+            clause = self._mysql_partition_clause(self.period_start(oldest), end)
+            conn.execute(text(
+                f"ALTER TABLE {BASE_TABLE} PARTITION BY RANGE (TO_DAYS(detected_at)) "
+                f"({clause}, PARTITION {MYSQL_MAX_PARTITION} VALUES LESS THAN MAXVALUE)"
+            ))
+            logger.info("detection_records 已转换为分区表")
+
+    def _premake_mysql_partitions(self, conn, end: date):
+        """从 pmax 中拆分出截至 end 的周期分区"""
+        bounds = [upper for _, upper, _ in self._mysql_partitions(conn) if upper is not None]
+        if not bounds:
+            return
+
+        start = date.fromordinal(max(bounds) - 365)
+        if start >= end:
+            return
+
+        clause = self._mysql_partition_clause(start, end)
+        conn.execute(text(
+            f"ALTER TABLE {BASE_TABLE} REORGANIZE PARTITION {MYSQL_MAX_PARTITION} INTO "
+            f"({clause}, PARTITION {MYSQL_MAX_PARTITION} VALUES LESS THAN MAXVALUE)"
+        ))
+        logger.info(f"预建检测记录分区至 {end.isoformat()}")
+
+    def _drop_mysql_partitions(self, cutoff: Optional[datetime]) -> List[str]:
+        with self.engine.begin() as conn:
+            # 上界不超过截止时间的分区整体过期，pmax 不删除
+            limit = None if cutoff is None else self._to_days(cutoff.date())
+            expired = [
+                name for name, upper, _ in self._mysql_partitions(conn)
+                if upper is not None and (limit is None or upper <= limit)
+            ]
+            if expired:
+                conn.execute(text(f"ALTER TABLE {BASE_TABLE} DROP PARTITION {', '.join(expired)}"))
+                logger.info(f"删除过期检测记录分区: {', '.join(expired)}")
+        return expired
+
+
+# 全局检测记录存储实例
+detection_storage = DetectionStorage()
@@ -0,0 +1,290 @@
+"""
+后台导出任务服务
+导出在线程池中执行，请求只负责创建任务并立即返回任务ID：
+- 任务状态、进度和结果文件记录在 ExportJob 表中，多个工作进程均可查询、取消和下载
+- 进度按时间间隔写入数据库，同时检查取消标记，取消后中止导出并删除临时文件
+- 结果文件在导出完成后原子重命名，过期后由调度服务清理
+"""
+
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ..config import Config
+from ..database import get_db
+from ..models import ExportJob
+from ..utils.helpers import get_beijing_time
+from .export_service import ExportCancelled, ExportService
+from .export_writers import EXPORT_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+# 进行中的任务状态
+ACTIVE_STATUSES = ('pending', 'running', 'cancelling')
+
+
+def _now() -> datetime:
+    """当前北京时间（不带时区，与数据库中的时间字段直接比较）"""
+    return get_beijing_time().replace(tzinfo=None)
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class ExportJobService:
+    """后台导出任务服务"""
+
+    def __init__(self, config: Dict = None):
+        config = config or Config.EXPORT_JOB_CONFIG
+        self.max_workers = config.get('max_workers', 2)
+        self.expire_hours = config.get('expire_hours', 24)
+        self.progress_interval = config.get('progress_interval_seconds', 1.0)
+        self.purge_interval_hours = config.get('purge_interval_hours', 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._export_service: Optional[ExportService] = None
+
+    @property
+    def export_service(self) -> ExportService:
+        if self._export_service is None:
+            self._export_service = ExportService()
+        return self._export_service
+
+    def _submit(self, job_id: str):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='export-job')
+            self._executor.submit(self.run_job, job_id)
+
+    def create_job(self, export_format: str, params: Dict) -> Dict:
+        """
+        创建导出任务并提交到后台执行
+
+        Args:
+            export_format: 导出格式（excel、csv、json、ndjson）
+            params: 导出参数（task_id、website_ids、start_date、end_date，日期为 ISO 格式字符串）
+
+        Returns:
+            任务信息
+
+        Raises:
+            ValueError: 导出格式或参数无效
+        """
+        export_format = (export_format or '').lower()
+        if export_format not in EXPORT_EXTENSIONS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+        for key, label in (('start_date', '开始日期'), ('end_date', '结束日期')):
+            try:
+                _parse_datetime(params.get(key))
+            except (TypeError, ValueError):
+                raise ValueError(f"{label}格式错误")
+
+        job_id = uuid.uuid4().hex
+        with get_db() as db:
+            job = ExportJob(
+                id=job_id,
+                export_type='detection_results',
+                export_format=export_format,
+                params=params,
+                status='pending',
+                progress=0,
+                processed_rows=0,
+                created_at=_now()
+            )
+            db.add(job)
+            db.flush()
+            data = job.to_dict()
+
+        self._submit(job_id)
+        logger.info(f"导出任务已创建: {job_id}, 格式: {export_format}")
+        return data
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """获取任务信息"""
+        with get_db() as db:
+            job = db.get(ExportJob, job_id)
+            return job.to_dict() if job else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """按创建时间倒序列出最近的任务"""
+        with get_db() as db:
+            jobs = db.query(ExportJob).order_by(ExportJob.created_at.desc()).limit(limit).all()
+            return [job.to_dict() for job in jobs]
+
+    def cancel_job(self, job_id: str) -> Optional[Dict]:
+        """
+        取消任务
+        排队中的任务直接取消；导出中的任务标记为取消中，由执行线程在下次写入进度时中止
+
+        Returns:
+            任务信息，任务不存在时返回None
+        """
+        with get_db() as db:
+            job = db.get(ExportJob, job_id)
+            if job is None:
+                return None
+            if job.status == 'pending':
+                job.status = 'cancelled'
+                job.finished_at = _now()
+            elif job.status == 'running':
+                job.status = 'cancelling'
+            db.flush()
+            return job.to_dict()
+
+    def get_download(self, job_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        获取可下载的结果文件
+
+        Returns:
+            (任务信息, 文件路径)，任务不存在时均为None，结果不可下载时文件路径为None
+        """
+        job = self.get_job(job_id)
+        if job is None or job['status'] != 'completed':
+            return job, None
+        file_path = os.path.join(self.export_service.download_dir, job['file_name'])
+        if not os.path.isfile(file_path):
+            return job, None
+        return job, file_path
+
+    def run_job(self, job_id: str):
+        """执行导出任务（线程池中运行）"""
+        with get_db() as db:
+            job = db.get(ExportJob, job_id)
+            if job is None or job.status != 'pending':
+                return
+            job.status = 'running'
+            job.started_at = _now()
+            export_format = job.export_format
+            params = dict(job.params or {})
+
+        last_update = [0.0]
+
+        def on_progress(processed: int, total: int, done: bool = False):
+            # 按时间间隔节流，开始和结束时的调用总是写入
+            now = datetime.now().timestamp()
+            if processed and not done and now - last_update[0] < self.progress_interval:
+                return
+            last_update[0] = now
+            self._update_progress(job_id, processed, total)
+
+        try:
+            with get_db() as db:
+                result = self.export_service.export_detection_results(
+                    db=db,
+                    task_id=params.get('task_id'),
+                    website_ids=params.get('website_ids'),
+                    start_date=_parse_datetime(params.get('start_date')),
+                    end_date=_parse_datetime(params.get('end_date')),
+                    export_format=export_format,
+                    include_task_info=params.get('include_task_info', True),
+                    progress_callback=on_progress
+                )
+
+            if result.success:
+                self._finish(
+                    job_id,
+                    status='completed',
+                    progress=100,
+                    processed_rows=result.record_count,
+                    total_rows=result.record_count,
+                    file_name=os.path.basename(result.file_path),
+                    file_size=os.path.getsize(result.file_path),
+                    expires_at=_now() + timedelta(hours=self.expire_hours)
+                )
+                logger.info(f"导出任务完成: {job_id}, 记录数: {result.record_count}")
+            else:
+                self._finish(job_id, status='failed', error_message=result.error_message)
+                logger.warning(f"导出任务失败: {job_id}, {result.error_message}")
+
+        except ExportCancelled:
+            self._finish(job_id, status='cancelled')
+            logger.info(f"导出任务已取消: {job_id}")
+        except Exception as e:
+            logger.error(f"导出任务失败: {job_id}, 错误: {e}")
+            self._finish(job_id, status='failed', error_message=str(e))
+
+    def _update_progress(self, job_id: str, processed: int, total: int):
+        """写入进度并检查取消标记（归档记录不计入预计总数，完成前进度最多显示99%）"""
+        with get_db() as db:
+            job = db.get(ExportJob, job_id)
+            if job is None or job.status == 'cancelling':
+                raise ExportCancelled(job_id)
+            job.processed_rows = processed
+            job.total_rows = max(total, processed)
+            job.progress = min(99.0, processed * 100.0 / total) if total else 0
+
+    def _finish(self, job_id: str, **fields):
+        try:
+            with get_db() as db:
+                job = db.get(ExportJob, job_id)
+                if job is None:
+                    return
+                for key, value in fields.items():
+                    setattr(job, key, value)
+                job.finished_at = _now()
+        except Exception as e:
+            logger.error(f"更新导出任务状态失败: {job_id}, 错误: {e}")
+
+    def purge_expired(self) -> int:
+        """
+        清理过期任务
+        - 已完成的任务过期后删除结果文件并标记为已过期
+        - 超过保留时间仍未结束的任务视为进程退出导致中断，标记为失败
+        - 已结束超过保留时间的任务记录直接删除
+
+        Returns:
+            处理的任务数
+        """
+        now = _now()
+        cutoff = now - timedelta(hours=self.expire_hours)
+        count = 0
+
+        with get_db() as db:
+            expired = db.query(ExportJob).filter(
+                ExportJob.status == 'completed', ExportJob.expires_at < now
+            ).all()
+            for job in expired:
+                file_path = os.path.join(self.export_service.download_dir, job.file_name or '')
+                if job.file_name and os.path.isfile(file_path):
+                    try:
+                        os.unlink(file_path)
+                    except OSError as e:
+                        logger.warning(f"删除过期导出文件失败: {file_path}, 错误: {e}")
+                        continue
+                job.status = 'expired'
+                count += 1
+
+            count += db.query(ExportJob).filter(
+                ExportJob.status.in_(ACTIVE_STATUSES), ExportJob.created_at < cutoff
+            ).update({
+                ExportJob.status: 'failed',
+                ExportJob.error_message: '导出中断',
+                ExportJob.finished_at: now,
+            }, synchronize_session=False)
+
+            count += db.query(ExportJob).filter(
+                ExportJob.status.in_(('failed', 'cancelled')), ExportJob.finished_at < cutoff
+            ).delete(synchronize_session=False)
+            count += db.query(ExportJob).filter(
+                ExportJob.status == 'expired', ExportJob.expires_at < cutoff
+            ).delete(synchronize_session=False)
+
+        if count:
+            logger.info(f"清理过期导出任务 {count} 个")
+        return count
+
+    def shutdown(self):
+        """停止接收新任务（不等待正在执行的导出）"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# 全局导出任务服务实例
+export_job_service = ExportJobService()
@@ -3,21 +3,46 @@
 支持多种格式的检测结果导出
 """
 
+import itertools
 import os
-import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import csv
 from pathlib import Path
 
 import logging
 
 logger = logging.getLogger(__name__)
+from sqlalchemy import and_, case, func
 from sqlalchemy.orm import Session
 
-from ..models import Website, DetectionRecord, DetectionTask
+from ..models import Website, DetectionTask, DetectionHourlySummary
 from ..utils.helpers import ensure_dir, format_datetime
+from .analytics_engine import STATUSES
+from .archive_service import archive_service
+from .compaction_service import compaction_service
+from .detection_storage import detection_storage
+from .export_writers import EXPORT_EXTENSIONS, open_export_writer
+
+
+# 检测结果导出列（变化存储模式下一行代表一段连续相同的结果，附带最后检测时间和检测次数，
+# 响应时间为该段的平均值）
+DETECTION_EXPORT_COLUMNS = (
+    '网站名称', '网址', '检测时间', '最后检测时间', '检测次数', '检测状态', '响应时间(秒)', '状态码', '最终URL', '错误信息'
+)
+
+
+# 网站统计导出列
+STATISTICS_EXPORT_COLUMNS = (
+    '网站名称', '网址', '总检测次数', '标准解析次数', '跳转解析次数', '失败次数', '可用率(%)', '平均响应时间(秒)'
+)
+
+# 网站统计的聚合列（检测记录与小时汇总相加）
+STATISTICS_AGGREGATES = ('total', *STATUSES, 'response_time_sum', 'response_time_count')
+
+
+class ExportCancelled(Exception):
+    """导出被取消"""
 
 
 class ExportResult:
@@ -35,6 +60,9 @@ class ExportResult:
 class ExportService:
     """结果导出服务"""
     
+    # 导出时每批从数据库游标读取的记录数
+    EXPORT_BATCH_SIZE = 2000
+    
     def __init__(self, download_dir: str = None):
         """
         初始化导出服务
@@ -59,9 +87,12 @@ class ExportService:
                                 start_date: Optional[datetime] = None,
                                 end_date: Optional[datetime] = None,
                                 export_format: str = 'excel',
-                                include_task_info: bool = True) -> ExportResult:
+                                include_task_info: bool = True,
+                                progress_callback: Optional[Callable[..., None]] = None) -> ExportResult:
         """
         导出检测结果
+        数据库记录按游标分批读取，归档记录按日期逐个文件读取，逐行写入临时文件，
+        内存占用与导出行数无关；完成后原子重命名为结果文件
         
         Args:
             db: 数据库会话
@@ -69,82 +100,143 @@ class ExportService:
             website_ids: 网站ID列表（可选）
             start_date: 开始日期（可选）
             end_date: 结束日期（可选）
-            export_format: 导出格式 ('excel', 'csv', 'json')
+            export_format: 导出格式 ('excel', 'csv', 'json', 'ndjson')
             include_task_info: 是否包含任务信息
+            progress_callback: 进度回调 (已导出行数, 数据库匹配行数, done)，每批调用一次，
+                全部行读取完后以 done=True 再调用一次；抛出 ExportCancelled 时中止导出并删除临时文件
             
         Returns:
             导出结果
         """
+        extension = EXPORT_EXTENSIONS.get(export_format.lower())
+        if extension is None:
+            return ExportResult(False, None, f"不支持的导出格式: {export_format}", 0)
+        
+        # 生成文件名
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_path = os.path.join(self.download_dir, f"网址检测结果_{timestamp}.{extension}")
+        
         try:
-            # 构建查询
-            query = db.query(DetectionRecord).join(Website)
-            
-            if task_id:
-                query = query.filter(DetectionRecord.task_id == task_id)
-            
-            if website_ids:
-                query = query.filter(Website.id.in_(website_ids))
-            
-            if start_date:
-                query = query.filter(DetectionRecord.detected_at >= start_date)
-            
-            if end_date:
-                query = query.filter(DetectionRecord.detected_at <= end_date)
-            
-            # 执行查询
-            records = query.order_by(DetectionRecord.detected_at.desc()).all()
-            
-            if not records:
+            rows = itertools.chain(
+                self._iter_detection_rows(db, task_id, website_ids, start_date, end_date),
+                self._iter_archived_rows(db, task_id, website_ids, start_date, end_date)
+            )
+            if progress_callback:
+                total = self._detection_query(db, task_id, website_ids, start_date, end_date)[1].count()
+                progress_callback(0, total)
+                rows = self._track_progress(rows, total, progress_callback)
+            
+            record_count = self._write_export(export_format, file_path, DETECTION_EXPORT_COLUMNS, '检测结果', rows)
+            if record_count == 0:
+                os.unlink(file_path)
                 return ExportResult(False, None, "没有找到匹配的检测记录", 0)
             
-            # 准备数据
-            data = self._prepare_export_data(records, include_task_info)
-            
-            # 生成文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"网址检测结果_{timestamp}"
-            
-            # 根据格式导出
-            if export_format.lower() == 'excel':
-                file_path = self._export_to_excel(data, filename)
-            elif export_format.lower() == 'csv':
-                file_path = self._export_to_csv(data, filename)
-            elif export_format.lower() == 'json':
-                file_path = self._export_to_json(data, filename)
-            else:
-                return ExportResult(False, None, f"不支持的导出格式: {export_format}", 0)
-            
-            logger.info(f"导出完成: {file_path}, 记录数: {len(records)}")
-            return ExportResult(True, file_path, None, len(records))
+            logger.info(f"导出完成: {file_path}, 记录数: {record_count}")
+            return ExportResult(True, file_path, None, record_count)
             
+        except ExportCancelled:
+            logger.info(f"导出已取消: {file_path}")
+            raise
         except Exception as e:
             logger.error(f"导出检测结果失败: {e}")
             return ExportResult(False, None, str(e), 0)
     
-    def _prepare_export_data(self, records: List[DetectionRecord], 
-                           include_task_info: bool = True) -> List[Dict]:
-        """准备导出数据"""
-        data = []
-        for record in records:
-            row = {
-                '网站名称': record.website.name,
-                '网址': record.website.url,
-                '检测时间': format_datetime(record.detected_at),
-                '检测状态': self._get_status_name(record.status),
-                '响应时间(秒)': round(record.response_time, 2) if record.response_time else None,
-                '状态码': record.http_status_code,
-                '最终URL': record.final_url,
-                '错误信息': record.error_message
-            }
-            
-            # 暂时禁用任务信息以避免错误
-            # if include_task_info and record.task:
-            #     row['任务名称'] = record.task.name
-            #     row['任务描述'] = getattr(record.task, 'description', '')
-            
-            data.append(row)
+    def _write_export(self, export_format: str, file_path: str, columns, sheet_name: str,
+                      rows: Iterable[Tuple]) -> int:
+        """写入临时文件后原子重命名，失败或取消时删除临时文件，返回写入行数"""
+        temp_path = f"{file_path}.part"
+        try:
+            with open_export_writer(export_format, temp_path, columns, sheet_name) as writer:
+                record_count = writer.write_rows(rows)
+            os.replace(temp_path, file_path)
+            return record_count
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+    
+    def _track_progress(self, rows: Iterable[Tuple], total: int,
+                        progress_callback: Callable[..., None]) -> Iterator[Tuple]:
+        """每导出一批调用一次进度回调，结束时以 done=True 调用"""
+        processed = 0
+        for row in rows:
+            yield row
+            processed += 1
+            if processed % self.EXPORT_BATCH_SIZE == 0:
+                progress_callback(processed, total)
+        progress_callback(processed, total, done=True)
+    
+    def _detection_query(self, db: Session, task_id: Optional[int], website_ids: Optional[List[int]],
+                         start_date: Optional[datetime], end_date: Optional[datetime]):
+        """构建检测结果导出查询（只查询导出列，网站名称和网址随连接一次取出）"""
+        # 分区存储时只读取覆盖时间范围的分区
+        R = detection_storage.record_source(start_date, end_date)
+        query = db.query(
+            Website.name, Website.url, R.detected_at, R.last_seen_at, R.check_count, R.status, R.response_time,
+            R.http_status_code, R.final_url, R.error_message
+        ).select_from(R).join(R.website)
         
-        return data
+        if task_id:
+            query = query.filter(R.task_id == task_id)
+        
+        if website_ids:
+            query = query.filter(R.website_id.in_(website_ids))
+        
+        # 时间范围（变化存储模式下按合并记录覆盖的区间判断）
+        query = query.filter(*detection_storage.window_conditions(R, start_date, end_date))
+        return R, query
+    
+    def _iter_detection_rows(self, db: Session, task_id: Optional[int], website_ids: Optional[List[int]],
+                             start_date: Optional[datetime], end_date: Optional[datetime]) -> Iterator[Tuple]:
+        """按游标分批读取数据库中的检测记录"""
+        R, query = self._detection_query(db, task_id, website_ids, start_date, end_date)
+        for row in query.order_by(R.detected_at.desc()).yield_per(self.EXPORT_BATCH_SIZE):
+            yield self._detection_row(*row)
+    
+    def _iter_archived_rows(self, db: Session, task_id: Optional[int], website_ids: Optional[List[int]],
+                            start_date: Optional[datetime], end_date: Optional[datetime]) -> Iterator[Tuple]:
+        """读取已归档的历史明细（按日期从新到旧，已删除网站的记录跳过）"""
+        records = archive_service.scan(start_date, end_date, website_ids, task_id, newest_first=True)
+        websites: Dict[int, Tuple[str, str]] = {}
+        
+        while True:
+            batch = list(itertools.islice(records, self.EXPORT_BATCH_SIZE))
+            if not batch:
+                return
+            
+            # 每批只查询尚未加载的网站
+            missing = {record['website_id'] for record in batch} - websites.keys()
+            if missing:
+                websites.update(
+                    (website_id, (name, url))
+                    for website_id, name, url in db.query(Website.id, Website.name, Website.url)
+                    .filter(Website.id.in_(missing))
+                )
+            
+            for record in batch:
+                website = websites.get(record['website_id'])
+                if website is None:
+                    continue
+                yield self._detection_row(
+                    website[0], website[1], record['detected_at'], record.get('last_seen_at'),
+                    record.get('check_count'), record['status'], record['response_time'],
+                    record['http_status_code'], record['final_url'], record['error_message']
+                )
+    
+    def _detection_row(self, name, url, detected_at, last_seen_at, check_count, status, response_time,
+                       http_status_code, final_url, error_message) -> Tuple:
+        """检测记录导出行（列顺序与 DETECTION_EXPORT_COLUMNS 一致，与结果列表接口一样补全单次检测的记录）"""
+        return (
+            name,
+            url,
+            format_datetime(detected_at),
+            format_datetime(last_seen_at or detected_at),
+            check_count or 1,
+            self._get_status_name(status),
+            round(response_time, 2) if response_time else None,
+            http_status_code,
+            final_url,
+            error_message,
+        )
     
     def _get_status_name(self, status: str) -> str:
         """获取状态中文名称"""
@@ -155,47 +247,14 @@ class ExportService:
         }
         return status_map.get(status, status)
     
-    def _export_to_excel(self, data: List[Dict], filename: str) -> str:
-        """导出到Excel"""
-        file_path = os.path.join(self.download_dir, f"{filename}.xlsx")
-        
-        df = pd.DataFrame(data)
-        
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='检测结果', index=False)
-            
-            # 调整列宽
-            worksheet = writer.sheets['检测结果']
-            for column in worksheet.columns:
-                max_length = max(len(str(cell.value)) for cell in column)
-                worksheet.column_dimensions[column[0].column_letter].width = min(max_length + 2, 50)
-        
-        return file_path
-    
-    def _export_to_csv(self, data: List[Dict], filename: str) -> str:
-        """导出到CSV"""
-        file_path = os.path.join(self.download_dir, f"{filename}.csv")
-        
-        df = pd.DataFrame(data)
-        df.to_csv(file_path, index=False, encoding='utf-8-sig')
-        
-        return file_path
-    
-    def _export_to_json(self, data: List[Dict], filename: str) -> str:
-        """导出到JSON"""
-        file_path = os.path.join(self.download_dir, f"{filename}.json")
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        
-        return file_path
-    
     def export_website_statistics(self, db: Session,
                                  website_ids: List[int] = None,
                                  days: int = 30,
                                  export_format: str = 'excel') -> ExportResult:
         """
         导出网站统计数据
+        检测记录和小时汇总各用一次分组聚合查询统计，与网站表外连接后按游标逐行写入，
+        归档数据一次扫描后按网站合并
         
         Args:
             db: 数据库会话
@@ -206,120 +265,118 @@ class ExportService:
         Returns:
             导出结果
         """
+        extension = EXPORT_EXTENSIONS.get(export_format.lower())
+        if extension is None:
+            return ExportResult(False, None, f"不支持的导出格式: {export_format}", 0)
+        
+        # 生成文件名
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        file_path = os.path.join(self.download_dir, f"网站统计报告_{days}天_{timestamp}.{extension}")
+        
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # 获取网站列表
-            websites_query = db.query(Website)
-            if website_ids:
-                websites_query = websites_query.filter(Website.id.in_(website_ids))
-            
-            websites = websites_query.all()
-            
-            if not websites:
+            # 超过保留期的归档数据一次性汇总，按网站分配
+            archived = archive_service.aggregate(start_date, end_date, website_ids)['websites']
+            
+            rows = (
+                self._statistics_row(row, archived.get(row.id))
+                for row in self._statistics_query(db, website_ids, start_date, end_date)
+                .yield_per(self.EXPORT_BATCH_SIZE)
+            )
+            website_count = self._write_export(
+                export_format, file_path, STATISTICS_EXPORT_COLUMNS, f'统计报告({days}天)', rows
+            )
+            if website_count == 0:
+                os.unlink(file_path)
                 return ExportResult(False, None, "没有找到匹配的网站", 0)
             
-            # 计算统计数据
-            stats_data = []
-            for website in websites:
-                stats = self._calculate_website_statistics(db, website, start_date, end_date)
-                stats_data.append(stats)
-            
-            # 生成文件名
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"网站统计报告_{days}天_{timestamp}"
-            
-            # 导出
-            if export_format.lower() == 'excel':
-                file_path = self._export_statistics_to_excel(stats_data, filename, days)
-            elif export_format.lower() == 'csv':
-                file_path = self._export_statistics_to_csv(stats_data, filename)
-            else:
-                return ExportResult(False, None, f"不支持的导出格式: {export_format}", 0)
-            
-            logger.info(f"统计报告导出完成: {file_path}, 网站数: {len(websites)}")
-            return ExportResult(True, file_path, None, len(websites))
+            logger.info(f"统计报告导出完成: {file_path}, 网站数: {website_count}")
+            return ExportResult(True, file_path, None, website_count)
             
         except Exception as e:
             logger.error(f"导出网站统计失败: {e}")
             return ExportResult(False, None, str(e), 0)
     
-    def _calculate_website_statistics(self, db: Session, website: Website, 
-                                    start_date: datetime, end_date: datetime) -> Dict:
-        """计算网站统计数据"""
-        records = db.query(DetectionRecord).filter(
-            DetectionRecord.website_id == website.id,
-            DetectionRecord.detected_at >= start_date,
-            DetectionRecord.detected_at <= end_date
-        ).all()
-        
-        total_count = len(records)
-        if total_count == 0:
-            return {
-                '网站名称': website.name,
-                '网址': website.url,
-                '总检测次数': 0,
-                '标准解析次数': 0,
-                '跳转解析次数': 0,
-                '失败次数': 0,
-                '可用率(%)': 0,
-                '平均响应时间(秒)': 0
-            }
+    def _statistics_query(self, db: Session, website_ids: Optional[List[int]],
+                          start_date: datetime, end_date: datetime):
+        """
+        网站统计查询
+        检测记录按网站分组聚合（变化存储模式下按检测次数加权，响应时间只统计大于0的值），
+        已压缩的较早数据从小时汇总分组聚合，两者与网站表外连接，每个网站一行
+        """
+        R = detection_storage.record_source(start_date, end_date)
+        weight = detection_storage.check_weight(R)
+        has_response = and_(R.response_time.isnot(None), R.response_time > 0)
         
-        status_counts = {}
-        total_response_time = 0
-        valid_response_count = 0
+        raw = db.query(
+            R.website_id.label('website_id'),
+            func.sum(weight).label('total'),
+            *(func.sum(case((R.status == status, weight), else_=0)).label(status) for status in STATUSES),
+            func.sum(case((has_response, R.response_time * weight), else_=0)).label('response_time_sum'),
+            func.sum(case((has_response, weight), else_=0)).label('response_time_count'),
+        ).filter(*detection_storage.window_conditions(R, start_date, end_date))
+        if website_ids:
+            raw = raw.filter(R.website_id.in_(website_ids))
+        raw = raw.group_by(R.website_id).subquery()
         
-        for record in records:
-            status = record.status
-            status_counts[status] = status_counts.get(status, 0) + 1
-            
-            if record.response_time:
-                total_response_time += record.response_time
-                valid_response_count += 1
+        sources = [raw]
+        if compaction_service.covers(start_date):
+            S = DetectionHourlySummary
+            sources.append(db.query(
+                S.website_id.label('website_id'),
+                func.sum(S.total_count).label('total'),
+                func.sum(S.standard_count).label('standard'),
+                func.sum(S.redirect_count).label('redirect'),
+                func.sum(S.failed_count).label('failed'),
+                func.sum(S.response_time_sum).label('response_time_sum'),
+                func.sum(S.response_time_count).label('response_time_count'),
+            ).filter(
+                *compaction_service.summary_filters(start_date, end_date, website_ids)
+            ).group_by(S.website_id).subquery())
         
-        success_count = status_counts.get('standard', 0) + status_counts.get('redirect', 0)
-        availability = (success_count / total_count) * 100 if total_count > 0 else 0
-        avg_response_time = total_response_time / valid_response_count if valid_response_count > 0 else 0
+        def total(column: str):
+            return sum(func.coalesce(source.c[column], 0) for source in sources).label(column)
         
-        return {
-            '网站名称': website.name,
-            '网址': website.url,
-            '总检测次数': total_count,
-            '标准解析次数': status_counts.get('standard', 0),
-            '跳转解析次数': status_counts.get('redirect', 0),
-            '失败次数': status_counts.get('failed', 0),
-            '可用率(%)': round(availability, 2),
-                            '平均响应时间(秒)': round(avg_response_time, 2)
-        }
+        query = db.query(
+            Website.id, Website.name, Website.url,
+            *(total(column) for column in STATISTICS_AGGREGATES)
+        )
+        for source in sources:
+            query = query.outerjoin(source, source.c.website_id == Website.id)
+        if website_ids:
+            query = query.filter(Website.id.in_(website_ids))
+        return query.order_by(Website.id)
     
-    def _export_statistics_to_excel(self, stats_data: List[Dict], 
-                                   filename: str, days: int) -> str:
-        """导出统计数据到Excel"""
-        file_path = os.path.join(self.download_dir, f"{filename}.xlsx")
+    def _statistics_row(self, row, archived: Optional[Dict] = None) -> Tuple:
+        """网站统计导出行（列顺序与 STATISTICS_EXPORT_COLUMNS 一致），archived 为该网站归档数据的汇总"""
+        total_count = int(row.total or 0)
+        status_counts = {status: int(getattr(row, status) or 0) for status in STATUSES}
+        total_response_time = float(row.response_time_sum or 0)
+        valid_response_count = int(row.response_time_count or 0)
         
-        df = pd.DataFrame(stats_data)
+        if archived:
+            total_count += archived['total']
+            for status, count in archived['statuses'].items():
+                status_counts[status] = status_counts.get(status, 0) + count
+            total_response_time += archived['response_time_sum']
+            valid_response_count += archived['response_time_count']
         
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name=f'统计报告({days}天)', index=False)
-            
-            # 调整列宽
-            worksheet = writer.sheets[f'统计报告({days}天)']
-            for column in worksheet.columns:
-                max_length = max(len(str(cell.value)) for cell in column)
-                worksheet.column_dimensions[column[0].column_letter].width = min(max_length + 2, 50)
-        
-        return file_path
-    
-    def _export_statistics_to_csv(self, stats_data: List[Dict], filename: str) -> str:
-        """导出统计数据到CSV"""
-        file_path = os.path.join(self.download_dir, f"{filename}.csv")
-        
-        df = pd.DataFrame(stats_data)
-        df.to_csv(file_path, index=False, encoding='utf-8-sig')
+        success_count = status_counts.get('standard', 0) + status_counts.get('redirect', 0)
+        availability = (success_count / total_count) * 100 if total_count > 0 else 0
+        avg_response_time = total_response_time / valid_response_count if valid_response_count > 0 else 0
         
-        return file_path
+        return (
+            row.name,
+            row.url,
+            total_count,
+            status_counts.get('standard', 0),
+            status_counts.get('redirect', 0),
+            status_counts.get('failed', 0),
+            round(availability, 2),
+            round(avg_response_time, 2),
+        )
     
     def get_available_files(self) -> List[Dict]:
         """
@@ -332,7 +389,8 @@ class ExportService:
         try:
             for filename in os.listdir(self.download_dir):
                 file_path = os.path.join(self.download_dir, filename)
-                if os.path.isfile(file_path):
+                # 跳过导出中的临时文件
+                if os.path.isfile(file_path) and not filename.endswith('.part'):
                     stat = os.stat(file_path)
                     files.append({
                         'filename': filename,
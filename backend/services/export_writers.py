@@ -0,0 +1,207 @@
+"""
+流式导出写入器
+按行写入 CSV、NDJSON、JSON 和 Excel 文件，内存占用与导出行数无关：
+- CSV / NDJSON / JSON：逐行编码后写入文件
+- Excel：openpyxl 只写模式（行直接写入临时文件），列宽按前若干行样本估算；
+  超过单个工作表的行数上限时自动续写到新工作表
+"""
+
+import csv
+import logging
+from typing import Any, Iterable, List, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from ..utils.json_provider import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+# 导出格式 -> 文件扩展名
+EXPORT_EXTENSIONS = {
+    'excel': 'xlsx',
+    'csv': 'csv',
+    'json': 'json',
+    'ndjson': 'ndjson',
+}
+
+# Excel 单个工作表最大行数（含表头）
+XLSX_MAX_ROWS = 1048576
+
+# 估算列宽时采样的行数
+WIDTH_SAMPLE_ROWS = 1000
+
+# 列宽上限（字符）
+MAX_COLUMN_WIDTH = 50
+
+
+class ExportWriter:
+    """导出写入器基类，每行为与 columns 顺序一致的值序列"""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.path = path
+        self.columns = list(columns)
+        self.row_count = 0
+
+    def write(self, row: Sequence[Any]):
+        self._write(row)
+        self.row_count += 1
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> int:
+        """写入多行，返回写入行数"""
+        start = self.row_count
+        for row in rows:
+            self.write(row)
+        return self.row_count - start
+
+    def _write(self, row: Sequence[Any]):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class CsvExportWriter(ExportWriter):
+    """CSV 写入器（带 BOM，Excel 可直接打开中文）"""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class NdjsonExportWriter(ExportWriter):
+    """NDJSON 写入器，每行一个 JSON 对象"""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._file = open(path, 'wb')
+
+    def _write(self, row):
+        self._file.write(dumps_bytes(dict(zip(self.columns, row))))
+        self._file.write(b'\n')
+
+    def close(self):
+        self._file.close()
+
+
+class JsonExportWriter(ExportWriter):
+    """JSON 数组写入器，逐个对象写入"""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._file = open(path, 'wb')
+        self._file.write(b'[')
+
+    def _write(self, row):
+        if self.row_count:
+            self._file.write(b',\n')
+        self._file.write(dumps_bytes(dict(zip(self.columns, row))))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write(b']\n')
+            self._file.close()
+
+
+class XlsxExportWriter(ExportWriter):
+    """
+    Excel 写入器
+    只写模式下列宽必须在写入第一行前设置，因此先缓存样本行估算列宽后再统一写入
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], sheet_name: str = 'Sheet1'):
+        super().__init__(path, columns)
+        self.sheet_name = sheet_name
+        self._workbook = Workbook(write_only=True)
+        self._sheet = None
+        self._sheet_rows = 0
+        self._sheet_count = 0
+        self._widths: Optional[List[float]] = None
+        self._sample: List[Sequence[Any]] = []
+
+    def _write(self, row):
+        if self._widths is None:
+            self._sample.append(row)
+            if len(self._sample) >= WIDTH_SAMPLE_ROWS:
+                self._flush_sample()
+            return
+        self._append(row)
+
+    def _flush_sample(self):
+        self._widths = estimate_column_widths(self.columns, self._sample)
+        sample, self._sample = self._sample, []
+        for row in sample:
+            self._append(row)
+
+    def _append(self, row):
+        if self._sheet is None or self._sheet_rows >= XLSX_MAX_ROWS:
+            self._new_sheet()
+        self._sheet.append(list(row))
+        self._sheet_rows += 1
+
+    def _new_sheet(self):
+        self._sheet_count += 1
+        title = self.sheet_name if self._sheet_count == 1 else f'{self.sheet_name}_{self._sheet_count}'
+        self._sheet = self._workbook.create_sheet(title=title[:31])
+        for index, width in enumerate(self._widths, start=1):
+            self._sheet.column_dimensions[get_column_letter(index)].width = width
+        self._sheet.append(self.columns)
+        self._sheet_rows = 1
+
+    def close(self):
+        if self._workbook is None:
+            return
+        if self._widths is None:
+            self._flush_sample()
+        if self._sheet is None:
+            self._new_sheet()
+        self._workbook.save(self.path)
+        self._workbook = None
+
+
+def estimate_column_widths(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> List[float]:
+    """按表头和样本行估算 Excel 列宽"""
+    widths = [len(str(column)) for column in columns]
+    for row in rows:
+        for index, value in enumerate(row):
+            if value is not None:
+                widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def open_export_writer(export_format: str, path: str, columns: Sequence[str],
+                       sheet_name: str = 'Sheet1') -> ExportWriter:
+    """
+    按导出格式创建写入器
+
+    Args:
+        export_format: 导出格式（excel、csv、json、ndjson）
+        path: 输出文件路径
+        columns: 列名
+        sheet_name: Excel 工作表名称
+    """
+    export_format = export_format.lower()
+    if export_format == 'excel':
+        return XlsxExportWriter(path, columns, sheet_name)
+    if export_format == 'csv':
+        return CsvExportWriter(path, columns)
+    if export_format == 'json':
+        return JsonExportWriter(path, columns)
+    if export_format == 'ndjson':
+        return NdjsonExportWriter(path, columns)
+    raise ValueError(f"不支持的导出格式: {export_format}")
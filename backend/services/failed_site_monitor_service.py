@@ -6,15 +6,19 @@
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 
 from ..database import get_db
 from ..models import (
     Website, DetectionTask, FailedSiteMonitorTask, DetectionRecord, WebsiteStatusChange
 )
+from ..utils.cache import invalidate_detections
 from ..utils.helpers import get_beijing_time
 from .detection_service import DetectionService
 from .status_change_service import StatusChangeService
+from .result_writer import result_writer, build_detection_row, RESULT_WAIT_TIMEOUT
+from .detection_storage import detection_storage
+from .uptime_service import uptime_service
 
 logger = logging.getLogger(__name__)
 
@@ -261,28 +265,15 @@ class FailedSiteMonitorService:
                     failed_result.detected_at = get_beijing_time()
                     ordered_results.append(failed_result)
             
-            # 保存到数据库，使用父任务ID
+            # 经写入缓冲保存，使用父任务ID；恢复检测需要记录ID，等待写入完成
+            rows = [
+                build_detection_row(monitor_task.parent_task_id, website.id, result)
+                for website, result in zip(websites, ordered_results)
+            ]
+            record_ids = result_writer.submit(rows).wait(timeout=RESULT_WAIT_TIMEOUT)
+            
             with get_db() as db:
-                records = []
-                for i, (website, result) in enumerate(zip(websites, ordered_results)):
-                    record = DetectionRecord(
-                        task_id=monitor_task.parent_task_id,  # 使用父任务ID
-                        website_id=website.id,
-                        status=result.status,
-                        http_status_code=result.http_status_code,
-                        response_time=result.response_time,
-                        final_url=result.final_url,
-                        page_title=result.page_title,
-                        page_content_length=result.page_content_length,
-                        error_message=result.error_message,
-                        failure_reason=result.failure_reason,
-                        detected_at=result.detected_at.replace(tzinfo=None) if result.detected_at else get_beijing_time().replace(tzinfo=None),
-                        detection_duration=result.detection_duration
-                    )
-                    records.append(record)
-                
-                db.add_all(records)
-                db.commit()
+                records = detection_storage.records_by_ids(db, record_ids)
                 
                 logger.info(f"保存了 {len(records)} 条失败网站监控记录")
                 return records
@@ -308,17 +299,23 @@ class FailedSiteMonitorService:
         """
         try:
             recovered_websites = []
+            recovered_changes = []
             
             for record in detection_records:
+                # 变化存储模式下被延长的记录已在首次检测时判断过恢复
+                if (record.check_count or 1) > 1:
+                    continue
+
                 # 检查是否从failed状态恢复
                 if self.status_change_service._is_accessible_status(record.status):
                     # 获取该网站在主任务中的上一次检测记录
                     with get_db() as db:
-                        previous_record = db.query(DetectionRecord).filter(
-                            DetectionRecord.website_id == record.website_id,
-                            DetectionRecord.task_id == monitor_task.parent_task_id,
-                            DetectionRecord.detected_at < record.detected_at
-                        ).order_by(DetectionRecord.detected_at.desc()).first()
+                        R = detection_storage.record_source(end_date=record.detected_at)
+                        previous_record = db.query(R).filter(
+                            R.website_id == record.website_id,
+                            R.task_id == monitor_task.parent_task_id,
+                            R.detected_at < record.detected_at
+                        ).order_by(R.detected_at.desc()).first()
                         
                         if previous_record and previous_record.status == 'failed':
                             # 网站已恢复
@@ -338,11 +335,19 @@ class FailedSiteMonitorService:
                                     detected_at=record.detected_at
                                 )
                                 db.add(change_record)
+                                recovered_changes.append((record.website_id, record.detected_at))
                                 
                                 logger.info(f"网站恢复访问: {website.name} ({website.url})")
                         
                         db.commit()
             
+            # 写入较早日期的变化时清除受影响的每日可用时长缓存
+            uptime_service.invalidate(recovered_changes)
+            if recovered_changes:
+                invalidate_detections(
+                    [monitor_task.parent_task_id], {website_id for website_id, _ in recovered_changes}
+                )
+            
             return recovered_websites
             
         except Exception as e:
@@ -381,7 +386,7 @@ class FailedSiteMonitorService:
                     'is_active': monitor_task.is_active,
                     'is_running': monitor_task.is_running,
                     'interval_hours': monitor_task.interval_hours,
-                    'monitored_websites_count': len(monitor_task.monitored_websites),
+                    'monitored_websites_count': monitor_task.count_monitored_websites(),
                     'last_run_at': monitor_task.last_run_at.isoformat() if monitor_task.last_run_at else None,
                     'next_run_at': monitor_task.next_run_at.isoformat() if monitor_task.next_run_at else None,
                     'created_at': monitor_task.created_at.isoformat() if monitor_task.created_at else None,
@@ -418,7 +423,9 @@ class FailedSiteMonitorService:
                 since_time = get_beijing_time() - timedelta(hours=hours)
                 
                 # 查询恢复记录
-                recovery_changes = db.query(WebsiteStatusChange).join(Website).filter(
+                recovery_changes = db.query(WebsiteStatusChange).join(Website).options(
+                    contains_eager(WebsiteStatusChange.website)
+                ).filter(
                     WebsiteStatusChange.task_id == parent_task_id,
                     WebsiteStatusChange.change_type == 'became_accessible',
                     WebsiteStatusChange.detected_at >= since_time
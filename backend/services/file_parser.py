@@ -5,7 +5,7 @@
 
 import os
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import pandas as pd
 import logging
 
@@ -135,21 +135,13 @@ class FileParser:
             result.error_message = error_msg
             return result
         
-        # 读取CSV文件
+        # 读取CSV文件（按采样检测的编码只读取一次）
         try:
-            import pandas as pd
-            df = pd.read_csv(file_path, encoding='utf-8')
+            encoding = result.file_info.get('encoding') or detect_file_encoding(file_path)
+            df = pd.read_csv(file_path, encoding=encoding, encoding_errors='replace')
             
             # 解析数据
             return self._parse_dataframe(df, result)
-        except UnicodeDecodeError:
-            try:
-                # 尝试其他编码
-                df = pd.read_csv(file_path, encoding='gbk')
-                return self._parse_dataframe(df, result)
-            except Exception as e:
-                result.error_message = f"读取CSV文件失败（编码问题）: {str(e)}"
-                return result
         except Exception as e:
             result.error_message = f"读取CSV文件失败: {str(e)}"
             return result
@@ -193,6 +185,134 @@ class FileParser:
         
         return result
     
+    def count_rows(self, file_path: str) -> Optional[int]:
+        """
+        估算文件数据行数（不含表头），用于导入进度展示
+        
+        Args:
+            file_path: 文件路径
+            
+        Returns:
+            数据行数，无法估算时返回None
+        """
+        file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+        try:
+            if file_ext == 'csv':
+                # 按块统计换行符，内存占用与文件大小无关
+                lines = 0
+                last_byte = b''
+                with open(file_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        lines += block.count(b'\n')
+                        last_byte = block[-1:]
+                if last_byte and last_byte != b'\n':
+                    lines += 1
+                return max(lines - 1, 0)
+            
+            if file_ext == 'xlsx':
+                from openpyxl import load_workbook
+                workbook = load_workbook(file_path, read_only=True)
+                try:
+                    max_row = workbook.worksheets[0].max_row
+                finally:
+                    workbook.close()
+                return max(max_row - 1, 0) if max_row else None
+        except Exception as e:
+            logger.warning(f"统计文件行数失败: {file_path}, 错误: {e}")
+        
+        return None
+    
+    def iter_url_chunks(self, file_path: str, chunk_size: int = 1000) -> Iterator[List[str]]:
+        """
+        按块读取文件中的原始URL，峰值内存与文件大小无关
+        - CSV: 按采样检测的编码分块读取，只读取URL列
+        - XLSX: openpyxl 只读模式逐行读取
+        - XLS: 旧格式不支持流式读取，整体读取后分块返回
+        
+        Args:
+            file_path: 文件路径
+            chunk_size: 每块行数
+            
+        Yields:
+            原始URL字符串列表（包含空值，便于按行统计进度）
+            
+        Raises:
+            ValueError: 文件格式不支持或未找到URL列
+        """
+        file_ext = os.path.splitext(file_path)[1].lower().lstrip('.')
+        
+        if file_ext == 'csv':
+            yield from self._iter_csv_chunks(file_path, chunk_size)
+        elif file_ext == 'xlsx':
+            yield from self._iter_xlsx_chunks(file_path, chunk_size)
+        elif file_ext == 'xls':
+            df = pd.read_excel(file_path)
+            url_column = self._find_url_column(list(df.columns))
+            if not url_column:
+                raise ValueError(f"未找到URL列，支持的列名: {', '.join(self.url_column_names)}")
+            values = df[url_column].tolist()
+            del df
+            for start in range(0, len(values), chunk_size):
+                yield [self._cell_to_str(value) for value in values[start:start + chunk_size]]
+        else:
+            raise ValueError(f"不支持的文件格式: {file_ext}")
+    
+    def _iter_csv_chunks(self, file_path: str, chunk_size: int) -> Iterator[List[str]]:
+        """分块读取CSV文件的URL列"""
+        encoding = detect_file_encoding(file_path)
+        logger.info(f"流式读取CSV文件: {file_path}, 编码: {encoding}")
+        
+        header = pd.read_csv(file_path, encoding=encoding, encoding_errors='replace', nrows=0)
+        url_column = self._find_url_column([str(col) for col in header.columns])
+        if not url_column:
+            raise ValueError(f"未找到URL列，支持的列名: {', '.join(self.url_column_names)}")
+        
+        reader = pd.read_csv(
+            file_path,
+            encoding=encoding,
+            encoding_errors='replace',
+            usecols=[url_column],
+            dtype=str,
+            chunksize=chunk_size
+        )
+        with reader:
+            for chunk in reader:
+                yield [self._cell_to_str(value) for value in chunk[url_column].tolist()]
+    
+    def _iter_xlsx_chunks(self, file_path: str, chunk_size: int) -> Iterator[List[str]]:
+        """以只读模式逐行读取XLSX文件的URL列"""
+        from openpyxl import load_workbook
+        
+        logger.info(f"流式读取Excel文件: {file_path}")
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            columns = [str(col) if col is not None else '' for col in header]
+            url_column = self._find_url_column(columns)
+            if not url_column:
+                raise ValueError(f"未找到URL列，支持的列名: {', '.join(self.url_column_names)}")
+            url_index = columns.index(url_column)
+            
+            chunk = []
+            for row in rows:
+                chunk.append(self._cell_to_str(row[url_index] if url_index < len(row) else None))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _cell_to_str(value) -> str:
+        """单元格值转换为去除空白的字符串，空值返回空字符串"""
+        if value is None:
+            return ''
+        text = str(value).strip()
+        return '' if text.lower() in ('nan', 'null', 'none') else text
+    
     def _find_url_column(self, columns: List[str]) -> Optional[str]:
         """查找URL列"""
         # 将列名转换为小写进行匹配
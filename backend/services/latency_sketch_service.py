@@ -0,0 +1,159 @@
+"""
+网站响应时间草图服务
+检测结果写入时在同一事务内按 网站 × 小时 更新可合并的分位数草图（WebsiteLatencySketch），
+查询任意网站、分组或任务在任意时间范围的 P50/P90/P99 时只需合并对应小时的草图，无需扫描检测记录
+- 草图按每次检测记录（变化存储模式下合并前的原始结果），不受检测记录压缩、归档和清理影响
+- 只记录大于0的响应时间（失败检测的响应时间记为0，不计入延迟分布）
+- 时间范围按整点对齐：包含范围内任意时刻的小时草图整体计入
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select, tuple_
+
+from ..config import Config
+from ..database import get_write_db
+from ..models import WebsiteLatencySketch
+from ..utils.latency_sketch import LatencySketch
+from .compaction_service import hour_floor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+SketchKey = Tuple[int, datetime]
+
+
+class LatencySketchService:
+    """网站响应时间草图服务"""
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'LATENCY_SKETCH_CONFIG', {})
+        self.enabled = bool(config.get('enabled', True))
+        self.retention_days = config.get('retention_days', 365)
+        self.purge_interval_hours = config.get('purge_interval_hours', 24)
+
+    def record_rows(self, db, rows: List[Dict], record_ids: List[int] = None):
+        """
+        把一批检测记录的响应时间合并进小时草图（作为写入缓冲的 before_commit 监听器，与检测记录同一事务）
+
+        Args:
+            db: 写事务会话
+            rows: 检测记录字段字典列表
+            record_ids: 检测记录ID（未使用）
+        """
+        if not self.enabled:
+            return
+
+        partials: Dict[SketchKey, LatencySketch] = defaultdict(LatencySketch)
+        for row in rows:
+            response_time = row.get('response_time')
+            if not response_time or response_time <= 0 or not row.get('detected_at'):
+                continue
+            partials[(row['website_id'], hour_floor(row['detected_at']))].add(response_time)
+
+        if not partials:
+            return
+
+        S = WebsiteLatencySketch
+        existing = {
+            (sketch.website_id, sketch.hour_start): sketch
+            for sketch in db.execute(
+                select(S).where(tuple_(S.website_id, S.hour_start).in_(list(partials)))
+            ).scalars()
+        }
+
+        for key, partial in partials.items():
+            sketch = existing.get(key)
+            if sketch is None:
+                db.add(S(website_id=key[0], hour_start=key[1], sample_count=partial.count,
+                         sketch=partial.to_bytes()))
+                continue
+            merged = LatencySketch.from_bytes(sketch.sketch).merge(partial)
+            sketch.sketch = merged.to_bytes()
+            sketch.sample_count = merged.count
+
+    def merged_sketches(self, db, website_ids: Optional[Iterable[int]], start_date: datetime,
+                        end_date: datetime) -> Dict[int, LatencySketch]:
+        """
+        按网站合并时间范围内的小时草图
+
+        Args:
+            db: 数据库会话
+            website_ids: 网站ID列表，None 表示全部网站
+            start_date: 起始时间
+            end_date: 结束时间
+
+        Returns:
+            {网站ID: 合并后的草图}
+        """
+        S = WebsiteLatencySketch
+        query = select(S.website_id, S.sketch).where(
+            S.hour_start >= hour_floor(start_date.replace(tzinfo=None)),
+            S.hour_start < end_date.replace(tzinfo=None)
+        )
+        if website_ids is not None:
+            website_ids = list(website_ids)
+            if not website_ids:
+                return {}
+            query = query.where(S.website_id.in_(website_ids))
+
+        merged: Dict[int, LatencySketch] = defaultdict(LatencySketch)
+        for website_id, data in db.execute(query):
+            merged[website_id].merge(LatencySketch.from_bytes(data))
+        return dict(merged)
+
+    def quantiles(self, db, website_ids: Optional[Iterable[int]], start_date: datetime, end_date: datetime,
+                  qs: Iterable[float] = DEFAULT_QUANTILES, per_website: bool = False) -> Dict:
+        """
+        合并草图求响应时间分位数
+
+        Args:
+            db: 数据库会话
+            website_ids: 网站ID列表，None 表示全部网站
+            start_date: 起始时间
+            end_date: 结束时间
+            qs: 分位点（0~1）
+            per_website: 是否同时返回每个网站的分位数
+
+        Returns:
+            {'count', 'min', 'max', 'p50', ..., 'websites': [...]}
+        """
+        qs = tuple(qs)
+        sketches = self.merged_sketches(db, website_ids, start_date, end_date)
+
+        total = LatencySketch()
+        for sketch in sketches.values():
+            total.merge(sketch)
+
+        result = self._describe(total, qs)
+        if per_website:
+            result['websites'] = [
+                dict(website_id=website_id, **self._describe(sketch, qs))
+                for website_id, sketch in sorted(sketches.items())
+            ]
+        return result
+
+    def purge_expired(self) -> int:
+        """删除超过保留天数的草图"""
+        if not self.retention_days:
+            return 0
+        expire_before = datetime.now() - timedelta(days=self.retention_days)
+        with get_write_db() as db:
+            result = db.execute(
+                delete(WebsiteLatencySketch).where(WebsiteLatencySketch.hour_start < expire_before)
+            )
+            return max(result.rowcount or 0, 0)
+
+    @staticmethod
+    def _describe(sketch: LatencySketch, qs: Tuple[float, ...]) -> Dict:
+        result = {'count': sketch.count, 'min': sketch.min, 'max': sketch.max}
+        result.update(sketch.quantiles(qs))
+        return result
+
+
+# 全局网站响应时间草图服务实例
+latency_sketch_service = LatencySketchService()
@@ -8,12 +8,8 @@ import psutil
 import logging
 import threading
 import time
-from datetime import datetime, timedelta
 from typing import Dict, Optional
 
-from ..database import get_db
-from ..models import DetectionRecord
-
 logger = logging.getLogger(__name__)
 
 
@@ -80,7 +76,7 @@ class MemoryManager:
             collected = gc.collect()
             logger.info(f"垃圾回收清理了 {collected} 个对象")
             
-            # 清理旧的检测记录（保留最近7天）
+            # 清理超过保留期的检测记录
             self._cleanup_old_records()
             
         except Exception as e:
@@ -95,8 +91,8 @@ class MemoryManager:
             for _ in range(3):
                 gc.collect()
             
-            # 清理更多旧记录（保留最近3天）
-            self._cleanup_old_records(days=3)
+            # 清理超过保留期的检测记录
+            self._cleanup_old_records()
             
             # 清理数据库连接池
             self._cleanup_database_connections()
@@ -104,26 +100,14 @@ class MemoryManager:
         except Exception as e:
             logger.error(f"激进清理失败: {e}")
     
-    def _cleanup_old_records(self, days: int = 7):
-        """清理旧的检测记录"""
+    def _cleanup_old_records(self):
+        """按保留配置在后台分块清理旧的检测记录"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
-            with get_db() as db:
-                # 计算要删除的记录数
-                count = db.query(DetectionRecord).filter(
-                    DetectionRecord.detected_at < cutoff_date
-                ).count()
-                
-                if count > 0:
-                    # 批量删除
-                    db.query(DetectionRecord).filter(
-                        DetectionRecord.detected_at < cutoff_date
-                    ).delete()
-                    db.commit()
-                    
-                    logger.info(f"清理了 {count} 条旧检测记录（{days}天前）")
-                    
+            from .retention_service import retention_service
+
+            if retention_service.start_purge():
+                logger.info(f"已启动历史数据清理（保留{retention_service.retain_days}天）")
+
         except Exception as e:
             logger.error(f"清理旧记录失败: {e}")
     
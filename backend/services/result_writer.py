@@ -0,0 +1,368 @@
+"""
+检测结果写入缓冲服务
+所有检测路径将结果提交到进程级缓冲队列，由后台线程按数量或时间批量写入，
+避免多个任务同时结束时产生大事务突发
+- 队列满时提交方阻塞（背压），超时后在调用线程中同步写入，不丢弃数据
+- 提交返回写入凭据，需要记录ID的调用方可等待刷写完成
+- 应用关闭时刷写剩余结果
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from ..config import Config
+from ..database import get_write_db
+from ..utils.helpers import get_beijing_time
+from .detection_storage import detection_storage
+from .change_only_storage import change_only_storage
+
+logger = logging.getLogger(__name__)
+
+# 需要记录ID的调用方等待写入完成的最长时间（秒）
+RESULT_WAIT_TIMEOUT = 120
+
+
+def build_detection_row(task_id: Optional[int], website_id: int, result) -> Dict:
+    """
+    将检测结果转换为检测记录行
+
+    Args:
+        task_id: 任务ID
+        website_id: 网站ID
+        result: DetectionResult 检测结果
+
+    Returns:
+        检测记录字段字典
+    """
+    detected_at = (getattr(result, 'detected_at', None) or get_beijing_time()).replace(tzinfo=None)
+    response_time = result.response_time or 0.0
+
+    return {
+        'task_id': task_id,
+        'website_id': website_id,
+        'status': result.status,
+        'response_time': response_time,
+        'http_status_code': result.http_status_code,
+        'final_url': result.final_url or '',
+        'error_message': result.error_message or '',
+        'failure_reason': getattr(result, 'failure_reason', '') or '',
+        'ssl_info': getattr(result, 'ssl_info', {}) or {},
+        'page_title': getattr(result, 'page_title', '') or '',
+        'page_content_length': getattr(result, 'page_content_length', 0) or 0,
+        'retry_count': getattr(result, 'retry_count', 0) or 0,
+        'redirect_chain': getattr(result, 'redirect_chain', []) or [],
+        'detected_at': detected_at,
+        'detection_duration': getattr(result, 'detection_duration', None),
+        'last_seen_at': detected_at,
+        'check_count': 1,
+        'min_response_time': response_time,
+        'max_response_time': response_time,
+    }
+
+
+class WriteTicket:
+    """写入凭据，刷写完成后可获取记录ID"""
+
+    def __init__(self, row_count: int):
+        self.row_count = row_count
+        self.record_ids: List[int] = []
+        self.error: Optional[Exception] = None
+        self._event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> List[int]:
+        """
+        等待写入完成
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            按提交顺序排列的检测记录ID
+
+        Raises:
+            TimeoutError: 等待超时
+            Exception: 写入失败时抛出原始异常
+        """
+        if not self._event.wait(timeout):
+            raise TimeoutError(f"等待检测结果写入超时（{timeout}秒）")
+        if self.error:
+            raise self.error
+        return self.record_ids
+
+    def _resolve(self, record_ids: List[int] = None, error: Exception = None):
+        self.record_ids = record_ids or []
+        self.error = error
+        self._event.set()
+
+
+class ResultWriteBuffer:
+    """检测结果写入缓冲"""
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'RESULT_WRITER_CONFIG', {})
+        self.max_batch_size = config.get('max_batch_size', 500)
+        self.flush_interval = config.get('flush_interval_seconds', 1.0)
+        self.max_queue_rows = config.get('max_queue_rows', 20000)
+        self.submit_timeout = config.get('submit_timeout_seconds', 30)
+        self.max_retries = config.get('max_retries', 3)
+
+        self._pending: Deque[Tuple[WriteTicket, List[Dict], float]] = deque()
+        self._pending_rows = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._closed = False
+
+        # 刷写监听器：before_commit(db, rows, record_ids) 在同一事务内执行，
+        # after_commit(rows, record_ids) 在提交后执行
+        self._listeners: Dict[str, List[Callable]] = {'before_commit': [], 'after_commit': []}
+
+        self._stats = {
+            'submitted_rows': 0,
+            'flushed_rows': 0,
+            'flush_count': 0,
+            'failed_rows': 0,
+            'blocked_submits': 0,
+            'sync_writes': 0,
+        }
+        self._flush_latencies: Deque[float] = deque(maxlen=200)
+        self._last_flush_at: Optional[datetime] = None
+
+    def start(self):
+        """启动后台刷写线程"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._closed = False
+            self._thread = threading.Thread(target=self._flush_loop, name='result-writer', daemon=True)
+            self._thread.start()
+        logger.info("检测结果写入缓冲已启动")
+
+    def stop(self, timeout: float = 30):
+        """
+        停止刷写线程并写入剩余结果
+
+        Args:
+            timeout: 等待刷写线程结束的最长秒数
+        """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._thread:
+            self._thread.join(timeout)
+
+        # 刷写线程未能处理的剩余结果在当前线程写入
+        self.flush()
+        logger.info("检测结果写入缓冲已停止")
+
+    def add_listener(self, callback: Callable, phase: str = 'after_commit'):
+        """
+        注册刷写监听器
+
+        Args:
+            callback: 回调函数
+            phase: before_commit 或 after_commit
+        """
+        if phase not in self._listeners:
+            raise ValueError(f"不支持的监听阶段: {phase}")
+        if callback not in self._listeners[phase]:
+            self._listeners[phase].append(callback)
+
+    def submit(self, rows: List[Dict]) -> WriteTicket:
+        """
+        提交检测记录
+
+        Args:
+            rows: 检测记录字段字典列表
+
+        Returns:
+            写入凭据
+        """
+        ticket = WriteTicket(len(rows))
+        if not rows:
+            ticket._resolve([])
+            return ticket
+
+        if self._closed:
+            # 已关闭（应用退出中）：直接同步写入
+            self._stats['sync_writes'] += 1
+            self._write_entries([(ticket, rows)])
+            return ticket
+
+        if not self._running:
+            self.start()
+
+        deadline = time.monotonic() + self.submit_timeout
+        with self._condition:
+            blocked = False
+            # 队列已满时等待刷写释放空间；队列为空时允许超过容量的单次提交
+            while self._pending_rows and self._pending_rows + len(rows) > self.max_queue_rows:
+                blocked = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._condition.wait(remaining)
+
+            if blocked:
+                self._stats['blocked_submits'] += 1
+
+            self._stats['submitted_rows'] += len(rows)
+            queue_full = self._pending_rows and self._pending_rows + len(rows) > self.max_queue_rows
+            if not queue_full:
+                self._pending.append((ticket, rows, time.monotonic()))
+                self._pending_rows += len(rows)
+                if self._pending_rows >= self.max_batch_size:
+                    self._condition.notify_all()
+                return ticket
+
+        # 等待超时：在调用线程中同步写入，保证数据不丢失
+        logger.warning(f"检测结果缓冲队列已满，同步写入 {len(rows)} 条记录")
+        self._stats['sync_writes'] += 1
+        self._write_entries([(ticket, rows)])
+        return ticket
+
+    def flush(self):
+        """立即写入队列中的全部结果"""
+        while True:
+            entries = self._take_batch(force=True)
+            if not entries:
+                return
+            self._write_entries(entries)
+
+    def get_stats(self) -> Dict:
+        """获取缓冲指标"""
+        with self._condition:
+            latencies = sorted(self._flush_latencies)
+            oldest_age = time.monotonic() - self._pending[0][2] if self._pending else 0.0
+            stats = dict(self._stats)
+            stats.update({
+                'running': self._running,
+                'queue_depth': self._pending_rows,
+                'queue_capacity': self.max_queue_rows,
+                'pending_submissions': len(self._pending),
+                'oldest_pending_seconds': round(oldest_age, 3),
+            })
+
+        if latencies:
+            stats['flush_latency_ms'] = {
+                'last': round(self._flush_latencies[-1] * 1000, 2),
+                'avg': round(sum(latencies) / len(latencies) * 1000, 2),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2),
+            }
+        else:
+            stats['flush_latency_ms'] = {'last': 0, 'avg': 0, 'p95': 0, 'max': 0}
+        stats['last_flush_at'] = self._last_flush_at.isoformat() if self._last_flush_at else None
+        stats['change_only'] = change_only_storage.get_stats()
+        return stats
+
+    def _flush_loop(self):
+        """后台刷写循环"""
+        while True:
+            with self._condition:
+                while self._running and not self._batch_ready():
+                    timeout = self.flush_interval
+                    if self._pending:
+                        timeout = max(0.0, self._pending[0][2] + self.flush_interval - time.monotonic())
+                    self._condition.wait(timeout)
+
+                if not self._running and not self._pending:
+                    return
+
+            entries = self._take_batch(force=not self._running)
+            if entries:
+                self._write_entries(entries)
+
+    def _batch_ready(self) -> bool:
+        """达到批量大小或最早的结果已等待超过刷写间隔"""
+        if not self._pending:
+            return False
+        if self._pending_rows >= self.max_batch_size:
+            return True
+        return time.monotonic() - self._pending[0][2] >= self.flush_interval
+
+    def _take_batch(self, force: bool = False) -> List[Tuple[WriteTicket, List[Dict]]]:
+        """从队列取出一批提交（整体取出，单次提交不拆分）"""
+        with self._condition:
+            if not self._pending or (not force and not self._batch_ready()):
+                return []
+
+            entries = []
+            row_count = 0
+            while self._pending and (not entries or row_count + len(self._pending[0][1]) <= self.max_batch_size):
+                ticket, rows, _ = self._pending.popleft()
+                entries.append((ticket, rows))
+                row_count += len(rows)
+
+            self._pending_rows -= row_count
+            self._condition.notify_all()
+            return entries
+
+    def _write_entries(self, entries: List[Tuple[WriteTicket, List[Dict]]]):
+        """在一个事务中写入一批提交，失败时重试"""
+        rows = [row for _, entry_rows in entries for row in entry_rows]
+        last_error = None
+
+        with self._flush_lock:
+            for attempt in range(1, self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    with get_write_db() as db:
+                        record_ids = self._insert_rows(db, rows)
+                        for callback in self._listeners['before_commit']:
+                            callback(db, rows, record_ids)
+                    break
+                except Exception as e:
+                    last_error = e
+                    # 事务已回滚，合并记录缓存可能与数据库不一致
+                    change_only_storage.reset()
+                    logger.error(f"写入检测结果失败（第{attempt}次）: {e}")
+                    time.sleep(min(0.5 * attempt, 2))
+            else:
+                self._stats['failed_rows'] += len(rows)
+                for ticket, _ in entries:
+                    ticket._resolve(error=last_error)
+                return
+
+            elapsed = time.perf_counter() - started
+            self._flush_latencies.append(elapsed)
+            self._last_flush_at = get_beijing_time()
+            self._stats['flushed_rows'] += len(rows)
+            self._stats['flush_count'] += 1
+
+        offset = 0
+        for ticket, entry_rows in entries:
+            ticket._resolve(record_ids[offset:offset + len(entry_rows)])
+            offset += len(entry_rows)
+
+        for callback in self._listeners['after_commit']:
+            try:
+                callback(rows, record_ids)
+            except Exception as e:
+                logger.error(f"检测结果写入回调执行失败: {e}")
+
+        logger.debug(f"刷写 {len(rows)} 条检测记录，耗时 {elapsed * 1000:.1f}ms")
+
+    def _insert_rows(self, db, rows: List[Dict]) -> List[int]:
+        """批量写入检测记录（按存储布局路由，变化存储模式下合并相同结果）并返回按顺序排列的ID"""
+        if change_only_storage.enabled:
+            return change_only_storage.write_rows(db, rows)
+        return detection_storage.insert_rows(db, rows)
+
+
+# 全局检测结果写入缓冲实例
+result_writer = ResultWriteBuffer()
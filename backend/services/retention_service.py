@@ -0,0 +1,429 @@
+"""
+历史数据清理服务
+按主键区间分块删除过期的检测记录和状态变化记录，避免单条大 DELETE 长时间锁库
+- 每块在独立的写事务中删除，块之间释放写连接，检测结果可以穿插写入
+- 后台清理按每秒删除行数限速
+- 清理进度与删除在同一事务中记录到 SystemSetting，进程重启后从断点继续
+- 启用分区存储时，整个周期都已过期的分区直接删除，基础表中的数据仍分块删除
+- 清除全部数据时同时删除压缩后的小时汇总（汇总按自身保留天数由压缩服务清理）
+- 启用冷归档时，过期检测记录先分块写入归档文件再删除（清除全部时不归档）
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+
+from ..config import Config
+from ..database import get_db, get_write_db
+from ..models import DetectionRecord, DetectionHourlySummary, DetectionTask, Website, WebsiteDailyUptime, WebsiteLatencySketch, WebsiteStatusChange, SystemSetting
+from ..utils.cache import invalidate_detections, shared_cache
+from ..utils.helpers import get_beijing_time
+from .archive_service import archive_service
+from .detection_storage import detection_storage
+
+logger = logging.getLogger(__name__)
+
+# 清理阶段：先删除状态变化记录（其引用检测记录），再删除检测记录
+PHASES = ('status_changes', 'detection_records')
+
+
+class RetentionPurgeBusy(Exception):
+    """已有清理任务在运行"""
+
+
+class RetentionService:
+    """历史数据清理服务"""
+
+    STATE_KEY = 'retention_purge_state'
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'RETENTION_PURGE_CONFIG', {})
+        self.chunk_size = config.get('chunk_size', 1000)
+        self.rows_per_second = config.get('rows_per_second', 5000)
+        self.interval_hours = config.get('interval_hours', 24)
+
+        self._run_lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state: Optional[Dict] = None
+
+    @property
+    def retain_days(self) -> int:
+        """配置的检测记录保留天数"""
+        return Config.DATA_RETENTION.get('detection_records_days', 90)
+
+    def is_running(self) -> bool:
+        """是否有清理任务在运行"""
+        return self._run_lock.locked()
+
+    def start_purge(self, retain_days: Optional[int] = None) -> bool:
+        """
+        启动后台清理任务（限速执行）
+
+        Args:
+            retain_days: 保留天数，默认使用 DATA_RETENTION 配置；0 表示清除全部
+
+        Returns:
+            是否成功启动（已有任务在运行时返回False）
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return False
+
+        self._cancel_event.clear()
+        self._state = {'status': 'starting', 'retain_days': self.retain_days if retain_days is None else retain_days}
+        self._thread = threading.Thread(
+            target=self._run_locked,
+            args=(retain_days, True),
+            name='retention-purge',
+            daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def run_purge(self, retain_days: Optional[int] = None, throttle: bool = False) -> Dict:
+        """
+        在当前线程中执行分块清理
+
+        Args:
+            retain_days: 保留天数，默认使用 DATA_RETENTION 配置；0 表示清除全部
+            throttle: 是否按 rows_per_second 限速
+
+        Returns:
+            清理结果（与进度结构相同）
+
+        Raises:
+            RetentionPurgeBusy: 已有清理任务在运行
+        """
+        if not self._run_lock.acquire(blocking=False):
+            raise RetentionPurgeBusy('数据清理任务正在运行')
+
+        self._cancel_event.clear()
+        return self._run_locked(retain_days, throttle)
+
+    def cancel(self) -> bool:
+        """
+        请求取消正在运行的清理任务，已删除的块不回滚，断点保留以便继续
+
+        Returns:
+            是否有任务在运行
+        """
+        if not self.is_running():
+            return False
+        self._cancel_event.set()
+        return True
+
+    def get_progress(self) -> Dict:
+        """获取清理进度"""
+        state = dict(self._state) if self._state else self._load_state()
+        if not state:
+            return {'status': 'idle', 'running': False, 'retain_days': self.retain_days}
+
+        state['running'] = self.is_running()
+        state['percent'] = self._percent(state)
+        return state
+
+    def _run_locked(self, retain_days: Optional[int], throttle: bool) -> Dict:
+        """持有运行锁执行清理，结束后释放"""
+        try:
+            return self._purge(self.retain_days if retain_days is None else retain_days, throttle)
+        except Exception as e:
+            logger.error(f"历史数据清理失败: {e}")
+            if self._state:
+                self._state.update({'status': 'failed', 'error': str(e)})
+                self._save_state_safely()
+            raise
+        finally:
+            # 取消或失败前已删除的块同样需要失效
+            self._invalidate_caches()
+            self._run_lock.release()
+
+    @staticmethod
+    def _invalidate_caches():
+        """
+        失效全部检测数据缓存（含 ETag 版本）
+        删除的记录分布在各任务和网站中，分块删除时不逐行记录，按全部任务和网站递增版本
+        """
+        try:
+            with get_db() as db:
+                task_ids = db.scalars(select(DetectionTask.id)).all()
+                website_ids = db.scalars(select(Website.id)).all()
+            invalidate_detections(task_ids, website_ids)
+        except Exception as e:
+            logger.warning(f"清理后失效检测数据缓存失败: {e}")
+
+    def _purge(self, retain_days: int, throttle: bool) -> Dict:
+        """执行清理：按阶段分块删除，必要时从断点继续"""
+        state = self._resume_or_create_state(retain_days)
+        self._state = state
+        cutoff = datetime.fromisoformat(state['cutoff_date']) if state['cutoff_date'] else None
+
+        started = time.monotonic()
+        deleted_in_run = 0
+        budget = self.rows_per_second if throttle else 0
+
+        # 冷归档：过期检测记录（含分区表）先写入归档再删除，之后的分区删除和分块删除只剩已归档的空间
+        if cutoff is not None and archive_service.enabled:
+            for table in detection_storage.physical_tables(end_date=cutoff):
+                last_id = 0
+                while last_id is not None:
+                    if self._cancel_event.is_set():
+                        state['status'] = 'cancelled'
+                        self._save_state_safely()
+                        logger.info("历史数据清理已取消，归档进度已提交")
+                        return dict(state)
+
+                    last_id, archived = self._archive_chunk(table, cutoff, last_id)
+                    state['archived_count'] = state.get('archived_count', 0) + archived
+                    deleted_in_run += archived
+
+                    if budget > 0 and archived:
+                        wait = deleted_in_run / budget - (time.monotonic() - started)
+                        if wait > 0:
+                            self._cancel_event.wait(wait)
+
+        # 分区存储：整体删除过期分区，并预建后续分区
+        dropped = detection_storage.drop_expired_partitions(cutoff)
+        if dropped:
+            state['partitions_dropped'] = state.get('partitions_dropped', []) + dropped
+        detection_storage.premake_partitions()
+
+        logger.info(
+            f"开始清理历史数据: 保留 {retain_days} 天, 截止 {state['cutoff_date'] or '全部'}, "
+            f"从 {state['phase']} 阶段 ID {state['last_id']} 继续"
+        )
+
+        while state['phase'] in PHASES:
+            if self._cancel_event.is_set():
+                state['status'] = 'cancelled'
+                self._save_state_safely()
+                logger.info("历史数据清理已取消，断点已保存")
+                return dict(state)
+
+            deleted = self._purge_chunk(state, cutoff)
+            deleted_in_run += deleted
+
+            # 限速：按累计删除行数计算应耗时间，提前完成则等待
+            if budget > 0 and deleted:
+                wait = deleted_in_run / budget - (time.monotonic() - started)
+                if wait > 0:
+                    self._cancel_event.wait(wait)
+
+        if cutoff is None:
+            # 清除全部时一并删除压缩后的小时汇总、响应时间草图和每日可用时长缓存
+            with get_write_db() as db:
+                db.execute(delete(DetectionHourlySummary))
+                db.execute(delete(WebsiteLatencySketch))
+                db.execute(delete(WebsiteDailyUptime))
+
+        state.update({'status': 'completed', 'finished_at': get_beijing_time().isoformat()})
+        self._save_state_safely()
+
+        # 统计类缓存可能覆盖被删除的数据，清理完成后整体清空
+        shared_cache.clear()
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"历史数据清理完成: 删除 {state['deleted_count']} 条检测记录和 "
+            f"{state['status_changes_deleted']} 条状态变化记录，耗时 {elapsed:.1f}s"
+        )
+        return dict(state)
+
+    def _purge_chunk(self, state: Dict, cutoff: Optional[datetime]) -> int:
+        """删除当前阶段的下一个主键区间，并在同一事务中推进断点"""
+        model = WebsiteStatusChange if state['phase'] == 'status_changes' else DetectionRecord
+        upper_id = state['upper_ids'][state['phase']]
+        last_id = state['last_id']
+
+        with get_write_db() as db:
+            # 区间终点：跳过 chunk_size 行后的ID，不足一块时取上界
+            end_id = db.scalar(
+                select(model.id)
+                .where(model.id > last_id, model.id <= upper_id)
+                .order_by(model.id)
+                .offset(self.chunk_size - 1)
+                .limit(1)
+            ) or upper_id
+
+            conditions = [model.id > last_id, model.id <= end_id]
+            if cutoff is not None:
+                conditions.append(model.detected_at < cutoff)
+
+            if model is DetectionRecord and db.get_bind().dialect.name != 'sqlite':
+                # 外键约束生效的数据库需先解除保留的状态变化记录对待删检测记录的引用
+                self._detach_status_changes(db, last_id, end_id, cutoff)
+
+            result = db.execute(delete(model).where(*conditions).execution_options(synchronize_session=False))
+            deleted = max(result.rowcount or 0, 0)
+
+            # 断点在副本上推进，事务提交成功后才更新内存状态
+            next_state = dict(state)
+            counter = 'deleted_count' if model is DetectionRecord else 'status_changes_deleted'
+            next_state[counter] += deleted
+            next_state['chunks'] += 1
+            next_state['updated_at'] = get_beijing_time().isoformat()
+
+            if end_id >= upper_id:
+                next_index = PHASES.index(state['phase']) + 1
+                next_state['phase'] = PHASES[next_index] if next_index < len(PHASES) else 'done'
+                next_state['last_id'] = 0
+            else:
+                next_state['last_id'] = end_id
+
+            self._write_state(db, next_state)
+
+        state.update(next_state)
+        return deleted
+
+    def _archive_chunk(self, table, cutoff: datetime, last_id: int) -> Tuple[Optional[int], int]:
+        """
+        将一块过期检测记录写入冷归档并删除
+
+        Returns:
+            (本块最后一条记录的ID，没有更多记录时为None, 归档的记录数)
+        """
+        c = table.c
+        with get_write_db() as db:
+            rows = db.execute(
+                select(table)
+                .where(c.id > last_id, c.detected_at < cutoff)
+                .order_by(c.id)
+                .limit(self.chunk_size)
+            ).all()
+            if not rows:
+                return None, 0
+
+            archived = archive_service.write_rows(rows, 'retention', table.name)
+
+            end_id = rows[-1].id
+            if table is DetectionRecord.__table__ and db.get_bind().dialect.name != 'sqlite':
+                self._detach_status_changes(db, last_id, end_id, cutoff)
+            db.execute(delete(table).where(c.id.in_([row.id for row in rows])))
+
+        return end_id, archived
+
+    def _detach_status_changes(self, db, start_id: int, end_id: int, cutoff: Optional[datetime]):
+        """将引用待删检测记录的状态变化记录外键置空"""
+        doomed = select(DetectionRecord.id).where(DetectionRecord.id > start_id, DetectionRecord.id <= end_id)
+        if cutoff is not None:
+            doomed = doomed.where(DetectionRecord.detected_at < cutoff)
+
+        for column in (WebsiteStatusChange.previous_detection_id, WebsiteStatusChange.current_detection_id):
+            db.execute(
+                update(WebsiteStatusChange)
+                .where(column > start_id, column <= end_id, column.in_(doomed))
+                .values({column.key: None})
+                .execution_options(synchronize_session=False)
+            )
+
+    def _resume_or_create_state(self, retain_days: int) -> Dict:
+        """
+        读取未完成的断点；保留天数一致时继续，否则重新开始
+        继续时按当前时间重新计算截止时间和各阶段的主键上界，只沿用阶段和 last_id 进度，
+        断点保存之后写入的记录同样会被清理。清除全部不继续断点，总是从头开始
+        """
+        cutoff = datetime.now() - timedelta(days=retain_days) if retain_days > 0 else None
+        upper_ids = self._upper_ids(cutoff)
+
+        saved = self._load_state()
+        if saved and cutoff is not None and saved.get('status') != 'completed' \
+                and saved.get('retain_days') == retain_days and saved.get('phase') in PHASES:
+            saved.update({
+                'status': 'running',
+                'error': None,
+                'resumed': True,
+                'cutoff_date': cutoff.isoformat(),
+                'upper_ids': upper_ids,
+            })
+            return saved
+
+        return {
+            'status': 'running',
+            'retain_days': retain_days,
+            'cutoff_date': cutoff.isoformat() if cutoff else None,
+            'is_clear_all': cutoff is None,
+            'phase': PHASES[0],
+            'last_id': 0,
+            'upper_ids': upper_ids,
+            'deleted_count': 0,
+            'status_changes_deleted': 0,
+            'chunks': 0,
+            'partitions_dropped': [],
+            'archived_count': 0,
+            'resumed': False,
+            'error': None,
+            'started_at': get_beijing_time().isoformat(),
+            'updated_at': get_beijing_time().isoformat(),
+            'finished_at': None,
+        }
+
+    @staticmethod
+    def _upper_ids(cutoff: Optional[datetime]) -> Dict[str, int]:
+        """各阶段待删除记录的最大主键（清除全部时为当前最大主键）"""
+        with get_db() as db:
+            upper_ids = {}
+            for phase, model in zip(PHASES, (WebsiteStatusChange, DetectionRecord)):
+                query = select(func.max(model.id))
+                if cutoff is not None:
+                    query = query.where(model.detected_at < cutoff)
+                upper_ids[phase] = db.scalar(query) or 0
+        return upper_ids
+
+    def _percent(self, state: Dict) -> float:
+        """按主键区间估算完成百分比"""
+        if state.get('status') == 'starting':
+            return 0.0
+        if state.get('status') == 'completed' or state.get('phase') not in PHASES:
+            return 100.0
+
+        upper_ids = state.get('upper_ids') or {}
+        total = sum(upper_ids.values())
+        if not total:
+            return 100.0
+
+        done = 0
+        for phase in PHASES:
+            if phase == state['phase']:
+                done += state.get('last_id', 0)
+                break
+            done += upper_ids.get(phase, 0)
+        return round(min(done / total, 1.0) * 100, 1)
+
+    def _load_state(self) -> Optional[Dict]:
+        """读取持久化的清理断点"""
+        try:
+            with get_db() as db:
+                value = db.scalar(select(SystemSetting.value).where(SystemSetting.key == self.STATE_KEY))
+            return json.loads(value) if value else None
+        except Exception as e:
+            logger.warning(f"读取清理断点失败: {e}")
+            return None
+
+    def _write_state(self, db, state: Dict):
+        """在给定会话中保存清理断点"""
+        setting = db.scalar(select(SystemSetting).where(SystemSetting.key == self.STATE_KEY))
+        if setting is None:
+            setting = SystemSetting(
+                key=self.STATE_KEY,
+                description='历史数据清理进度断点',
+                category='maintenance',
+                data_type='json'
+            )
+            db.add(setting)
+        setting.value = json.dumps(state, ensure_ascii=False)
+
+    def _save_state_safely(self):
+        """在独立事务中保存当前断点"""
+        try:
+            with get_write_db() as db:
+                self._write_state(db, self._state)
+        except Exception as e:
+            logger.error(f"保存清理断点失败: {e}")
+
+
+# 全局历史数据清理服务实例
+retention_service = RetentionService()
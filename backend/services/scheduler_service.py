@@ -12,6 +12,10 @@ from concurrent.futures import ThreadPoolExecutor
 
 from .detection_service import DetectionService
 from .file_cleanup_service import FileCleanupService
+from .retention_service import retention_service
+from .compaction_service import compaction_service
+from .latency_sketch_service import latency_sketch_service
+from .export_job_service import export_job_service
 from ..database import get_db
 from ..models import DetectionTask
 from ..utils.helpers import get_beijing_time
@@ -36,6 +40,18 @@ class SchedulerService:
         self.cleanup_interval_hours = 24  # 24小时清理一次
         self.last_cleanup_time = None
         
+        # 历史数据清理配置
+        self.last_retention_purge_time = None
+        
+        # 检测记录压缩配置
+        self.last_compaction_time = None
+        
+        # 响应时间草图清理配置
+        self.last_sketch_purge_time = None
+        
+        # 过期导出任务清理配置
+        self.last_export_purge_time = None
+        
         logger.info("调度服务初始化完成")
     
     def start(self):
@@ -83,6 +99,18 @@ class SchedulerService:
                 # 执行文件清理调度
                 self._schedule_file_cleanup(current_time)
                 
+                # 执行历史数据清理调度
+                self._schedule_retention_purge(current_time)
+                
+                # 执行检测记录压缩调度
+                self._schedule_compaction(current_time)
+                
+                # 执行过期响应时间草图清理调度
+                self._schedule_sketch_purge(current_time)
+                
+                # 执行过期导出任务清理调度
+                self._schedule_export_purge(current_time)
+                
                 # 自适应休眠策略 - 根据任务活跃度调整检查频率
                 active_task_count = len(self.running_tasks)
                 if active_task_count == 0:
@@ -254,6 +282,68 @@ class SchedulerService:
         except Exception as e:
             logger.error(f"调度文件清理失败: {e}")
     
+    def _schedule_retention_purge(self, current_time: datetime):
+        """调度历史数据清理任务（首次运行时继续未完成的清理）"""
+        try:
+            if self.last_retention_purge_time is not None:
+                elapsed = current_time - self.last_retention_purge_time
+                if elapsed.total_seconds() < retention_service.interval_hours * 3600:
+                    return
+            
+            # 清理在独立线程中分块限速执行，已在运行时跳过
+            if retention_service.start_purge():
+                logger.info("开始执行定期历史数据清理")
+            self.last_retention_purge_time = current_time
+                
+        except Exception as e:
+            logger.error(f"调度历史数据清理失败: {e}")
+    
+    def _schedule_compaction(self, current_time: datetime):
+        """调度检测记录压缩任务"""
+        try:
+            if self.last_compaction_time is not None:
+                elapsed = current_time - self.last_compaction_time
+                if elapsed.total_seconds() < compaction_service.interval_hours * 3600:
+                    return
+            
+            # 压缩在独立线程中分块执行，未启用或已在运行时跳过
+            if compaction_service.start_compaction():
+                logger.info("开始执行定期检测记录压缩")
+            self.last_compaction_time = current_time
+                
+        except Exception as e:
+            logger.error(f"调度检测记录压缩失败: {e}")
+    
+    def _schedule_sketch_purge(self, current_time: datetime):
+        """调度过期响应时间草图清理"""
+        try:
+            if self.last_sketch_purge_time is not None:
+                elapsed = current_time - self.last_sketch_purge_time
+                if elapsed.total_seconds() < latency_sketch_service.purge_interval_hours * 3600:
+                    return
+            
+            deleted = latency_sketch_service.purge_expired()
+            if deleted:
+                logger.info(f"清理过期响应时间草图 {deleted} 个")
+            self.last_sketch_purge_time = current_time
+                
+        except Exception as e:
+            logger.error(f"清理过期响应时间草图失败: {e}")
+    
+    def _schedule_export_purge(self, current_time: datetime):
+        """调度过期导出任务清理"""
+        try:
+            if self.last_export_purge_time is not None:
+                elapsed = current_time - self.last_export_purge_time
+                if elapsed.total_seconds() < export_job_service.purge_interval_hours * 3600:
+                    return
+            
+            export_job_service.purge_expired()
+            self.last_export_purge_time = current_time
+                
+        except Exception as e:
+            logger.error(f"清理过期导出任务失败: {e}")
+    
     def _should_run_task(self, task: DetectionTask, current_time: datetime) -> bool:
         """判断任务是否应该运行"""
         if not task.is_active or task.is_running:
@@ -328,7 +418,13 @@ class SchedulerService:
             'running_task_ids': list(self.running_tasks.keys()),
             'last_cleanup_time': self.last_cleanup_time.isoformat() if self.last_cleanup_time else None,
             'next_cleanup_time': (self.last_cleanup_time + timedelta(hours=self.cleanup_interval_hours)).isoformat() 
-                                if self.last_cleanup_time else None
+                                if self.last_cleanup_time else None,
+            'last_retention_purge_time': self.last_retention_purge_time.isoformat()
+                                         if self.last_retention_purge_time else None,
+            'last_compaction_time': self.last_compaction_time.isoformat()
+                                    if self.last_compaction_time else None,
+            'last_sketch_purge_time': self.last_sketch_purge_time.isoformat()
+                                      if self.last_sketch_purge_time else None
         }
     
     def force_cleanup(self) -> bool:
@@ -6,13 +6,16 @@
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 
 from ..database import get_db
 from ..models import (
     Website, DetectionRecord, WebsiteStatusChange, DetectionTask
 )
+from ..utils.cache import invalidate_detections
 from ..utils.helpers import get_beijing_time
+from .detection_storage import detection_storage
+from .uptime_service import uptime_service
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +42,10 @@ class StatusChangeService:
             
             with get_db() as db:
                 for current_record in current_detection_records:
+                    # 变化存储模式下被延长的记录与上一次结果相同，不会产生新的状态变化
+                    if (current_record.check_count or 1) > 1:
+                        continue
+
                     # 获取该网站的上一次检测记录
                     previous_record = self._get_previous_detection_record(
                         db, current_record.website_id, task_id, current_record.detected_at
@@ -59,6 +66,14 @@ class StatusChangeService:
                     db.commit()
                     logger.info(f"检测到 {len(changes)} 个网站状态变化")
                     
+                    # 写入较早日期的变化时清除受影响的每日可用时长缓存
+                    uptime_service.invalidate(
+                        (change.website_id, change.detected_at) for change in changes
+                    )
+                    
+                    # 失效该任务和涉及网站的统计缓存
+                    invalidate_detections([task_id], {change.website_id for change in changes})
+                    
                     # 发送邮件通知
                     self._send_email_notifications(changes, db)
                 
@@ -88,11 +103,12 @@ class StatusChangeService:
             上一次检测记录，如果没有则返回None
         """
         try:
-            return db.query(DetectionRecord).filter(
-                DetectionRecord.website_id == website_id,
-                DetectionRecord.task_id == task_id,
-                DetectionRecord.detected_at < current_time
-            ).order_by(DetectionRecord.detected_at.desc()).first()
+            R = detection_storage.record_source(end_date=current_time)
+            return db.query(R).filter(
+                R.website_id == website_id,
+                R.task_id == task_id,
+                R.detected_at < current_time
+            ).order_by(R.detected_at.desc()).first()
             
         except Exception as e:
             logger.error(f"获取上一次检测记录失败: website_id={website_id}, error={e}")
@@ -196,8 +212,10 @@ class StatusChangeService:
                 # 计算时间范围
                 since_time = get_beijing_time() - timedelta(hours=hours)
                 
-                # 构建查询
-                query = db.query(WebsiteStatusChange).join(Website)
+                # 构建查询（网站随关联一次加载）
+                query = db.query(WebsiteStatusChange).join(Website).options(
+                    contains_eager(WebsiteStatusChange.website)
+                )
                 
                 if task_id:
                     query = query.filter(WebsiteStatusChange.task_id == task_id)
@@ -241,21 +259,22 @@ class StatusChangeService:
                 # 获取最新的检测记录（每个网站的最新记录）
                 from sqlalchemy import func
                 
+                R = detection_storage.record_source()
                 subquery = db.query(
-                    DetectionRecord.website_id,
-                    func.max(DetectionRecord.detected_at).label('max_detected_at')
-                ).group_by(DetectionRecord.website_id)
+                    R.website_id,
+                    func.max(R.detected_at).label('max_detected_at')
+                ).group_by(R.website_id)
                 
                 if task_id:
-                    subquery = subquery.filter(DetectionRecord.task_id == task_id)
+                    subquery = subquery.filter(R.task_id == task_id)
                 
                 subquery = subquery.subquery()
                 
                 # 获取最新检测记录的状态
-                latest_records = db.query(DetectionRecord).join(
+                latest_records = db.query(R).join(
                     subquery,
-                    (DetectionRecord.website_id == subquery.c.website_id) &
-                    (DetectionRecord.detected_at == subquery.c.max_detected_at)
+                    (R.website_id == subquery.c.website_id) &
+                    (R.detected_at == subquery.c.max_detected_at)
                 ).all()
                 
                 # 统计各种状态
@@ -314,21 +333,22 @@ class StatusChangeService:
                 # 获取最新的检测记录（每个网站的最新记录）
                 from sqlalchemy import func
                 
+                R = detection_storage.record_source()
                 subquery = db.query(
-                    DetectionRecord.website_id,
-                    func.max(DetectionRecord.detected_at).label('max_detected_at')
+                    R.website_id,
+                    func.max(R.detected_at).label('max_detected_at')
                 ).filter(
-                    DetectionRecord.task_id == task_id
-                ).group_by(DetectionRecord.website_id).subquery()
+                    R.task_id == task_id
+                ).group_by(R.website_id).subquery()
                 
                 # 获取状态为failed的最新检测记录
-                failed_records = db.query(DetectionRecord).join(
+                failed_records = db.query(R).join(
                     subquery,
-                    (DetectionRecord.website_id == subquery.c.website_id) &
-                    (DetectionRecord.detected_at == subquery.c.max_detected_at)
+                    (R.website_id == subquery.c.website_id) &
+                    (R.detected_at == subquery.c.max_detected_at)
                 ).filter(
-                    DetectionRecord.status == 'failed',
-                    DetectionRecord.task_id == task_id
+                    R.status == 'failed',
+                    R.task_id == task_id
                 ).all()
                 
                 # 获取对应的网站
@@ -364,6 +384,10 @@ class StatusChangeService:
             if not settings.get('enabled'):
                 return
             
+            # 预先加载涉及的网站，逐条读取 change.website 时直接命中会话缓存
+            website_ids = {change.website_id for change in changes}
+            db.query(Website).filter(Website.id.in_(website_ids)).all()
+            
             # 转换状态变化记录为邮件格式
             website_changes = []
             for change in changes:
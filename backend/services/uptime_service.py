@@ -0,0 +1,442 @@
+"""
+网站可用时长（SLA）服务
+根据状态变化记录（WebsiteStatusChange）还原每个网站的 可访问/不可访问 区间，
+按时间加权计算任意时间范围的可用率、MTTR（平均恢复时长）、MTBF（平均故障间隔）和故障列表，
+不依赖检测频率，也无需扫描检测记录
+- 区间起点状态：范围开始前最后一次变化的当前状态；没有时取范围内第一次变化的之前状态；
+  都没有时取最新检测结果（状态从未变化）
+- 已结束的自然日结果缓存到 WebsiteDailyUptime，月度报表只需读取每日缓存并实时计算首尾不足一天的部分
+- 写入早于今天的状态变化时清除对应网站该日及之后的缓存
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from ..config import Config
+from ..database import get_write_db
+from ..models import Website, WebsiteDailyUptime, WebsiteStatusChange
+from .detection_storage import detection_storage
+
+logger = logging.getLogger(__name__)
+
+# 视为可访问的检测状态
+ACCESSIBLE_STATUSES = ('standard', 'redirect')
+
+# 每日/时间段的累加指标
+METRIC_FIELDS = ('observed_seconds', 'downtime_seconds', 'failure_count', 'recovery_count', 'repair_seconds')
+
+ONE_DAY = timedelta(days=1)
+
+# 不可访问区间：(故障开始时间, 区间结束时间, 是否已恢复, 故障是否在范围内开始)
+DownInterval = Tuple[datetime, datetime, bool, bool]
+
+
+def is_accessible(status: Optional[str]) -> Optional[bool]:
+    """检测状态是否可访问，未知状态返回None"""
+    if not status:
+        return None
+    return status in ACCESSIBLE_STATUSES
+
+
+def overlap_seconds(start: datetime, end: datetime, other_start: datetime, other_end: datetime) -> float:
+    """两个时间区间重叠的秒数"""
+    return max((min(end, other_end) - max(start, other_start)).total_seconds(), 0.0)
+
+
+def empty_metrics() -> Dict:
+    return {field: 0 for field in METRIC_FIELDS}
+
+
+def add_metrics(target: Dict, metrics: Dict):
+    for field in METRIC_FIELDS:
+        target[field] += metrics[field]
+
+
+class WebsiteTimeline:
+    """单个网站在一段时间内的状态区间"""
+
+    __slots__ = ('known_from', 'down_intervals')
+
+    def __init__(self, known_from: Optional[datetime], down_intervals: List[DownInterval]):
+        # 状态已知的起始时间（之前没有任何状态信息时为第一次变化的时间，始终未知时为None）
+        self.known_from = known_from
+        self.down_intervals = down_intervals
+
+    @classmethod
+    def build(cls, initial_up: Optional[bool], outage_start: datetime, events: List[Tuple[datetime, bool]],
+              span_start: datetime, span_end: datetime) -> 'WebsiteTimeline':
+        """
+        由起点状态和范围内的状态变化构建区间
+
+        Args:
+            initial_up: 范围起点是否可访问（None 表示未知）
+            outage_start: 起点不可访问时故障的开始时间
+            events: 按时间排序的 (变化时间, 变化后是否可访问)
+            span_start: 范围开始
+            span_end: 范围结束
+        """
+        known_from = span_start if initial_up is not None else None
+        state = initial_up
+        down_since = outage_start if initial_up is False else None
+        began_in_span = False
+        intervals = []
+
+        for changed_at, up in events:
+            if state is None:
+                known_from = changed_at
+                if not up:
+                    down_since, began_in_span = changed_at, True
+            elif state and not up:
+                down_since, began_in_span = changed_at, True
+            elif not state and up:
+                intervals.append((down_since, changed_at, True, began_in_span))
+            state = up
+
+        if state is False:
+            intervals.append((down_since, span_end, False, began_in_span))
+        return cls(known_from, intervals)
+
+    def metrics(self, start: datetime, end: datetime, monitor_start: datetime) -> Dict:
+        """计算 [start, end) 内的累加指标"""
+        metrics = empty_metrics()
+        if self.known_from is None:
+            return metrics
+
+        observed_start = max(start, monitor_start, self.known_from)
+        if observed_start >= end:
+            return metrics
+
+        metrics['observed_seconds'] = (end - observed_start).total_seconds()
+        for outage_start, interval_end, recovered, began_in_span in self.down_intervals:
+            metrics['downtime_seconds'] += overlap_seconds(outage_start, interval_end, observed_start, end)
+            if began_in_span and start <= outage_start < end:
+                metrics['failure_count'] += 1
+            if recovered and start <= interval_end < end:
+                metrics['recovery_count'] += 1
+                metrics['repair_seconds'] += (interval_end - outage_start).total_seconds()
+        return metrics
+
+
+class UptimeService:
+    """网站可用时长（SLA）服务"""
+
+    def __init__(self, config: Dict = None):
+        config = config or getattr(Config, 'UPTIME_CONFIG', {})
+        self.cache_enabled = bool(config.get('cache_enabled', True))
+        # 自然日结束后等待该时长再缓存，避免延迟写入的状态变化
+        self.cache_delay = timedelta(minutes=config.get('cache_delay_minutes', 60))
+        self.default_days = config.get('default_days', 30)
+
+    def report(self, db, website_ids: Optional[Iterable[int]], start_date: datetime, end_date: datetime,
+               include_outages: bool = False) -> Dict:
+        """
+        计算时间范围内的可用率报表
+
+        Args:
+            db: 数据库会话
+            website_ids: 网站ID列表，None 表示全部网站
+            start_date: 起始时间
+            end_date: 结束时间（晚于当前时间时截止到当前时间）
+            include_outages: 是否返回故障列表
+
+        Returns:
+            {'summary': 汇总指标, 'websites': [每个网站的指标]}
+        """
+        now = datetime.now()
+        start_date = start_date.replace(tzinfo=None)
+        end_date = min(end_date.replace(tzinfo=None), now)
+
+        query = select(Website.id, Website.name, Website.url, Website.created_at)
+        if website_ids is not None:
+            website_ids = list(website_ids)
+            query = query.where(Website.id.in_(website_ids or [-1]))
+        websites = {
+            website_id: {'name': name, 'url': url, 'monitor_start': self._naive(created_at) or datetime.min}
+            for website_id, name, url, created_at in db.execute(query)
+        }
+
+        totals = {website_id: empty_metrics() for website_id in websites}
+        if websites and start_date < end_date:
+            self._accumulate(db, websites, start_date, end_date, now, totals)
+
+        outages = {}
+        if include_outages and websites and start_date < end_date:
+            outages = self.outages(db, websites, start_date, end_date)
+
+        results = []
+        summary = empty_metrics()
+        for website_id, info in websites.items():
+            add_metrics(summary, totals[website_id])
+            result = {'website_id': website_id, 'website_name': info['name'], 'website_url': info['url']}
+            result.update(self._describe(totals[website_id]))
+            if include_outages:
+                result['outages'] = outages.get(website_id, [])
+            results.append(result)
+
+        results.sort(key=lambda item: (item['availability'] is None, item['availability'] or 0))
+        return {
+            'summary': dict(website_count=len(websites), **self._describe(summary)),
+            'websites': results,
+        }
+
+    def outages(self, db, websites: Dict[int, Dict], start_date: datetime, end_date: datetime) -> Dict[int, List[Dict]]:
+        """
+        时间范围内（含范围开始前已开始）的故障列表
+
+        Returns:
+            {网站ID: [{'start', 'end', 'duration_seconds', 'recovered'}]}
+        """
+        timelines = self._timelines(db, websites, start_date, end_date)
+        result = {}
+        for website_id, timeline in timelines.items():
+            items = []
+            for outage_start, interval_end, recovered, _ in timeline.down_intervals:
+                if interval_end <= start_date and recovered:
+                    continue
+                items.append({
+                    'start': outage_start.isoformat(),
+                    'end': interval_end.isoformat() if recovered else None,
+                    'duration_seconds': round((interval_end - outage_start).total_seconds(), 1),
+                    'recovered': recovered,
+                })
+            result[website_id] = items
+        return result
+
+    def invalidate(self, changes: Iterable[Tuple[int, datetime]]):
+        """
+        清除受新写入状态变化影响的每日缓存
+
+        Args:
+            changes: (网站ID, 变化时间)
+        """
+        today = date.today()
+        earliest: Dict[int, date] = {}
+        for website_id, changed_at in changes:
+            day = changed_at.date()
+            if day < today and (website_id not in earliest or day < earliest[website_id]):
+                earliest[website_id] = day
+
+        if not earliest:
+            return
+        try:
+            with get_write_db() as db:
+                for website_id, day in earliest.items():
+                    db.execute(delete(WebsiteDailyUptime).where(
+                        WebsiteDailyUptime.website_id == website_id,
+                        WebsiteDailyUptime.day >= day
+                    ))
+        except Exception as e:
+            logger.error(f"清除每日可用时长缓存失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 计算
+    # ------------------------------------------------------------------
+
+    def _accumulate(self, db, websites: Dict[int, Dict], start_date: datetime, end_date: datetime,
+                    now: datetime, totals: Dict[int, Dict]):
+        """累加时间范围内各网站的指标（已结束的自然日读缓存，其余实时计算）"""
+        full_days, segments = self._split(start_date, end_date, now)
+
+        cached = {}
+        if full_days:
+            cached = self._load_cached(db, list(websites), full_days[0], full_days[-1])
+        missing_days = [day for day in full_days if any((website_id, day) not in cached for website_id in websites)]
+
+        for metrics in cached.values():
+            add_metrics(totals[metrics['website_id']], metrics)
+
+        day_segments = [(datetime.combine(day, time.min), datetime.combine(day, time.min) + ONE_DAY)
+                        for day in missing_days]
+        live_segments = sorted(segments + day_segments)
+        if not live_segments:
+            return
+
+        timelines = self._timelines(db, websites, live_segments[0][0], live_segments[-1][1])
+        new_rows = []
+        for website_id, timeline in timelines.items():
+            monitor_start = websites[website_id]['monitor_start']
+            for segment_start, segment_end in live_segments:
+                day = segment_start.date()
+                is_day = (segment_start, segment_end) in day_segments
+                if is_day and (website_id, day) in cached:
+                    continue
+                metrics = timeline.metrics(segment_start, segment_end, monitor_start)
+                add_metrics(totals[website_id], metrics)
+                if is_day:
+                    new_rows.append(dict(website_id=website_id, day=day, **metrics))
+
+        if new_rows and self.cache_enabled:
+            self._store_cached(new_rows)
+
+    def _split(self, start_date: datetime, end_date: datetime,
+               now: datetime) -> Tuple[List[date], List[Tuple[datetime, datetime]]]:
+        """
+        把时间范围切分为可缓存的完整自然日和需要实时计算的首尾时间段
+
+        Returns:
+            (完整自然日列表, [(开始, 结束)])
+        """
+        cache_before = now - self.cache_delay
+        first_day_start = datetime.combine(start_date.date(), time.min)
+        if first_day_start < start_date:
+            first_day_start += ONE_DAY
+
+        full_days = []
+        cursor = first_day_start
+        while self.cache_enabled and cursor + ONE_DAY <= min(end_date, cache_before):
+            full_days.append(cursor.date())
+            cursor += ONE_DAY
+
+        if not full_days:
+            return [], [(start_date, end_date)]
+
+        segments = []
+        if start_date < first_day_start:
+            segments.append((start_date, first_day_start))
+        if cursor < end_date:
+            segments.append((cursor, end_date))
+        return full_days, segments
+
+    def _timelines(self, db, websites: Dict[int, Dict], span_start: datetime,
+                   span_end: datetime) -> Dict[int, WebsiteTimeline]:
+        """构建各网站在范围内的状态区间"""
+        website_ids = list(websites)
+        C = WebsiteStatusChange
+
+        events: Dict[int, List[Tuple[datetime, bool]]] = defaultdict(list)
+        first_previous: Dict[int, Optional[bool]] = {}
+        for website_id, previous_status, current_status, detected_at in db.execute(
+            select(C.website_id, C.previous_status, C.current_status, C.detected_at).where(
+                C.website_id.in_(website_ids),
+                C.detected_at >= span_start,
+                C.detected_at < span_end
+            ).order_by(C.website_id, C.detected_at, C.id)
+        ):
+            up = is_accessible(current_status)
+            if up is None:
+                continue
+            first_previous.setdefault(website_id, is_accessible(previous_status))
+            events[website_id].append((detected_at, up))
+
+        initial = self._initial_states(db, website_ids, span_start, first_previous)
+
+        timelines = {}
+        for website_id in website_ids:
+            # 起点不可访问但不知道故障开始时间时，按范围起点计算
+            initial_up, outage_start = initial.get(website_id, (None, None))
+            timelines[website_id] = WebsiteTimeline.build(
+                initial_up, outage_start or span_start, events.get(website_id, []), span_start, span_end
+            )
+        return timelines
+
+    def _initial_states(self, db, website_ids: List[int], span_start: datetime,
+                        first_previous: Dict[int, Optional[bool]]) -> Dict[int, Tuple[Optional[bool], Optional[datetime]]]:
+        """
+        各网站在范围起点的状态
+
+        Returns:
+            {网站ID: (是否可访问, 不可访问时故障开始时间)}
+        """
+        C = WebsiteStatusChange
+        result = {}
+
+        # 范围开始前最后一次变化
+        latest = select(
+            C.website_id, func.max(C.detected_at).label('detected_at')
+        ).where(
+            C.website_id.in_(website_ids),
+            C.detected_at < span_start
+        ).group_by(C.website_id).subquery()
+        for website_id, current_status, detected_at in db.execute(
+            select(C.website_id, C.current_status, C.detected_at).join(
+                latest, (C.website_id == latest.c.website_id) & (C.detected_at == latest.c.detected_at)
+            )
+        ):
+            up = is_accessible(current_status)
+            if up is not None:
+                result[website_id] = (up, None if up else detected_at)
+
+        # 范围内第一次变化的之前状态
+        for website_id, up in first_previous.items():
+            if website_id not in result and up is not None:
+                result[website_id] = (up, None)
+
+        # 从未发生变化：取最新检测结果
+        unresolved = [website_id for website_id in website_ids if website_id not in result]
+        if unresolved:
+            R = detection_storage.record_source()
+            newest = select(
+                R.website_id, func.max(R.detected_at).label('detected_at')
+            ).where(R.website_id.in_(unresolved)).group_by(R.website_id).subquery()
+            for website_id, status in db.execute(
+                select(R.website_id, R.status).join(
+                    newest, (R.website_id == newest.c.website_id) & (R.detected_at == newest.c.detected_at)
+                )
+            ):
+                up = is_accessible(status)
+                if up is not None:
+                    result[website_id] = (up, None)
+        return result
+
+    # ------------------------------------------------------------------
+    # 每日缓存
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load_cached(db, website_ids: List[int], first_day: date, last_day: date) -> Dict[Tuple[int, date], Dict]:
+        D = WebsiteDailyUptime
+        cached = {}
+        for row in db.execute(select(D).where(
+            D.website_id.in_(website_ids),
+            D.day >= first_day,
+            D.day <= last_day
+        )).scalars():
+            metrics = {field: getattr(row, field) for field in METRIC_FIELDS}
+            metrics['website_id'] = row.website_id
+            cached[(row.website_id, row.day)] = metrics
+        return cached
+
+    @staticmethod
+    def _store_cached(rows: List[Dict]):
+        try:
+            with get_write_db() as db:
+                db.bulk_insert_mappings(WebsiteDailyUptime, rows)
+        except IntegrityError:
+            # 并发请求已写入相同日期
+            logger.debug("每日可用时长缓存已存在，跳过写入")
+        except Exception as e:
+            logger.error(f"写入每日可用时长缓存失败: {e}")
+
+    # ------------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _describe(metrics: Dict) -> Dict:
+        observed = metrics['observed_seconds']
+        downtime = metrics['downtime_seconds']
+        uptime = observed - downtime
+        return {
+            'observed_seconds': round(observed, 1),
+            'uptime_seconds': round(uptime, 1),
+            'downtime_seconds': round(downtime, 1),
+            'availability': round(uptime / observed * 100, 4) if observed else None,
+            'failure_count': metrics['failure_count'],
+            'recovery_count': metrics['recovery_count'],
+            'mttr_seconds': round(metrics['repair_seconds'] / metrics['recovery_count'], 1)
+            if metrics['recovery_count'] else None,
+            'mtbf_seconds': round(uptime / metrics['failure_count'], 1) if metrics['failure_count'] else None,
+        }
+
+    @staticmethod
+    def _naive(value: Optional[datetime]) -> Optional[datetime]:
+        return value.replace(tzinfo=None) if value else None
+
+
+# 全局网站可用时长服务实例
+uptime_service = UptimeService()
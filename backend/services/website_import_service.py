@@ -0,0 +1,320 @@
+"""
+网站批量导入服务
+基于 url_key 唯一索引做集合去重，避免逐条按URL全表扫描
+- 已存在的去重键按块批量查询
+- 新网站按块批量插入，SQLite 使用 ON CONFLICT DO NOTHING，MySQL 使用 INSERT IGNORE
+- 大文件在后台线程中流式分块导入，进度记录在 UploadRecord
+"""
+
+import os
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+from sqlalchemy import insert
+
+from ..config import Config
+from ..database import get_db
+from ..models import Website, UploadRecord
+from .file_parser import FileParser
+from ..utils.helpers import make_url_key, normalize_url, get_beijing_time
+from ..utils.validators import is_valid_url
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImportSummary:
+    """批量导入结果"""
+    total_count: int = 0
+    created_count: int = 0
+    failed_urls: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def failed_count(self) -> int:
+        return len(self.failed_urls)
+
+
+class WebsiteImportService:
+    """网站批量导入服务"""
+
+    # 每次 IN 查询/批量插入的行数，远低于 SQLite 的绑定参数上限
+    CHUNK_SIZE = 500
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self._jobs: Dict[int, threading.Thread] = {}
+        self._jobs_lock = threading.Lock()
+
+    def build_website_row(self, url: str, name: str = None, description: str = None,
+                          group_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        构造待插入的网站行
+        网址和域名保留用户输入（缺少协议时补 http://），标准化结果只用于生成去重键，
+        避免中文域名被存为 IDNA 编码后影响展示、搜索和导出
+
+        Args:
+            url: 原始URL
+            name: 网站名称，默认使用原始URL
+            description: 网站描述
+            group_id: 所属分组ID
+
+        Returns:
+            网站行字典，URL无法标准化时返回None
+        """
+        original_url = (url or '').strip()
+        if not normalize_url(original_url):
+            return None
+
+        site_url = original_url if original_url.startswith(('http://', 'https://')) else f'http://{original_url}'
+        domain = urlparse(site_url).netloc.lower() or original_url
+        now = get_beijing_time()
+
+        return {
+            'name': name or original_url,
+            'url': site_url,
+            'url_key': make_url_key(site_url),
+            'domain': domain,
+            'original_url': original_url,
+            'normalized_url': site_url,
+            'description': description or '',
+            'group_id': group_id or None,
+            'is_active': True,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    def find_existing_keys(self, db, keys: Iterable[str]) -> Set[str]:
+        """
+        按块查询已存在的去重键
+
+        Args:
+            db: 数据库会话
+            keys: 待查询的去重键
+
+        Returns:
+            数据库中已存在的去重键集合
+        """
+        keys = [key for key in set(keys) if key]
+        existing: Set[str] = set()
+
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            rows = db.query(Website.url_key).filter(Website.url_key.in_(chunk)).all()
+            existing.update(row[0] for row in rows)
+
+        return existing
+
+    def url_exists(self, db, url: str, exclude_id: Optional[int] = None) -> bool:
+        """
+        检查标准化后的URL是否已被使用
+
+        Args:
+            db: 数据库会话
+            url: 待检查的URL
+            exclude_id: 排除的网站ID（更新网站时使用）
+
+        Returns:
+            是否已存在
+        """
+        key = make_url_key(url)
+        if not key:
+            return False
+
+        query = db.query(Website.id).filter(Website.url_key == key)
+        if exclude_id is not None:
+            query = query.filter(Website.id != exclude_id)
+        return query.first() is not None
+
+    def _insert_statement(self, db):
+        """构造忽略唯一键冲突的插入语句"""
+        dialect = db.get_bind().dialect.name
+
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+            return sqlite_insert(Website.__table__).on_conflict_do_nothing(index_elements=['url_key'])
+
+        if dialect == 'mysql':
+            return insert(Website.__table__).prefix_with('IGNORE')
+
+        return insert(Website.__table__)
+
+    def bulk_create(self, db, rows: Iterable[Dict], summary: ImportSummary = None) -> ImportSummary:
+        """
+        批量创建网站
+
+        Args:
+            db: 数据库会话（调用方负责提交）
+            rows: build_website_row 生成的网站行
+            summary: 累计结果，分块导入时可复用同一对象
+
+        Returns:
+            导入结果
+        """
+        summary = summary or ImportSummary()
+        rows = list(rows)
+        summary.total_count += len(rows)
+
+        # 批次内去重
+        pending: Dict[str, Dict] = {}
+        for row in rows:
+            key = row['url_key']
+            if key in pending:
+                summary.failed_urls.append({'url': row['original_url'], 'reason': '网址重复'})
+            else:
+                pending[key] = row
+
+        existing = self.find_existing_keys(db, pending.keys())
+        new_rows = []
+        for key, row in pending.items():
+            if key in existing:
+                summary.failed_urls.append({'url': row['original_url'], 'reason': '网址已存在'})
+            else:
+                new_rows.append(row)
+
+        stmt = self._insert_statement(db)
+        for start in range(0, len(new_rows), self.chunk_size):
+            chunk = new_rows[start:start + self.chunk_size]
+            result = db.execute(stmt, chunk)
+            inserted = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(chunk)
+            summary.created_count += inserted
+
+            # 并发导入时可能有少量行被唯一索引忽略
+            if inserted < len(chunk):
+                logger.warning(f"批量导入时有 {len(chunk) - inserted} 个网址已被并发写入，已跳过")
+
+        logger.info(f"批量导入网站: 共 {len(rows)} 个，新建 {summary.created_count} 个")
+        return summary
+
+    def start_file_import(self, upload_record_id: int, file_path: str,
+                          group_id: Optional[int] = None) -> bool:
+        """
+        启动后台文件导入任务
+
+        Args:
+            upload_record_id: 上传记录ID，用于记录进度
+            file_path: 已保存的上传文件路径
+            group_id: 导入网站的所属分组ID
+
+        Returns:
+            是否成功启动（同一记录已在导入时返回False）
+        """
+        with self._jobs_lock:
+            running = self._jobs.get(upload_record_id)
+            if running and running.is_alive():
+                return False
+
+            thread = threading.Thread(
+                target=self.run_file_import,
+                args=(upload_record_id, file_path, group_id),
+                name=f'website-import-{upload_record_id}',
+                daemon=True
+            )
+            self._jobs[upload_record_id] = thread
+            thread.start()
+
+        logger.info(f"后台导入任务已启动: 记录 {upload_record_id}, 文件 {file_path}")
+        return True
+
+    def is_import_running(self, upload_record_id: int) -> bool:
+        """检查导入任务是否仍在运行"""
+        with self._jobs_lock:
+            thread = self._jobs.get(upload_record_id)
+            return bool(thread and thread.is_alive())
+
+    def run_file_import(self, upload_record_id: int, file_path: str,
+                        group_id: Optional[int] = None, remove_file: bool = True):
+        """
+        流式分块导入文件中的网站
+        每块独立校验、去重、插入并提交，进度写入 UploadRecord
+
+        Args:
+            upload_record_id: 上传记录ID
+            file_path: 文件路径
+            group_id: 导入网站的所属分组ID
+            remove_file: 导入结束后是否删除文件
+        """
+        chunk_size = Config.IMPORT_CONFIG.get('chunk_size', 1000)
+        parser = FileParser()
+        processed = success = failed = 0
+
+        try:
+            total_rows = parser.count_rows(file_path)
+            self._update_upload_record(
+                upload_record_id,
+                status='processing',
+                total_rows=total_rows,
+                processed_rows=0,
+                success_rows=0,
+                failed_rows=0,
+                error_message=None
+            )
+
+            for urls in parser.iter_url_chunks(file_path, chunk_size=chunk_size):
+                rows = []
+                invalid_count = 0
+
+                for url in urls:
+                    if not url:
+                        continue
+                    row = self.build_website_row(url, group_id=group_id)
+                    if row and is_valid_url(row['url']):
+                        rows.append(row)
+                    else:
+                        invalid_count += 1
+
+                with get_db() as db:
+                    summary = self.bulk_create(db, rows)
+                    processed += len(urls)
+                    success += summary.created_count
+                    failed += invalid_count + summary.failed_count
+
+                    # 进度与本块数据在同一事务中提交
+                    record = db.get(UploadRecord, upload_record_id)
+                    if record:
+                        record.processed_rows = processed
+                        record.success_rows = success
+                        record.failed_rows = failed
+
+            self._update_upload_record(
+                upload_record_id,
+                status='completed',
+                total_rows=processed,
+                processed_at=get_beijing_time()
+            )
+            logger.info(f"后台导入完成: 记录 {upload_record_id}, 处理 {processed} 行, 成功 {success}, 失败 {failed}")
+
+        except Exception as e:
+            logger.error(f"后台导入失败: 记录 {upload_record_id}, 错误: {e}")
+            self._update_upload_record(
+                upload_record_id,
+                status='failed',
+                error_message=str(e),
+                processed_at=get_beijing_time()
+            )
+        finally:
+            if remove_file and os.path.exists(file_path):
+                try:
+                    os.unlink(file_path)
+                except OSError as e:
+                    logger.warning(f"删除导入文件失败: {file_path}, 错误: {e}")
+
+            with self._jobs_lock:
+                self._jobs.pop(upload_record_id, None)
+
+    def _update_upload_record(self, upload_record_id: int, **fields):
+        """更新上传记录状态"""
+        try:
+            with get_db() as db:
+                record = db.get(UploadRecord, upload_record_id)
+                if record:
+                    for key, value in fields.items():
+                        setattr(record, key, value)
+        except Exception as e:
+            logger.error(f"更新上传记录失败: {upload_record_id}, 错误: {e}")
+
+
+# 全局网站导入服务实例
+website_import_service = WebsiteImportService()
@@ -0,0 +1,201 @@
+"""
+网站搜索索引服务
+为网站名称和URL提供子串搜索索引，避免 LIKE '%x%' 全表扫描
+- SQLite: FTS5 trigram 虚拟表，通过触发器与 websites 表保持同步
+- MySQL: FULLTEXT ngram 索引
+- 其他数据库或索引不可用时回退到 LIKE 查询
+"""
+
+import logging
+import threading
+from typing import List, Optional
+
+from sqlalchemy import text, select, or_, table, column, literal_column
+
+from ..database import writer_engine
+from ..models import Website
+
+logger = logging.getLogger(__name__)
+
+
+class WebsiteSearchService:
+    """网站搜索索引服务"""
+
+    SQLITE_FTS_TABLE = 'websites_fts'
+    MYSQL_FULLTEXT_INDEX = 'ft_websites_name_url'
+
+    # trigram 索引要求关键字至少3个字符，ngram 默认分词长度为2
+    SQLITE_MIN_KEYWORD_LENGTH = 3
+    MYSQL_MIN_KEYWORD_LENGTH = 2
+
+    def __init__(self, db_engine=None):
+        """
+        初始化搜索服务
+
+        Args:
+            db_engine: 数据库引擎，默认使用写引擎（建索引和触发器需要写锁）
+        """
+        self.engine = db_engine or writer_engine
+        self.mode: Optional[str] = None  # fts5, mysql_fulltext, like
+        self._lock = threading.Lock()
+
+    def ensure_index(self) -> str:
+        """
+        创建搜索索引（幂等）
+
+        Returns:
+            当前使用的搜索模式
+        """
+        with self._lock:
+            if self.mode is not None:
+                return self.mode
+
+            dialect = self.engine.dialect.name
+            try:
+                if dialect == 'sqlite':
+                    self._ensure_sqlite_index()
+                    self.mode = 'fts5'
+                elif dialect == 'mysql':
+                    self._ensure_mysql_index()
+                    self.mode = 'mysql_fulltext'
+                else:
+                    self.mode = 'like'
+            except Exception as e:
+                logger.warning(f"创建网站搜索索引失败，回退到LIKE查询: {e}")
+                self.mode = 'like'
+
+            logger.info(f"网站搜索索引就绪，模式: {self.mode}")
+            return self.mode
+
+    def _ensure_sqlite_index(self):
+        """创建SQLite FTS5 trigram 索引及同步触发器"""
+        fts = self.SQLITE_FTS_TABLE
+
+        with self.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': fts}
+            ).first() is not None
+
+            conn.execute(text(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    name, url, content='websites', content_rowid='id', tokenize='trigram'
+                )
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON websites BEGIN
+                    INSERT INTO {fts}(rowid, name, url) VALUES (new.id, new.name, new.url);
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON websites BEGIN
+                    INSERT INTO {fts}({fts}, rowid, name, url) VALUES ('delete', old.id, old.name, old.url);
+                END
+            """))
+            conn.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name, url ON websites BEGIN
+                    INSERT INTO {fts}({fts}, rowid, name, url) VALUES ('delete', old.id, old.name, old.url);
+                    INSERT INTO {fts}(rowid, name, url) VALUES (new.id, new.name, new.url);
+                END
+            """))
+
+            if not exists:
+                # 首次创建时为已有网站建立索引
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+                logger.info("已为现有网站建立FTS5搜索索引")
+
+    def _ensure_mysql_index(self):
+        """创建MySQL FULLTEXT ngram 索引"""
+        with self.engine.begin() as conn:
+            exists = conn.execute(
+                text("""
+                    SELECT 1 FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'websites' AND index_name = :name
+                    LIMIT 1
+                """),
+                {'name': self.MYSQL_FULLTEXT_INDEX}
+            ).first() is not None
+
+            if not exists:
+                conn.execute(text(
+                    f"ALTER TABLE websites ADD FULLTEXT INDEX {self.MYSQL_FULLTEXT_INDEX} (name, url) WITH PARSER ngram"
+                ))
+                logger.info("已创建MySQL FULLTEXT ngram 搜索索引")
+
+    def rebuild_index(self) -> bool:
+        """
+        重建搜索索引（用于修复索引与数据不一致）
+
+        Returns:
+            是否重建成功
+        """
+        mode = self.ensure_index()
+        try:
+            if mode == 'fts5':
+                fts = self.SQLITE_FTS_TABLE
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            elif mode == 'mysql_fulltext':
+                with self.engine.begin() as conn:
+                    conn.execute(text("OPTIMIZE TABLE websites"))
+            logger.info(f"网站搜索索引重建完成，模式: {mode}")
+            return True
+        except Exception as e:
+            logger.error(f"重建网站搜索索引失败: {e}")
+            return False
+
+    def website_id_subquery(self, keyword: str):
+        """
+        将搜索关键字解析为候选网站ID子查询
+
+        返回的子查询可直接用于 ``column.in_(...)``，候选集合在数据库内
+        解析，不受绑定参数数量限制。
+
+        Args:
+            keyword: 搜索关键字
+
+        Returns:
+            只包含网站ID一列的 SELECT 语句
+        """
+        keyword = (keyword or '').strip()
+        mode = self.ensure_index()
+
+        if mode == 'fts5' and len(keyword) >= self.SQLITE_MIN_KEYWORD_LENGTH:
+            fts = table(self.SQLITE_FTS_TABLE, column('rowid'))
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            return select(fts.c.rowid).where(
+                literal_column(self.SQLITE_FTS_TABLE).op('MATCH')(phrase)
+            )
+
+        if mode == 'mysql_fulltext' and len(keyword) >= self.MYSQL_MIN_KEYWORD_LENGTH:
+            phrase = '"' + keyword.replace('"', ' ') + '"'
+            return select(Website.id).where(
+                text("MATCH (websites.name, websites.url) AGAINST (:search_phrase IN BOOLEAN MODE)")
+                .bindparams(search_phrase=phrase)
+            )
+
+        # 关键字过短或无可用索引：只扫描网站表，不与检测记录联表
+        return select(Website.id).where(
+            or_(Website.name.contains(keyword), Website.url.contains(keyword))
+        )
+
+    def search_website_ids(self, db, keyword: str, limit: Optional[int] = None) -> List[int]:
+        """
+        搜索匹配关键字的网站ID列表
+
+        Args:
+            db: 数据库会话
+            keyword: 搜索关键字
+            limit: 最大返回数量
+
+        Returns:
+            网站ID列表
+        """
+        stmt = self.website_id_subquery(keyword)
+        if limit:
+            stmt = stmt.limit(limit)
+        return [row[0] for row in db.execute(stmt)]
+
+
+# 全局网站搜索服务实例
+website_search_service = WebsiteSearchService()
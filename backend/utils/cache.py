@@ -1,151 +1,424 @@
 """
-简单缓存工具
+应用缓存工具
 用于减少重复API查询和数据库负载
+- 线程安全：所有操作在同一把锁内完成（Flask 以 threaded=True 运行）
+- LRU 淘汰：基于 OrderedDict，读写和淘汰均为 O(1)
+- 每个条目独立 TTL，按条目数和估算字节数双重限制
+- get_or_set 对同一个键只计算一次，并发请求等待首个计算结果（防缓存击穿）
+- 支持按标签批量失效
+- shared_cache 通过可插拔后端在多个工作进程间共享缓存数据和失效状态（见 cache_backends）
 """
 
-import time
-import hashlib
-import json
-from typing import Any, Optional, Dict
+import functools
 import logging
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from ..config import Config
+from .cache_backends import MISSING, CacheBackend, create_backend
 
 logger = logging.getLogger(__name__)
 
+# 共享缓存失效标签
+TAG_WEBSITES = 'websites'       # 网站、分组及其归属变化
+TAG_TASKS = 'tasks'             # 检测任务、失败监控任务及其网站列表变化
+TAG_DETECTIONS = 'detections'   # 任意检测结果写入（覆盖全部任务和网站的统计使用）
+TAG_API_KEYS = 'api_keys'       # Dify API密钥创建和删除
+
+
+def task_tag(task_id: int) -> str:
+    """单个任务的检测结果和状态变化标签"""
+    return f'task:{task_id}'
+
+
+def website_tag(website_id: int) -> str:
+    """单个网站的检测结果和状态变化标签"""
+    return f'website:{website_id}'
+
+
+def detection_tags(task_ids: Iterable[Optional[int]] = (), website_ids: Iterable[Optional[int]] = ()) -> list:
+    """
+    检测数据缓存条目的标签
+    未指定任务和网站时条目覆盖全部检测数据，使用全局标签
+    """
+    tags = [task_tag(task_id) for task_id in sorted({t for t in task_ids if t is not None})]
+    tags += [website_tag(website_id) for website_id in sorted({w for w in website_ids if w is not None})]
+    return tags or [TAG_DETECTIONS]
+
+
+class _Entry:
+    """缓存条目"""
+    __slots__ = ('value', 'expires_at', 'size', 'tags')
+
+    def __init__(self, value: Any, expires_at: float, size: int, tags: frozenset):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+
+def estimate_size(value: Any) -> int:
+    """估算缓存值占用的字节数（按序列化长度，无法序列化时取对象自身大小）"""
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class KeyLocks:
+    """按键分配的计算锁，同一个键同时只有一个线程执行计算"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 键 -> [锁, 持有或等待的线程数]
+        self._locks: Dict[Hashable, list] = {}
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        with self._lock:
+            slot = self._locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0 and self._locks.get(key) is slot:
+                    del self._locks[key]
+
+
+def make_key(key: Hashable, *args, **kwargs) -> Hashable:
+    """由名称和调用参数生成缓存键（可哈希的元组，无需序列化和摘要）"""
+    if not args and not kwargs:
+        return key
+    cache_key = (key, args, tuple(sorted(kwargs.items()))) if kwargs else (key, args)
+    try:
+        hash(cache_key)
+    except TypeError:
+        # 参数中含列表、字典等不可哈希对象时退化为其字符串表示
+        cache_key = (key, repr(args), repr(sorted(kwargs.items())))
+    return cache_key
+
 
-class SimpleCache:
-    """简单内存缓存实现"""
-    
-    def __init__(self, default_ttl: int = 300, max_size: int = 100):
+class LRUCache:
+    """线程安全的 LRU + TTL 内存缓存"""
+
+    def __init__(self, default_ttl: int = 300, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
         """
         初始化缓存
-        
+
         Args:
             default_ttl: 默认过期时间（秒）
-            max_size: 最大缓存条目数
+            max_entries: 最大缓存条目数
+            max_bytes: 缓存值估算总字节数上限
         """
-        self.cache: Dict[str, Dict] = {}
         self.default_ttl = default_ttl
-        self.max_size = max_size
-    
-    def _generate_key(self, key: str, **kwargs) -> str:
-        """生成缓存键"""
-        if kwargs:
-            # 将参数排序后生成hash
-            params_str = json.dumps(kwargs, sort_keys=True)
-            hash_suffix = hashlib.md5(params_str.encode()).hexdigest()[:8]
-            return f"{key}_{hash_suffix}"
-        return key
-    
-    def get(self, key: str, **kwargs) -> Optional[Any]:
-        """获取缓存值"""
-        cache_key = self._generate_key(key, **kwargs)
-        
-        if cache_key in self.cache:
-            entry = self.cache[cache_key]
-            
-            # 检查是否过期
-            if time.time() < entry['expires_at']:
-                logger.debug(f"缓存命中: {cache_key}")
-                return entry['value']
-            else:
-                # 删除过期条目
-                del self.cache[cache_key]
-                logger.debug(f"缓存过期: {cache_key}")
-        
-        return None
-    
-    def set(self, key: str, value: Any, ttl: Optional[int] = None, **kwargs):
-        """设置缓存值"""
-        cache_key = self._generate_key(key, **kwargs)
-        
-        # 检查缓存大小限制
-        if len(self.cache) >= self.max_size:
-            self._evict_oldest()
-        
-        ttl = ttl or self.default_ttl
-        expires_at = time.time() + ttl
-        
-        self.cache[cache_key] = {
-            'value': value,
-            'expires_at': expires_at,
-            'created_at': time.time()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._key_locks = KeyLocks()
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'oversized': 0,
+            'coalesced': 0,
         }
-        
-        logger.debug(f"缓存设置: {cache_key}, TTL: {ttl}s")
-    
-    def delete(self, key: str, **kwargs):
+
+    @property
+    def max_size(self) -> int:
+        """兼容旧接口：最大条目数"""
+        return self.max_entries
+
+    def get(self, key: Hashable, default: Any = None, **kwargs) -> Any:
+        """获取缓存值，未命中或已过期时返回 default"""
+        value = self._lookup(make_key(key, **kwargs))
+        return default if value is MISSING else value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[int] = None, tags: Iterable[str] = (), **kwargs):
+        """设置缓存值"""
+        self._store(make_key(key, **kwargs), value, ttl, tags)
+
+    def delete(self, key: Hashable, **kwargs):
         """删除缓存值"""
-        cache_key = self._generate_key(key, **kwargs)
-        if cache_key in self.cache:
-            del self.cache[cache_key]
-            logger.debug(f"缓存删除: {cache_key}")
-    
+        cache_key = make_key(key, **kwargs)
+        with self._lock:
+            if self._remove(cache_key):
+                logger.debug(f"缓存删除: {cache_key}")
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[int] = None,
+                   tags: Iterable[str] = ()) -> Any:
+        """
+        获取缓存值，未命中时调用 compute 计算并写入缓存
+
+        同一个键同时只有一个线程执行 compute，其余线程等待后直接读取计算结果
+
+        Args:
+            key: 缓存键（可先用 make_key 加入参数）
+            compute: 计算函数
+            ttl: 过期时间（秒）
+            tags: 失效标签
+        """
+        value = self._lookup(key)
+        if value is not MISSING:
+            return value
+
+        with self._key_locks.hold(key):
+            # 等待期间可能已由其他线程写入
+            value = self._peek(key)
+            if value is not MISSING:
+                with self._lock:
+                    self._stats['coalesced'] += 1
+                return value
+            value = compute()
+            self._store(key, value, ttl, tags)
+            return value
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """删除带有任一标签的全部条目，返回删除数量"""
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for cache_key in list(self._tags.get(tag, ())):
+                    if self._remove(cache_key):
+                        removed += 1
+            self._stats['invalidations'] += removed
+        if removed:
+            logger.debug(f"按标签失效缓存: {', '.join(tags)}, 条目数: {removed}")
+        return removed
+
     def clear(self):
         """清空缓存"""
-        self.cache.clear()
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
         logger.info("缓存已清空")
-    
-    def _evict_oldest(self):
-        """删除最旧的缓存条目"""
-        if not self.cache:
-            return
-        
-        oldest_key = min(self.cache.keys(), 
-                        key=lambda k: self.cache[k]['created_at'])
-        del self.cache[oldest_key]
-        logger.debug(f"淘汰最旧缓存: {oldest_key}")
-    
-    def cleanup_expired(self):
-        """清理过期缓存"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, entry in self.cache.items()
-            if current_time >= entry['expires_at']
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
-        
+
+    def cleanup_expired(self) -> int:
+        """清理过期缓存，返回清理数量"""
+        now = time.time()
+        with self._lock:
+            expired_keys = [key for key, entry in self._entries.items() if now >= entry.expires_at]
+            for key in expired_keys:
+                self._remove(key)
+            self._stats['expirations'] += len(expired_keys)
+
         if expired_keys:
             logger.debug(f"清理 {len(expired_keys)} 个过期缓存条目")
-    
+        return len(expired_keys)
+
     def get_stats(self) -> Dict:
         """获取缓存统计信息"""
-        current_time = time.time()
-        active_count = sum(
-            1 for entry in self.cache.values()
-            if current_time < entry['expires_at']
-        )
-        
-        return {
-            'total_entries': len(self.cache),
+        now = time.time()
+        with self._lock:
+            active_count = sum(1 for entry in self._entries.values() if now < entry.expires_at)
+            stats = dict(self._stats)
+            total_entries = len(self._entries)
+            total_bytes = self._bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'total_entries': total_entries,
             'active_entries': active_count,
-            'expired_entries': len(self.cache) - active_count,
-            'max_size': self.max_size,
-            'hit_rate': getattr(self, '_hit_rate', 0.0)
-        }
+            'expired_entries': total_entries - active_count,
+            'max_size': self.max_entries,
+            'bytes': total_bytes,
+            'max_bytes': self.max_bytes,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+        })
+        return stats
+
+    def _lookup(self, cache_key: Hashable) -> Any:
+        """读取条目并计入命中/未命中统计"""
+        with self._lock:
+            value = self._peek(cache_key)
+            self._stats['hits' if value is not MISSING else 'misses'] += 1
+            return value
+
+    def _peek(self, cache_key: Hashable) -> Any:
+        """读取条目（不计统计），命中时移到 LRU 队尾，过期时删除"""
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return MISSING
+            if time.time() >= entry.expires_at:
+                self._remove(cache_key)
+                self._stats['expirations'] += 1
+                return MISSING
+            self._entries.move_to_end(cache_key)
+            return entry.value
+
+    def _store(self, cache_key: Hashable, value: Any, ttl: Optional[int], tags: Iterable[str]):
+        size = estimate_size(value)
+        ttl = ttl or self.default_ttl
+        tags = frozenset(tags)
+
+        with self._lock:
+            self._remove(cache_key)
+            if size > self.max_bytes:
+                # 单个值超过容量上限时不缓存
+                self._stats['oversized'] += 1
+                return
+
+            self._entries[cache_key] = _Entry(value, time.time() + ttl, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(cache_key)
+            self._stats['sets'] += 1
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats['evictions'] += 1
+
+        logger.debug(f"缓存设置: {cache_key}, TTL: {ttl}s")
+
+    def _remove(self, cache_key: Hashable) -> bool:
+        """删除条目并维护字节数和标签索引（调用方持有锁）"""
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+
+class SharedCache:
+    """
+    跨进程共享缓存
+    数据存放在共享后端，缓存键包含所属标签的当前代数，invalidate_tags 把代数加1后
+    所有进程立即改用新键，计算期间发生的失效也不会让旧结果被后续请求读到
+    """
+
+    def __init__(self, backend: CacheBackend, default_ttl: int = 300):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._key_locks = KeyLocks()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'coalesced': 0, 'invalidations': 0}
 
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _full_key(self, key: Hashable, tags: Iterable[str]) -> str:
+        generations = self.backend.generations(sorted(tags)) if tags else {}
+        return repr((key, sorted(generations.items())))
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any], ttl: Optional[int] = None,
+                   tags: Iterable[str] = ()) -> Any:
+        """
+        获取缓存值，未命中时调用 compute 计算并写入共享后端（进程内同一个键只计算一次）
+
+        Args:
+            key: 缓存键（可先用 make_key 加入参数）
+            compute: 计算函数
+            ttl: 过期时间（秒）
+            tags: 失效标签
+        """
+        full_key = self._full_key(key, tuple(tags))
+        value = self.backend.get(full_key)
+        if value is not MISSING:
+            self._count('hits')
+            return value
+        self._count('misses')
+
+        with self._key_locks.hold(full_key):
+            value = self.backend.get(full_key)
+            if value is not MISSING:
+                self._count('coalesced')
+                return value
+            value = compute()
+            self.backend.set(full_key, value, ttl or self.default_ttl)
+            self._count('sets')
+            return value
+
+    def version(self, tags: Iterable[str]) -> str:
+        """标签对应数据的当前版本（各标签代数），数据写入使代数递增后版本随之改变"""
+        generations = self.backend.generations(sorted(set(tags)))
+        return f"{self.backend.epoch}:" + ','.join(f"{tag}={generation}" for tag, generation in generations.items())
+
+    def invalidate_tags(self, *tags: str):
+        """使带有任一标签的条目在所有进程中失效"""
+        if not tags:
+            return
+        self.backend.bump(tags)
+        self._count('invalidations')
+        logger.debug(f"共享缓存按标签失效: {', '.join(tags)}")
+
+    def clear(self):
+        """清空共享缓存"""
+        self.backend.clear()
+
+    def get_stats(self) -> Dict:
+        """获取统计信息（计数为当前进程）"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['backend'] = self.backend.get_stats()
+        return stats
+
+
+# 兼容旧名称
+SimpleCache = LRUCache
 
 # 全局缓存实例
-app_cache = SimpleCache(default_ttl=300, max_size=50)  # 5分钟默认TTL，最多50个条目
+_cache_config = getattr(Config, 'CACHE_CONFIG', {})
+app_cache = LRUCache(
+    default_ttl=_cache_config.get('default_ttl', 300),
+    max_entries=_cache_config.get('max_entries', 1000),
+    max_bytes=_cache_config.get('max_bytes', 64 * 1024 * 1024),
+)
+
+# 跨进程共享缓存实例（统计、分组等接口使用）
+shared_cache = SharedCache(
+    create_backend(_cache_config, app_cache),
+    default_ttl=_cache_config.get('default_ttl', 300),
+)
+
+
+def invalidate_detections(task_ids: Iterable[Optional[int]] = (), website_ids: Iterable[Optional[int]] = ()):
+    """检测数据变化后失效涉及的任务、网站以及覆盖全部检测数据的缓存条目"""
+    tags = set(detection_tags(task_ids, website_ids))
+    tags.add(TAG_DETECTIONS)
+    shared_cache.invalidate_tags(*sorted(tags))
+
+
+def invalidate_detection_rows(rows: List[Dict], record_ids: List[int] = None):
+    """检测结果写入缓冲的 after_commit 监听器：按本批记录涉及的任务和网站失效缓存"""
+    invalidate_detections(
+        {row.get('task_id') for row in rows},
+        {row.get('website_id') for row in rows}
+    )
 
 
-def cached(key: str, ttl: int = 300):
-    """缓存装饰器"""
+def cached(key: str, ttl: int = 300, tags: Iterable[str] = ()):
+    """缓存装饰器（缓存键包含位置参数和关键字参数）"""
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # 生成缓存键（包含函数参数）
-            cache_key = f"{key}_{func.__name__}"
-            
-            # 尝试从缓存获取
-            cached_result = app_cache.get(cache_key, **kwargs)
-            if cached_result is not None:
-                return cached_result
-            
-            # 执行函数并缓存结果
-            result = func(*args, **kwargs)
-            app_cache.set(cache_key, result, ttl, **kwargs)
-            
-            return result
+            cache_key = make_key(f"{key}_{func.__name__}", *args, **kwargs)
+            return app_cache.get_or_set(cache_key, lambda: func(*args, **kwargs), ttl, tags)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,336 @@
+"""
+共享缓存存储后端
+多个 WSGI 工作进程通过同一个后端共享缓存数据和失效状态：
+- memory: 进程内 LRU（单进程部署，默认）
+- sqlite: 本机共享的 SQLite 文件（WAL 模式，多进程并发读写）
+- redis: Redis 协议服务（需要安装 redis 包）
+
+失效采用代计数（generation）：缓存键包含所属标签的当前代数，失效时把标签代数加1，
+所有进程随后生成的键都不同，旧条目不再命中并随 TTL 过期
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# redis 为可选依赖
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    redis = None
+    HAS_REDIS = False
+
+# 缓存未命中标记（缓存值本身可以是 None）
+MISSING = object()
+
+
+class CacheBackend:
+    """共享缓存后端接口"""
+
+    name = 'base'
+
+    # 代数的起始标识：后端数据重建（进程重启、文件删除）后代数从0重新计数，
+    # 用该标识区分前后两轮，避免相同代数对应不同数据
+    epoch = ''
+
+    def get(self, key: str) -> Any:
+        """读取缓存值，未命中时返回 MISSING"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int):
+        """写入缓存值"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """删除缓存值"""
+        raise NotImplementedError
+
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        """读取各标签的当前代数（未失效过的标签为0）"""
+        raise NotImplementedError
+
+    def bump(self, tags: Iterable[str]):
+        """各标签代数加1，使带有这些标签的已有条目全部失效"""
+        raise NotImplementedError
+
+    def clear(self):
+        """清空缓存数据（保留代数）"""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        """后端统计信息"""
+        return {'backend': self.name}
+
+
+class MemoryBackend(CacheBackend):
+    """进程内后端（只在当前进程内共享）"""
+
+    name = 'memory'
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.epoch = uuid.uuid4().hex
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        return self.cache.get(key, MISSING)
+
+    def set(self, key: str, value: Any, ttl: int):
+        self.cache.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.cache.delete(key)
+
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        with self._lock:
+            return {tag: self._generations.get(tag, 0) for tag in tags}
+
+    def bump(self, tags: Iterable[str]):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def clear(self):
+        self.cache.clear()
+
+    def get_stats(self) -> Dict:
+        stats = self.cache.get_stats()
+        stats['backend'] = self.name
+        return stats
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    SQLite 文件后端（同一台机器上的多个进程共享）
+    每个线程使用独立连接，WAL 模式下读写互不阻塞；缓存值以 pickle 存储
+    """
+
+    name = 'sqlite'
+
+    # 每写入多少次清理一次过期条目
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._errors = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_generations ("
+                "tag TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,)
+            )
+            self.epoch = conn.execute("SELECT value FROM cache_meta WHERE name = 'epoch'").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _failed(self, action: str, error: Exception):
+        # 缓存故障不影响请求，按未命中处理
+        self._errors += 1
+        logger.warning(f"共享缓存{action}失败: {error}")
+
+    def get(self, key: str) -> Any:
+        try:
+            row = self._connect().execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+            return pickle.loads(row[0]) if row else MISSING
+        except (sqlite3.Error, pickle.PickleError, EOFError) as e:
+            self._failed('读取', e)
+            return MISSING
+
+    def set(self, key: str, value: Any, ttl: int):
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, sqlite3.Binary(data), time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._purge(conn)
+        except (sqlite3.Error, pickle.PickleError, TypeError, AttributeError) as e:
+            self._failed('写入', e)
+
+    def _purge(self, conn: sqlite3.Connection):
+        """删除过期条目，超过条目上限时删除最早过期的条目"""
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            "SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def delete(self, key: str):
+        try:
+            self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self._failed('删除', e)
+
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        result = dict.fromkeys(tags, 0)
+        if not tags:
+            return result
+        try:
+            placeholders = ', '.join('?' * len(tags))
+            result.update(self._connect().execute(
+                f"SELECT tag, generation FROM cache_generations WHERE tag IN ({placeholders})", tags
+            ).fetchall())
+        except sqlite3.Error as e:
+            self._failed('读取代数', e)
+        return result
+
+    def bump(self, tags: Iterable[str]):
+        try:
+            self._connect().executemany(
+                "INSERT INTO cache_generations (tag, generation) VALUES (?, 1) "
+                "ON CONFLICT(tag) DO UPDATE SET generation = generation + 1",
+                [(tag,) for tag in tags]
+            )
+        except sqlite3.Error as e:
+            self._failed('失效', e)
+
+    def clear(self):
+        try:
+            self._connect().execute("DELETE FROM cache_entries")
+        except sqlite3.Error as e:
+            self._failed('清空', e)
+
+    def get_stats(self) -> Dict:
+        stats = {'backend': self.name, 'path': self.path, 'errors': self._errors}
+        try:
+            stats['total_entries'], stats['bytes'] = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries WHERE expires_at > ?",
+                (time.time(),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._failed('统计', e)
+        return stats
+
+
+class RedisBackend(CacheBackend):
+    """Redis 协议后端（多台机器共享，兼容任何实现 GET/SET/DEL/INCR/MGET 的服务）"""
+
+    name = 'redis'
+
+    def __init__(self, url: str, prefix: str = 'webmonitor:cache:'):
+        if not HAS_REDIS:
+            raise RuntimeError('使用 redis 缓存后端需要安装 redis 包')
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.data_prefix = f"{prefix}data:"
+        self.generation_prefix = f"{prefix}gen:"
+        self._errors = 0
+
+        epoch_key = f"{prefix}epoch"
+        self.client.set(epoch_key, uuid.uuid4().hex, nx=True)
+        self.epoch = self.client.get(epoch_key).decode()
+
+    def _failed(self, action: str, error: Exception):
+        self._errors += 1
+        logger.warning(f"共享缓存{action}失败: {error}")
+
+    def get(self, key: str) -> Any:
+        try:
+            data = self.client.get(self.data_prefix + key)
+            return pickle.loads(data) if data is not None else MISSING
+        except (redis.RedisError, pickle.PickleError, EOFError) as e:
+            self._failed('读取', e)
+            return MISSING
+
+    def set(self, key: str, value: Any, ttl: int):
+        try:
+            self.client.set(self.data_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=max(int(ttl), 1))
+        except (redis.RedisError, pickle.PickleError, TypeError, AttributeError) as e:
+            self._failed('写入', e)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(self.data_prefix + key)
+        except redis.RedisError as e:
+            self._failed('删除', e)
+
+    def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = list(tags)
+        result = dict.fromkeys(tags, 0)
+        if not tags:
+            return result
+        try:
+            values = self.client.mget([self.generation_prefix + tag for tag in tags])
+            result.update((tag, int(value)) for tag, value in zip(tags, values) if value is not None)
+        except redis.RedisError as e:
+            self._failed('读取代数', e)
+        return result
+
+    def bump(self, tags: Iterable[str]):
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for tag in tags:
+                pipeline.incr(self.generation_prefix + tag)
+            pipeline.execute()
+        except redis.RedisError as e:
+            self._failed('失效', e)
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(f"{self.data_prefix}*"))
+            for start in range(0, len(keys), 500):
+                self.client.delete(*keys[start:start + 500])
+        except redis.RedisError as e:
+            self._failed('清空', e)
+
+    def get_stats(self) -> Dict:
+        return {'backend': self.name, 'errors': self._errors}
+
+
+def create_backend(config: Dict, local_cache) -> CacheBackend:
+    """
+    按配置创建共享缓存后端
+
+    shared_backend 为 auto 时：配置了 redis_url 且安装了 redis 包则使用 redis，否则使用进程内缓存
+    """
+    backend = config.get('shared_backend', 'auto')
+    if backend == 'auto':
+        backend = 'redis' if config.get('redis_url') and HAS_REDIS else 'memory'
+
+    try:
+        if backend == 'redis':
+            return RedisBackend(config['redis_url'])
+        if backend == 'sqlite':
+            return SQLiteBackend(config['sqlite_path'], config.get('shared_max_entries', 10000))
+    except Exception as e:
+        logger.warning(f"共享缓存后端 {backend} 初始化失败，改用进程内缓存: {e}")
+    return MemoryBackend(local_cache)
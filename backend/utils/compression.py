@@ -0,0 +1,172 @@
+"""
+HTTP 响应压缩
+无 nginx 前置的部署（如仅后端的 docker-compose）由应用自行压缩响应：
+- 按 Accept-Encoding 协商，安装 brotli 时优先使用 br，否则使用 gzip
+- 只压缩白名单内的内容类型，普通响应小于阈值时不压缩
+- 流式响应逐块压缩并同步刷新，客户端可边接收边解压
+- 文件下载（send_file 直通）、分段响应和已编码响应保持原样
+"""
+
+import logging
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    brotli = None
+    HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': True,
+    'min_size': 1024,
+    'gzip_level': 6,
+    'brotli_quality': 4,
+    'mimetypes': (
+        'application/json',
+        'application/x-ndjson',
+        'application/javascript',
+        'text/html',
+        'text/css',
+        'text/plain',
+        'text/csv',
+        'text/xml',
+        'application/xml',
+        'image/svg+xml',
+    ),
+}
+
+
+class _GzipStream:
+    """gzip 增量压缩器"""
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    """brotli 增量压缩器"""
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compress_bytes(data: bytes, encoding: str, config: Dict) -> bytes:
+    """一次性压缩完整响应体"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['brotli_quality'])
+    return _gzip_compress(data, config['gzip_level'])
+
+
+def _gzip_compress(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, config: Dict) -> Iterator[bytes]:
+    """逐块压缩流式响应，每块同步刷新"""
+    if encoding == 'br':
+        stream = _BrotliStream(config['brotli_quality'])
+    else:
+        stream = _GzipStream(config['gzip_level'])
+
+    try:
+        for chunk in chunks:
+            if chunk:
+                data = stream.compress(chunk)
+                if data:
+                    yield data
+        yield stream.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def choose_encoding() -> Optional[str]:
+    """按请求的 Accept-Encoding 选择压缩算法"""
+    accept = request.accept_encodings
+    if HAS_BROTLI and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def _should_compress(response: Response, config: Dict) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in config['mimetypes']:
+        return False
+    if request.method == 'HEAD':
+        return False
+    if not response.is_streamed and (response.content_length or 0) < config['min_size']:
+        return False
+    return True
+
+
+def compress_response(response: Response, config: Dict) -> Response:
+    """压缩响应（after_request 钩子）"""
+    response.vary.add('Accept-Encoding')
+    if not _should_compress(response, config):
+        return response
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress_bytes(response.get_data(), encoding, config))
+
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的表示与原文不再逐字节相同，ETag 改为弱校验
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def setup_compression(app: Flask, config: Optional[Dict] = None):
+    """
+    注册响应压缩
+
+    Args:
+        app: Flask 应用
+        config: 压缩配置，缺省项使用 DEFAULT_CONFIG
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    config['mimetypes'] = frozenset(config['mimetypes'])
+    if not config['enabled']:
+        logger.info("响应压缩未启用")
+        return
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, config)
+
+    logger.info(
+        f"响应压缩已启用: {'br, ' if HAS_BROTLI else ''}gzip, "
+        f"阈值 {config['min_size']} 字节, gzip级别 {config['gzip_level']}"
+    )
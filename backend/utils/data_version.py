@@ -0,0 +1,79 @@
+"""
+数据版本跟踪
+以共享缓存的标签代数作为数据版本号，供缓存失效和 ETag 使用：
+- 检测结果和状态变化：写入缓冲提交及状态变化写入时按任务和网站递增（见 cache.invalidate_detections）
+- 网站、分组、任务：ORM 会话提交时按本事务修改过的表自动递增，无需在每处修改代码中手动失效
+"""
+
+import logging
+from typing import Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import TAG_TASKS, TAG_WEBSITES, shared_cache
+
+logger = logging.getLogger(__name__)
+
+# 表名 -> 版本标签
+TABLE_TAGS = {
+    'websites': TAG_WEBSITES,
+    'website_groups': TAG_WEBSITES,
+    'detection_tasks': TAG_TASKS,
+    'task_websites': TAG_TASKS,
+    'failed_site_monitor_tasks': TAG_TASKS,
+    'failed_site_monitor_websites': TAG_TASKS,
+}
+
+_registered = False
+
+
+def _pending_tags(session: Session) -> Set[str]:
+    return session.info.setdefault('data_version_tags', set())
+
+
+def _table_tag(table) -> Optional[str]:
+    return TABLE_TAGS.get(getattr(table, 'name', None))
+
+
+def _after_flush(session: Session, flush_context):
+    """记录本次刷新中新增、修改、删除的对象所属的表"""
+    tags = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tag = _table_tag(getattr(obj, '__table__', None))
+        if tag:
+            tags.add(tag)
+    if tags:
+        _pending_tags(session).update(tags)
+
+
+def _do_orm_execute(orm_execute_state):
+    """记录通过 session.execute 执行的批量 INSERT/UPDATE/DELETE 所修改的表"""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    tag = _table_tag(getattr(orm_execute_state.statement, 'table', None))
+    if tag:
+        _pending_tags(orm_execute_state.session).add(tag)
+
+
+def _after_commit(session: Session):
+    tags = session.info.pop('data_version_tags', None)
+    if tags:
+        shared_cache.invalidate_tags(*sorted(tags))
+
+
+def _after_rollback(session: Session):
+    session.info.pop('data_version_tags', None)
+
+
+def register_session_hooks():
+    """为所有 ORM 会话注册数据版本跟踪（重复调用无副作用）"""
+    global _registered
+    if _registered:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _registered = True
+    logger.info("数据版本跟踪已启用")
@@ -63,6 +63,21 @@ def utc_to_beijing(dt: datetime) -> datetime:
     return dt.astimezone(BEIJING_TZ)
 
 
+def to_beijing_naive(dt: datetime) -> datetime:
+    """
+    将带时区的时间转换为北京时间并去掉时区信息，用于与数据库中不带时区的时间字段比较
+    
+    Args:
+        dt: 时间，不带时区时视为北京时间原样返回
+        
+    Returns:
+        不带时区的北京时间
+    """
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(BEIJING_TZ).replace(tzinfo=None)
+
+
 def normalize_url(url: str) -> str:
     """
     标准化URL格式 - 增强版
@@ -124,6 +139,27 @@ def normalize_url(url: str) -> str:
         return url
 
 
+def make_url_key(url: str) -> Optional[str]:
+    """
+    生成网址去重键
+    对标准化后的URL取SHA-256，作为网站表的唯一索引列
+
+    Args:
+        url: 原始URL
+
+    Returns:
+        64位十六进制哈希，URL为空时返回None
+    """
+    if not url:
+        return None
+
+    normalized = normalize_url(url) or url.strip()
+    if not normalized:
+        return None
+
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
 def extract_domain(url: str) -> str:
     """
     从URL中提取域名
@@ -289,21 +325,33 @@ def get_file_size_human(size_bytes: int) -> str:
     return f"{size_bytes:.2f}{size_names[i]}"
 
 
-def detect_file_encoding(file_path: str) -> str:
+def detect_file_encoding(file_path: str, sample_size: int = 64 * 1024) -> str:
     """
     检测文件编码
+    只读取文件开头的样本，避免大文件整体读入内存
     
     Args:
         file_path: 文件路径
+        sample_size: 采样字节数
         
     Returns:
         文件编码
     """
     try:
         with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            result = chardet.detect(raw_data)
-            return result.get('encoding', 'utf-8')
+            raw_data = f.read(sample_size)
+        
+        if raw_data.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        
+        encoding = (chardet.detect(raw_data).get('encoding') or 'utf-8').lower()
+        
+        # 样本为纯ASCII时后续内容可能含中文，按UTF-8处理；GB2312/GBK 统一放宽为 GB18030
+        if encoding == 'ascii':
+            return 'utf-8'
+        if encoding in ('gb2312', 'gbk'):
+            return 'gb18030'
+        return encoding
     except Exception as e:
         logger.warning(f"文件编码检测失败: {file_path}, 错误: {e}")
         return 'utf-8'
@@ -0,0 +1,57 @@
+"""
+HTTP 条件请求
+GET 接口按数据版本生成 ETag，请求携带的 If-None-Match 与当前版本一致时
+在执行任何查询和序列化之前直接返回 304 Not Modified
+"""
+
+import functools
+import hashlib
+import time
+from typing import Callable, Iterable, Union
+
+from flask import Response, make_response, request
+
+from .cache import shared_cache
+
+TagSpec = Union[Iterable[str], Callable[..., Iterable[str]]]
+
+# 默认版本有效期（秒）：数据未变化时，按时间窗口统计的接口也至少每隔这么久重新计算一次
+DEFAULT_MAX_AGE = 300
+
+
+def compute_etag(tags: Iterable[str], max_age: int = DEFAULT_MAX_AGE) -> str:
+    """由请求路径、查询参数、数据版本和时间窗口生成 ETag"""
+    window = int(time.time() // max_age) if max_age else 0
+    source = f"{request.full_path}|{shared_cache.version(tags)}|{window}"
+    return hashlib.blake2b(source.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def conditional_get(tags: TagSpec, max_age: int = DEFAULT_MAX_AGE):
+    """
+    ETag 条件请求装饰器
+
+    Args:
+        tags: 接口数据依赖的版本标签，或接收视图参数并返回标签的函数
+        max_age: 版本有效期（秒），0 表示只随数据版本变化
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            etag = compute_etag(tags(**kwargs) if callable(tags) else tags, max_age)
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # 弱校验：压缩编码不同但内容相同的响应共用同一个 ETag
+            response.set_etag(etag, weak=True)
+            # 浏览器可保存响应，但每次使用前都需带 If-None-Match 重新验证
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
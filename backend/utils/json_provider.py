@@ -0,0 +1,173 @@
+"""
+JSON 序列化
+- FastJSONProvider：安装 orjson 时用其序列化（原生支持 datetime），否则回退到标准库
+- 日期时间统一输出 ISO 8601 格式，与模型 to_dict 中的 isoformat() 一致
+- iter_json_array / stream_json_response：按行增量序列化大结果集，不在内存中拼装完整列表
+"""
+
+import json
+import logging
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from flask import Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+logger = logging.getLogger(__name__)
+
+# 流式响应每次输出的字节数（累积多行后一起发送，减少分块数量）
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# 信封中占位的流式数组，序列化后按此标记切分为前缀和后缀
+_STREAM_MARKER = '__json_stream_marker__'
+
+
+def _default(obj: Any) -> Any:
+    """序列化标准类型以外的对象"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """
+    序列化为 UTF-8 字节
+
+    Args:
+        obj: 待序列化对象
+        sort_keys: 是否按键排序
+        indent: 是否缩进输出（调试用）
+    """
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=_default, option=option)
+        except TypeError:
+            # 超出 64 位的整数等 orjson 不支持的值，回退到标准库
+            pass
+
+    return json.dumps(
+        obj,
+        default=_default,
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+        indent=2 if indent else None,
+        separators=None if indent else (',', ':')
+    ).encode('utf-8')
+
+
+def loads(data) -> Any:
+    """反序列化 JSON 字符串或字节"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON 提供者，jsonify 和 request.get_json 均经过此类"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        if HAS_ORJSON and not kwargs.get('cls'):
+            return dumps_bytes(obj, kwargs['sort_keys'], bool(kwargs.get('indent'))).decode('utf-8')
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', False)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # 直接输出字节，省去一次 str 编码
+        body = dumps_bytes(obj, self.sort_keys, indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def iter_json_array(items: Iterable[Any],
+                    envelope: Optional[Dict] = None,
+                    key: Optional[str] = None,
+                    serialize: Optional[Callable[[Any], Any]] = None,
+                    chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    增量序列化 JSON 数组
+
+    Args:
+        items: 数组元素，通常为 yield_per 查询游标
+        envelope: 外层响应对象，数组放在 envelope['data'][key]；为空时只输出数组本身
+        key: 数组在 envelope['data'] 中的键名
+        serialize: 元素转换函数（如 ORM 对象转字典）
+        chunk_bytes: 累积多少字节后输出一次
+
+    Yields:
+        UTF-8 字节块
+    """
+    prefix, suffix = b'', b''
+    if envelope is not None:
+        data = dict(envelope.get('data') or {})
+        data[key] = _STREAM_MARKER
+        head = dumps_bytes({**envelope, 'data': data})
+        prefix, _, suffix = head.partition(dumps_bytes(_STREAM_MARKER))
+
+    buffer = bytearray(prefix)
+    buffer += b'['
+    first = True
+    for item in items:
+        if not first:
+            buffer += b','
+        buffer += dumps_bytes(serialize(item) if serialize else item)
+        first = False
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+
+    buffer += b']'
+    buffer += suffix
+    yield bytes(buffer)
+
+
+def stream_json_response(items: Iterable[Any],
+                         envelope: Optional[Dict] = None,
+                         key: Optional[str] = None,
+                         serialize: Optional[Callable[[Any], Any]] = None,
+                         status: int = 200) -> Response:
+    """
+    流式 JSON 响应
+
+    响应头发送后出错无法再改变状态码，因此 items 中的错误只记录日志并截断输出；
+    需要数据库会话的生成器应在生成器内部打开会话，以便覆盖整个输出过程。
+    """
+    def generate():
+        try:
+            yield from iter_json_array(items, envelope, key, serialize)
+        except Exception as e:
+            logger.error(f"流式输出JSON失败: {e}")
+            raise
+
+    return Response(stream_with_context(generate()), status=status, mimetype='application/json')
@@ -0,0 +1,149 @@
+"""
+可合并的响应时间分位数草图
+按对数分桶记录响应时间（相对误差约1%），同一网站不同时段的草图可直接合并后求分位数，
+序列化为紧凑的二进制，便于存入数据库
+"""
+
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+# 序列化格式版本
+SKETCH_VERSION = 1
+
+# 头部：版本、零桶计数、最小值、最大值、桶数
+_HEADER = struct.Struct('<BIddH')
+# 桶：桶序号、计数
+_BUCKET = struct.Struct('<hI')
+
+
+class LatencySketch:
+    """响应时间分位数草图（对数分桶）"""
+
+    # 相对误差
+    RELATIVE_ACCURACY = 0.01
+    # 小于等于该值（秒）的响应时间计入零桶
+    MIN_VALUE = 1e-4
+
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    @property
+    def count(self) -> int:
+        """记录的响应时间个数"""
+        return self.zero_count + sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1):
+        """
+        记录响应时间
+
+        Args:
+            value: 响应时间（秒）
+            count: 次数（合并记录代表多次检测）
+        """
+        if value is None or count <= 0:
+            return
+        value = max(float(value), 0.0)
+
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = int(math.ceil(math.log(value) / self._LOG_GAMMA))
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def update(self, values: Iterable[float]):
+        """批量记录响应时间"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'LatencySketch') -> 'LatencySketch':
+        """合并另一个草图（原地修改并返回自身）"""
+        if other is None or not other.count:
+            return self
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        估算分位数
+
+        Args:
+            q: 分位点（0~1）
+
+        Returns:
+            响应时间估计值（秒），没有数据时返回None
+        """
+        total = self.count
+        if not total:
+            return None
+
+        rank = max(0.0, min(q, 1.0)) * (total - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return self.min if self.min is not None and self.min <= self.MIN_VALUE else 0.0
+
+        value = self.max
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                value = 2 * self.GAMMA ** index / (self.GAMMA + 1)
+                break
+        return min(max(value, self.min), self.max)
+
+    def quantiles(self, qs: Iterable[float] = (0.5, 0.9, 0.99)) -> Dict[str, Optional[float]]:
+        """按 p50/p90/p99 形式返回多个分位数"""
+        return {f"p{round(q * 100):g}": self.quantile(q) for q in qs}
+
+    def to_bytes(self) -> bytes:
+        """序列化为二进制"""
+        parts = [_HEADER.pack(
+            SKETCH_VERSION,
+            self.zero_count,
+            self.min if self.min is not None else math.nan,
+            self.max if self.max is not None else math.nan,
+            len(self.buckets),
+        )]
+        parts.extend(_BUCKET.pack(index, count) for index, count in sorted(self.buckets.items()))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> 'LatencySketch':
+        """
+        从二进制还原草图
+
+        Args:
+            data: to_bytes 的结果，为空时返回空草图
+
+        Raises:
+            ValueError: 数据格式不支持
+        """
+        sketch = cls()
+        if not data:
+            return sketch
+
+        version, zero_count, minimum, maximum, size = _HEADER.unpack_from(data, 0)
+        if version != SKETCH_VERSION:
+            raise ValueError(f"不支持的草图版本: {version}")
+
+        sketch.zero_count = zero_count
+        sketch.min = None if math.isnan(minimum) else minimum
+        sketch.max = None if math.isnan(maximum) else maximum
+        offset = _HEADER.size
+        for _ in range(size):
+            index, count = _BUCKET.unpack_from(data, offset)
+            sketch.buckets[index] = count
+            offset += _BUCKET.size
+        return sketch
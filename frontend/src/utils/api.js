@@ -298,9 +298,15 @@ export const resultApi = {
   // 获取统计信息
   getStats: (params) => api.get('/results/statistics', { params }),
   
-  // 导出结果
+  // 导出结果（创建后台导出任务）
   export: (data) => api.post('/results/export', data),
   
+  // 查询导出任务进度
+  getExportJob: (jobId) => api.get(`/results/export/jobs/${jobId}`, { noCache: true }),
+  
+  // 取消导出任务
+  cancelExportJob: (jobId) => api.post(`/results/export/jobs/${jobId}/cancel`),
+  
   // 清除数据（默认清除所有数据）
   clearAllData: () => api.delete('/results/clear-old-data'),
   